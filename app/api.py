@@ -4,6 +4,9 @@ FastAPI Application - API Layer cho RAG ChatBot
 Endpoints:
     - GET  /health     : Health check
     - POST /chat       : Main chat endpoint
+    - POST /chat/stream : Chat với streaming (Server-Sent Events)
+    - POST /chat/batch : Nhiều câu hỏi 1 lần (NDJSON)
+    - GET  /chunks/{point_id} : Nội dung đầy đủ của 1 chunk (nguồn trích dẫn)
     - GET  /stats      : Thống kê hệ thống
     - DELETE /session/{session_id} : Xóa session
     - GET  /sessions   : Liệt kê sessions
@@ -18,18 +21,26 @@ Auth Endpoints:
 
 import os
 import json
+import hashlib
+import asyncio
 import traceback
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from app.database import db, user_repo
 
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from app.models import (
     ChatRequest,
     ChatResponse,
+    ChatStreamDone,
+    ChatBatchRequest,
+    ChatBatchItem,
+    ChatBatchDone,
+    ChunkResponse,
+    IndexJobResponse,
     Source,
     Metadata,
     ChatLog,
@@ -46,6 +57,7 @@ from app.models import (
 )
 from app.rag_engine import rag_engine
 from app.memory import memory
+from app.index_jobs import index_jobs, JobConflictError
 from app.config import settings, ensure_directories
 from app.auth import (
     hash_password,
@@ -177,7 +189,11 @@ async def health_check():
         qdrant_connected=rag_health.get("db_connected", False),
         db_connected=True,  # MySQL connection (vì đã khởi tạo thành công)
         embedding_model=rag_health.get("embedding_model", "unknown"),
-        vectors_count=rag_health.get("vectors_count", 0)
+        vectors_count=rag_health.get("vectors_count", 0),
+        qdrant_storage=rag_health.get("qdrant_storage"),
+        embedding_cache=rag_health.get("embedding_cache"),
+        answer_cache=rag_health.get("answer_cache"),
+        reranker=rag_health.get("reranker")
     )
 
 
@@ -199,6 +215,7 @@ async def chat(
     **Parameters:**
     - `question`: Câu hỏi của user (1-500 ký tự)
     - `session_id`: ID để tracking conversation (optional)
+    - `filters`: Chỉ tìm trong tài liệu khớp `source` / `file_type` / `page_from`-`page_to` (optional)
     
     **Response:**
     - `answer`: Câu trả lời
@@ -212,22 +229,24 @@ async def chat(
         if session_id == "default":
             session_id = f"user_{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
-        # 1. Lấy conversation history
-        history = memory.get_history(session_id)
-        
-        # 2. Gọi RAG Engine
-        answer, sources, is_grounded, latency_ms = rag_engine.ask(
+        # 1 + 2. Gọi RAG Engine (async) - conversation history được đọc
+        # trong thread riêng, song song với embed + retrieve
+        timings = {}
+        answer, sources, is_grounded, latency_ms = await rag_engine.aask(
             question=request.question,
-            history=history
+            history=asyncio.to_thread(memory.get_history, session_id),
+            timings=timings,
+            filters=request.filters
         )
         
-        # 3. Cập nhật memory (lưu vào MySQL)
-        memory.add_message(session_id, "user", request.question)
-        memory.add_message(
+        # 3. Cập nhật memory (psycopg2 là blocking → chạy trong thread)
+        await asyncio.to_thread(memory.add_message, session_id, "user", request.question)
+        await asyncio.to_thread(
+            memory.add_message,
             session_id=session_id,
             role="assistant",
             content=answer,
-            sources=[s.model_dump() for s in sources] if sources else None,
+            sources=[s.model_dump(exclude_none=True) for s in sources] if sources else None,
             latency=latency_ms,
             is_grounded=is_grounded
         )
@@ -241,7 +260,8 @@ async def chat(
                 latency_ms=round(latency_ms, 2),
                 top_k=settings.TOP_K,
                 sources_count=len(sources),
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                timings={name: round(ms, 2) for name, ms in timings.items()}
             ),
             session_id=session_id,
             is_grounded=is_grounded
@@ -270,6 +290,218 @@ async def chat(
         )
 
 
+def sse_event(event: str, data) -> str:
+    """Format một Server-Sent Event (data là JSON)"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream(
+    request: ChatRequest,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Chat endpoint với streaming (Server-Sent Events) - Yêu cầu đăng nhập
+    
+    Thứ tự events:
+    - `session`: `{"session_id": ...}`
+    - `sources`: danh sách nguồn trích dẫn (gửi ngay sau retrieve)
+    - `token`: `{"delta": "..."}` - từng đoạn câu trả lời (chưa clean)
+    - `done`: `ChatStreamDone` (answer đã clean, meta, session_id, is_grounded)
+      → client thay text đã ghép từ token bằng `answer`
+    - `error`: `{"error": "..."}` nếu có lỗi giữa chừng (LLM lỗi giữa stream:
+      không có `done`, câu hỏi / câu trả lời dở không được lưu)
+    
+    **Yêu cầu:** Bearer token trong header
+    """
+    session_id = request.session_id
+    if session_id == "default":
+        session_id = f"user_{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    async def event_generator():
+        yield sse_event("session", {"session_id": session_id})
+        
+        sources = []
+        is_grounded = False
+        timings = {}
+        try:
+            stream = rag_engine.astream_ask(
+                question=request.question,
+                history=asyncio.to_thread(memory.get_history, session_id),
+                timings=timings,
+                filters=request.filters
+            )
+            async for event, data in stream:
+                if event == "sources":
+                    sources, is_grounded = data
+                    yield sse_event("sources", [s.model_dump(exclude_none=True) for s in sources])
+                elif event == "token":
+                    yield sse_event("token", {"delta": data})
+                elif event == "error":
+                    yield sse_event("error", {"error": data})
+                elif event == "done":
+                    answer, latency_ms = data
+                    
+                    # Lưu message đã ghép đầy đủ vào memory
+                    await asyncio.to_thread(memory.add_message, session_id, "user", request.question)
+                    await asyncio.to_thread(
+                        memory.add_message,
+                        session_id=session_id,
+                        role="assistant",
+                        content=answer,
+                        sources=[s.model_dump(exclude_none=True) for s in sources] if sources else None,
+                        latency=latency_ms,
+                        is_grounded=is_grounded
+                    )
+                    
+                    done = ChatStreamDone(
+                        answer=answer,
+                        meta=Metadata(
+                            model=settings.MODEL_NAME,
+                            latency_ms=round(latency_ms, 2),
+                            top_k=settings.TOP_K,
+                            sources_count=len(sources),
+                            timestamp=datetime.now(),
+                            timings={name: round(ms, 2) for name, ms in timings.items()}
+                        ),
+                        session_id=session_id,
+                        is_grounded=is_grounded
+                    )
+                    yield sse_event("done", done.model_dump(mode="json"))
+                    
+        except Exception as e:
+            error_msg = f"{str(e)}\n{traceback.format_exc()}"
+            print(f"\n❌ CHAT STREAM ERROR:\n{error_msg}")
+            yield sse_event("error", {"error": f"Internal server error: {str(e)}"})
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Tắt buffering của nginx
+        }
+    )
+
+
+@app.post("/chat/batch", tags=["Chat"])
+async def chat_batch(
+    request: ChatBatchRequest,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Trả lời nhiều câu hỏi trong 1 request (Yêu cầu đăng nhập)
+    
+    - Embed 1 lần, search 1 round trip, LLM chạy song song có giới hạn
+    - Mỗi câu hỏi độc lập (không dùng conversation history)
+    - Response: NDJSON, mỗi dòng 1 `ChatBatchItem` (theo thứ tự xong trước),
+      dòng cuối là `ChatBatchDone`
+    - Q&A được lưu vào session trong 1 transaction (bỏ qua câu bị lỗi)
+    
+    **Yêu cầu:** Bearer token trong header
+    """
+    session_id = request.session_id
+    if session_id == "default":
+        session_id = f"user_{current_user.id}_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    async def ndjson_generator():
+        start_time = datetime.now()
+        timings = {}
+        items = []
+        try:
+            async for index, answer, sources, is_grounded, latency_ms, error in rag_engine.ask_batch(
+                request.questions,
+                filters=request.filters,
+                timings=timings
+            ):
+                item = ChatBatchItem(
+                    index=index,
+                    question=request.questions[index],
+                    answer=answer,
+                    sources=sources,
+                    is_grounded=is_grounded,
+                    latency_ms=round(latency_ms, 2),
+                    error=error
+                )
+                items.append(item)
+                yield item.model_dump_json() + "\n"
+            
+            # Lưu theo thứ tự câu hỏi, 1 transaction cho cả batch
+            # (câu bị lỗi không lưu như 1 câu trả lời bình thường)
+            messages = []
+            for item in sorted(items, key=lambda i: i.index):
+                if item.error:
+                    continue
+                messages.append({
+                    "session_id": session_id,
+                    "role": "user",
+                    "content": item.question
+                })
+                messages.append({
+                    "session_id": session_id,
+                    "role": "assistant",
+                    "content": item.answer,
+                    "sources": [s.model_dump(exclude_none=True) for s in item.sources] if item.sources else None,
+                    "latency": item.latency_ms,
+                    "is_grounded": item.is_grounded
+                })
+            await asyncio.to_thread(memory.add_messages, messages)
+            
+            done = ChatBatchDone(
+                session_id=session_id,
+                total=len(items),
+                errors=sum(1 for item in items if item.error),
+                latency_ms=round((datetime.now() - start_time).total_seconds() * 1000, 2),
+                timings={name: round(ms, 2) for name, ms in timings.items()}
+            )
+            yield done.model_dump_json() + "\n"
+            
+        except Exception as e:
+            error_msg = f"{str(e)}\n{traceback.format_exc()}"
+            print(f"\n❌ CHAT BATCH ERROR:\n{error_msg}")
+            yield json.dumps({"error": f"Internal server error: {str(e)}"}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        ndjson_generator(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@app.get("/chunks/{point_id}", response_model=ChunkResponse, tags=["Chat"])
+async def get_chunk(
+    point_id: str,
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Nội dung đầy đủ của 1 chunk (Yêu cầu đăng nhập)
+    
+    Sources trong /chat chỉ có excerpt + `point_ids`; client gọi endpoint
+    này khi user mở nguồn. Nội dung của 1 point id không đổi cho đến khi
+    rebuild index → trả về ETag + Cache-Control để client cache.
+    """
+    chunk = await rag_engine.aget_chunk(point_id)
+    if chunk is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy chunk '{point_id}'")
+    
+    body = ChunkResponse(**chunk)
+    etag = '"' + hashlib.sha1(body.content.encode("utf-8")).hexdigest() + '"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.CHUNK_CACHE_MAX_AGE}"
+    }
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    return JSONResponse(content=body.model_dump(), headers=headers)
+
+
 @app.get("/stats", response_model=StatsResponse, tags=["System"])
 async def get_stats(current_user: UserResponse = Depends(get_current_active_admin)):
     """
@@ -495,17 +727,21 @@ async def upload_document(
     current_user: UserResponse = Depends(get_current_active_admin)
 ):
     """
-    Upload document mới vào thư mục data - Chỉ Admin
+    Upload document mới vào thư mục data và index ngay - Chỉ Admin
     
     Hỗ trợ: PDF, Markdown (.md), Text (.txt)
     
     **Yêu cầu:** Bearer token với role=admin
     
-    **Lưu ý:** Sau khi upload, cần gọi /admin/rebuild-index để cập nhật vector database
+    File được extract / chunk / embed / upsert trực tiếp vào collection đang
+    chạy (chi phí tỉ lệ với kích thước file). Nếu đang có index job chạy,
+    file chỉ được lưu và sẽ được index ở lần rebuild tiếp theo.
     """
+    filename = os.path.basename(file.filename or "")
+    
     # Kiểm tra file type
     allowed_extensions = ['.pdf', '.md', '.txt']
-    file_ext = os.path.splitext(file.filename)[1].lower()
+    file_ext = os.path.splitext(filename)[1].lower()
     
     if file_ext not in allowed_extensions:
         raise HTTPException(
@@ -517,25 +753,42 @@ async def upload_document(
     os.makedirs(settings.DATA_DIR, exist_ok=True)
     
     # Lưu file
-    file_path = os.path.join(settings.DATA_DIR, file.filename)
+    file_path = os.path.join(settings.DATA_DIR, filename)
     
     try:
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
         file_size = os.path.getsize(file_path)
-        
-        return {
-            "message": "Upload thành công",
-            "filename": file.filename,
-            "size_kb": round(file_size / 1024, 2),
-            "path": file_path,
-            "uploaded_by": current_user.email,
-            "timestamp": datetime.now().isoformat(),
-            "note": "Gọi /admin/rebuild-index để cập nhật vector database"
-        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi lưu file: {str(e)}")
+    
+    response = {
+        "message": "Upload thành công",
+        "filename": filename,
+        "size_kb": round(file_size / 1024, 2),
+        "path": file_path,
+        "uploaded_by": current_user.email,
+        "timestamp": datetime.now().isoformat(),
+        "indexed": False
+    }
+    
+    try:
+        from app.ingest import index_file
+        
+        # Không chạy chồng lên index job / thao tác index khác (mọi worker)
+        ran, result = await asyncio.to_thread(
+            index_jobs.run_exclusive, index_file, filename, rag_engine.embeddings, rag_engine.client
+        )
+        if not ran:
+            response["note"] = "Đang có index job - file sẽ được index ở lần update sau (/admin/rebuild-index?incremental=true)"
+            return response
+        rag_engine.on_documents_changed()
+        response.update(indexed=True, index=result)
+    except Exception as e:
+        traceback.print_exc()
+        response["note"] = f"Lỗi khi index: {str(e)} - gọi /admin/rebuild-index?incremental=true để thử lại"
+    return response
 
 
 @app.delete("/admin/document/{filename}", tags=["Admin"])
@@ -544,12 +797,13 @@ async def delete_document(
     current_user: UserResponse = Depends(get_current_active_admin)
 ):
     """
-    Xóa document khỏi thư mục data - Chỉ Admin
+    Xóa document khỏi thư mục data và khỏi index - Chỉ Admin
     
     **Yêu cầu:** Bearer token với role=admin
     
-    **Lưu ý:** Sau khi xóa, cần gọi /admin/rebuild-index để cập nhật vector database
+    Points của file bị xóa khỏi collection đang chạy (filter theo source).
     """
+    filename = os.path.basename(filename)
     file_path = os.path.join(settings.DATA_DIR, filename)
     
     if not os.path.exists(file_path):
@@ -557,46 +811,104 @@ async def delete_document(
     
     try:
         os.remove(file_path)
-        return {
-            "message": "Xóa thành công",
-            "filename": filename,
-            "deleted_by": current_user.email,
-            "timestamp": datetime.now().isoformat(),
-            "note": "Gọi /admin/rebuild-index để cập nhật vector database"
-        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi xóa file: {str(e)}")
+    
+    response = {
+        "message": "Xóa thành công",
+        "filename": filename,
+        "deleted_by": current_user.email,
+        "timestamp": datetime.now().isoformat(),
+        "unindexed": False
+    }
+    
+    try:
+        from app.ingest import unindex_file
+        
+        ran, _ = await asyncio.to_thread(
+            index_jobs.run_exclusive, unindex_file, filename, rag_engine.client
+        )
+        if not ran:
+            response["note"] = "Đang có index job - gọi lại /admin/rebuild-index?incremental=true sau khi job xong"
+            return response
+        rag_engine.on_documents_changed()
+        response["unindexed"] = True
+    except Exception as e:
+        traceback.print_exc()
+        response["note"] = f"Lỗi khi xóa khỏi index: {str(e)} - gọi /admin/rebuild-index?incremental=true để thử lại"
+    return response
 
 
-@app.post("/admin/rebuild-index", tags=["Admin"])
-async def rebuild_index(current_user: UserResponse = Depends(get_current_active_admin)):
+@app.post("/admin/rebuild-index", response_model=IndexJobResponse, status_code=202, tags=["Admin"])
+async def rebuild_index(
+    incremental: bool = Query(default=False, description="Chỉ xử lý file mới / đã sửa / đã xóa"),
+    current_user: UserResponse = Depends(get_current_active_admin)
+):
     """
-    Rebuild toàn bộ Qdrant index từ documents - Chỉ Admin
+    Rebuild Qdrant index từ documents (background job) - Chỉ Admin
     
     **Yêu cầu:** Bearer token với role=admin
     
-    **Cảnh báo:** Quá trình này có thể mất vài phút tùy số lượng documents
+    Trả về job ngay lập tức; theo dõi tiến độ qua GET /admin/jobs/{job_id}.
+    Trong lúc build, chat vẫn query collection cũ qua alias.
+    Dùng `incremental=true` để chỉ cập nhật các file đã thay đổi.
+    Chỉ 1 job chạy tại 1 thời điểm (409 nếu đang có job).
     """
     try:
-        from app.ingest import build_index
-        
-        # Rebuild index
-        build_index()
-        
-        # Reload RAG engine
-        rag_engine.reload_db()
-        
-        # Lấy thông tin mới
-        health = rag_engine.health_check()
-        
-        return {
-            "message": "Rebuild index thành công",
-            "vectors_count": health.get("vectors_count", 0),
-            "rebuilt_by": current_user.email,
-            "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi rebuild: {str(e)}")
+        job = await asyncio.to_thread(
+            index_jobs.submit,
+            "incremental" if incremental else "full",
+            current_user.email
+        )
+    except JobConflictError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Đang có index job chạy: {e.job_id}"
+        )
+    return IndexJobResponse(**job)
+
+
+@app.get("/admin/jobs", response_model=List[IndexJobResponse], tags=["Admin"])
+async def list_index_jobs(
+    limit: int = Query(default=20, ge=1, le=100),
+    current_user: UserResponse = Depends(get_current_active_admin)
+):
+    """Danh sách index jobs gần nhất - Chỉ Admin"""
+    jobs = await asyncio.to_thread(index_jobs.list, limit)
+    return [IndexJobResponse(**job) for job in jobs]
+
+
+@app.get("/admin/jobs/{job_id}", response_model=IndexJobResponse, tags=["Admin"])
+async def get_index_job(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_active_admin)
+):
+    """
+    Trạng thái + tiến độ của index job - Chỉ Admin
+    
+    progress: stage, files_total, files_done, pages, chunks, points_uploaded
+    """
+    job = await asyncio.to_thread(index_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job không tồn tại")
+    return IndexJobResponse(**job)
+
+
+@app.post("/admin/jobs/{job_id}/cancel", response_model=IndexJobResponse, tags=["Admin"])
+async def cancel_index_job(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_active_admin)
+):
+    """
+    Hủy index job đang chạy - Chỉ Admin
+    
+    Full rebuild: collection đang build bị xóa, index hiện tại giữ nguyên.
+    Incremental: các file đã xử lý xong được giữ lại.
+    """
+    job = await asyncio.to_thread(index_jobs.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job không tồn tại")
+    return IndexJobResponse(**job)
 
 
 # ================================================================
@@ -0,0 +1,657 @@
+"""
+Caching Layer cho RAG ChatBot
+
+Features:
+    - EmbeddingCache: cache vector của câu hỏi (LRU in-process + SQLite on-disk)
+    - ChunkEmbeddingStore: vector của chunk khi ingest (SQLite + memory-mapped float32)
+    - PdfPageCache: nội dung đã extract của từng trang PDF (theo hash file)
+    - SemanticCache: cache câu trả lời theo độ tương đồng embedding câu hỏi
+    - Index version marker: tự động invalidate cache khi corpus thay đổi
+"""
+
+import os
+import re
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """
+    Chuẩn hóa câu hỏi để làm cache key
+
+    - Unicode NFC (tiếng Việt có thể gõ dạng tổ hợp hoặc dựng sẵn)
+    - Lowercase, gộp khoảng trắng
+    """
+    text = unicodedata.normalize("NFC", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip().lower()
+
+
+# ================================================================
+# QUERY EMBEDDING CACHE
+# ================================================================
+
+class EmbeddingCache:
+    """
+    Cache embedding 2 tầng, key = (model name, normalized text)
+
+    - Tầng 1: LRU trong RAM (OrderedDict)
+    - Tầng 2 (optional): SQLite trên disk, sống qua các lần restart
+
+    Đổi EMBEDDING_MODEL → key khác → không bao giờ trả về vector cũ.
+    """
+
+    def __init__(self, model_name: str, max_size: int = 10000,
+                 disk_path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_size = max_size
+        self.disk_path = disk_path
+
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, path: str) -> None:
+        """Mở (hoặc tạo) SQLite store"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def make_key(self, text: str) -> str:
+        """Key = sha256(model + normalized text)"""
+        raw = f"{self.model_name}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Lấy vector từ cache (None nếu miss)"""
+        key = self.make_key(text)
+
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self._put_lru(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, vector: List[float]) -> None:
+        """Lưu vector vào cache (cả RAM và disk nếu bật)"""
+        key = self.make_key(text)
+
+        with self._lock:
+            self._put_lru(key, vector)
+
+            if self._conn is not None:
+                blob = np.asarray(vector, dtype=np.float32).tobytes()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                    (key, self.model_name, blob)
+                )
+                self._conn.commit()
+
+    def _put_lru(self, key: str, vector: List[float]) -> None:
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache của model hiện tại"""
+        with self._lock:
+            self._lru.clear()
+            if self._conn is not None:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE model = ?", (self.model_name,)
+                )
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        """Thống kê hit/miss"""
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "size": len(self._lru),
+            "max_size": self.max_size,
+            "disk_enabled": self._conn is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# ================================================================
+# CHUNK EMBEDDING STORE (INGEST)
+# ================================================================
+
+class ChunkEmbeddingStore:
+    """
+    Store embedding của chunk cho ingest, content-addressed
+
+    Key = sha256(nội dung chunk), mỗi model 1 thư mục con (theo hash model
+    name) → rebuild với chunk không đổi không phải embed lại, đổi model thì
+    không bao giờ dùng nhầm vector cũ.
+
+    - index.sqlite: key → row trong file vectors (+ last_used để compact)
+    - vectors-<gen>.f32: ma trận float32 append-only, đọc qua np.memmap
+    """
+
+    INDEX_FILE = "index.sqlite"
+
+    def __init__(self, root_dir: str, model_name: str, dim: int):
+        self.model_name = model_name
+        self.dim = dim
+        self.dir = os.path.join(root_dir, hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._mapped_path = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(os.path.join(self.dir, self.INDEX_FILE), timeout=60,
+                                     check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " key TEXT PRIMARY KEY,"
+            " row INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (name, value) VALUES ('model', ?), ('dim', ?), ('vectors_file', ?)",
+            (model_name, str(dim), "vectors-0.f32")
+        )
+        self._conn.commit()
+
+        stored_dim = int(self._meta("dim"))
+        if stored_dim != dim:
+            raise ValueError(f"Chunk embedding store at {self.dir} has dim {stored_dim}, expected {dim}")
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _meta(self, name: str) -> str:
+        return self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.dir, self._meta("vectors_file"))
+
+    def _rows_on_disk(self) -> int:
+        path = self.vectors_path
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (self.dim * 4)
+
+    def _mapped(self, rows_needed: int):
+        """
+        Memmap của file vectors
+
+        Map lại khi file đã dài thêm, hoặc đã bị compact (có thể bởi process
+        khác, vd: script compact chạy trong lúc API đang chạy)
+        """
+        path = self.vectors_path
+        if self._matrix is None or path != self._mapped_path or len(self._matrix) < rows_needed:
+            rows = self._rows_on_disk()
+            self._matrix = np.memmap(path, dtype=np.float32, mode="r",
+                                     shape=(rows, self.dim)) if rows else None
+            self._mapped_path = path
+        return self._matrix
+
+    def _lookup_rows(self, keys: List[str]) -> dict:
+        rows = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows.update(self._conn.execute(
+                f"SELECT key, row FROM chunks WHERE key IN ({placeholders})", part
+            ).fetchall())
+        return rows
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Vector của từng text (None nếu chưa có)"""
+        keys = [self.make_key(text) for text in texts]
+
+        with self._lock:
+            # Đọc rows + file vectors trong cùng 1 read transaction: compact ở
+            # process khác không commit (và xóa file cũ) được giữa chừng
+            self._conn.commit()
+            self._conn.execute("BEGIN")
+            try:
+                rows = self._lookup_rows(keys)
+                results = [None] * len(texts)
+                if rows:
+                    matrix = self._mapped(max(rows.values()) + 1)
+                    for i, key in enumerate(keys):
+                        row = rows.get(key)
+                        if row is not None:
+                            results[i] = matrix[row].tolist()
+            finally:
+                self._conn.commit()
+
+            if rows:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE chunks SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in rows]
+                )
+                self._conn.commit()
+
+            found = sum(1 for vector in results if vector is not None)
+            self.hits += found
+            self.misses += len(texts) - found
+            return results
+
+    def _begin_write(self) -> None:
+        """
+        Khóa ghi giữa các process (API, run.py --mode update, script compact)
+
+        BEGIN IMMEDIATE giữ write lock của SQLite cho tới commit / rollback:
+        cấp row mới + append file vectors + ghi index nằm trọn trong lock
+        → 2 process không bao giờ cấp trùng row. Store dùng rollback journal
+        (không WAL) để reader đang đọc chặn được compact xóa file cũ.
+        """
+        self._conn.commit()
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        """
+        Lưu vectors mới
+
+        Ghi vector vào cuối file trước, rồi mới ghi index → crash giữa chừng
+        chỉ để lại row thừa (compact sẽ dọn), không bao giờ trỏ sai vector.
+        """
+        with self._lock:
+            self._begin_write()
+            try:
+                existing = self._lookup_rows([self.make_key(text) for text in texts])
+                new = {}
+                for text, vector in zip(texts, vectors):
+                    key = self.make_key(text)
+                    if key not in existing and key not in new:
+                        new[key] = vector
+                if not new:
+                    self._conn.rollback()
+                    return
+
+                start = self._rows_on_disk()
+                with open(self.vectors_path, "ab") as f:
+                    # Cắt phần ghi dở (nếu có) ở cuối file
+                    f.truncate(start * self.dim * 4)
+                    f.write(np.asarray(list(new.values()), dtype=np.float32).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT INTO chunks (key, row, last_used) VALUES (?, ?, ?)",
+                    [(key, start + i, now) for i, key in enumerate(new)]
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def compact(self, older_than_seconds: Optional[float] = None) -> dict:
+        """
+        Ghi lại file vectors chỉ với các row còn được index trỏ tới
+
+        older_than_seconds: xóa thêm các chunk không được dùng trong khoảng này
+
+        Chạy trong cùng write lock với put_many (an toàn khi API / ingest ở
+        process khác đang chạy). File mới có tên mới (generation) và được
+        chuyển sang trong cùng transaction với index → crash lúc nào cũng
+        không làm lệch row.
+        """
+        with self._lock:
+            self._begin_write()
+            try:
+                old_path = self.vectors_path
+                bytes_before = os.path.getsize(old_path) if os.path.exists(old_path) else 0
+
+                expired = 0
+                if older_than_seconds is not None:
+                    expired = self._conn.execute(
+                        "DELETE FROM chunks WHERE last_used < ?", (time.time() - older_than_seconds,)
+                    ).rowcount
+
+                entries = self._conn.execute("SELECT key, row FROM chunks ORDER BY row").fetchall()
+                generation = int(self._meta("vectors_file").split("-")[1].split(".")[0]) + 1
+                new_file = f"vectors-{generation}.f32"
+
+                matrix = self._mapped(entries[-1][1] + 1) if entries else None
+                with open(os.path.join(self.dir, new_file), "wb") as f:
+                    for i in range(0, len(entries), 4096):
+                        rows = [row for _, row in entries[i:i + 4096]]
+                        f.write(np.ascontiguousarray(matrix[rows], dtype=np.float32).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                self._conn.executemany(
+                    "UPDATE chunks SET row = ? WHERE key = ?",
+                    [(i, key) for i, (key, _) in enumerate(entries)]
+                )
+                self._conn.execute(
+                    "UPDATE meta SET value = ? WHERE name = 'vectors_file'", (new_file,)
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+            self._matrix = None
+            if os.path.exists(old_path):
+                os.remove(old_path)
+            self._conn.execute("VACUUM")
+
+            return {
+                "entries": len(entries),
+                "expired": expired,
+                "bytes_before": bytes_before,
+                "bytes_after": os.path.getsize(self.vectors_path)
+            }
+
+    def stats(self) -> dict:
+        """Số chunk đã lưu + hit/miss"""
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {
+            "model": self.model_name,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# ================================================================
+# PDF PAGE CACHE (INGEST)
+# ================================================================
+
+class PdfPageCache:
+    """
+    Nội dung đã extract của từng trang PDF, lưu trong SQLite
+
+    Key = (sha256 file, số trang, extractor) → file không đổi thì rebuild /
+    re-upload không phải parse lại PDF; đổi engine / settings extract thì
+    extractor khác → không dùng nhầm nội dung cũ.
+
+    Dùng được từ nhiều process cùng lúc (worker của process pool): WAL +
+    busy timeout, mỗi process 1 connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " file_hash TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " extractor TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (file_hash, page, extractor))"
+        )
+        self._conn.commit()
+
+    def get_many(self, file_hash: str, pages: List[int], extractor: str) -> dict:
+        """{page: content} của các trang đã có trong cache"""
+        if not pages:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, content FROM pages"
+                " WHERE file_hash = ? AND extractor = ? AND page BETWEEN ? AND ?",
+                (file_hash, extractor, min(pages), max(pages))
+            ).fetchall()
+        wanted = set(pages)
+        return {page: content for page, content in rows if page in wanted}
+
+    def put_many(self, file_hash: str, contents: dict, extractor: str) -> None:
+        """Lưu {page: content}"""
+        if not contents:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (file_hash, page, extractor, content, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(file_hash, page, extractor, content, now) for page, content in contents.items()]
+            )
+            self._conn.commit()
+
+    def prune(self, keep_hashes: List[str]) -> int:
+        """Xóa trang của các file không còn trong corpus, trả về số trang đã xóa"""
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (file_hash TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT OR IGNORE INTO keep VALUES (?)", [(h,) for h in keep_hashes])
+            deleted = self._conn.execute(
+                "DELETE FROM pages WHERE file_hash NOT IN (SELECT file_hash FROM keep)"
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+
+# ================================================================
+# INDEX VERSION MARKER
+# ================================================================
+
+def mark_index_updated(path: str) -> str:
+    """
+    Ghi version mới của index (gọi sau mỗi lần corpus thay đổi)
+
+    Dùng file để process ingest (python run.py --mode ingest) và
+    API server cùng thấy được thay đổi.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    version = uuid.uuid4().hex
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(version)
+    return version
+
+
+def read_index_version(path: str) -> Optional[str]:
+    """Đọc version hiện tại của index (None nếu chưa có)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+# ================================================================
+# SEMANTIC ANSWER CACHE
+# ================================================================
+
+class SemanticCache:
+    """
+    Cache câu trả lời grounded, tra cứu theo cosine similarity
+    giữa embedding câu hỏi mới và các câu hỏi đã trả lời
+
+    - Hit khi similarity >= threshold và entry chưa hết TTL
+    - Tự xóa toàn bộ khi index version thay đổi (build_index / rebuild)
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: int = 86400,
+                 max_entries: int = 1000, version_path: Optional[str] = None):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version_path = version_path
+
+        # Mỗi entry: (question, answer, sources, latency_ms, created_at)
+        self._entries: List[tuple] = []
+        self._vectors: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+        self._version = read_index_version(version_path) if version_path else None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency_ms = 0.0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _check_version(self) -> None:
+        """Invalidate nếu index đã được rebuild (kể cả từ process khác)"""
+        if not self.version_path:
+            return
+        version = read_index_version(self.version_path)
+        if version != self._version:
+            self._version = version
+            self._clear_locked()
+
+    def _clear_locked(self) -> None:
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._vectors.clear()
+        self._matrix = None
+
+    def invalidate(self) -> None:
+        """Xóa toàn bộ cache (corpus đã thay đổi)"""
+        with self._lock:
+            if self.version_path:
+                self._version = read_index_version(self.version_path)
+            self._clear_locked()
+
+    def lookup(self, query_vector) -> Optional[Tuple[str, list, float]]:
+        """
+        Tìm câu trả lời đã cache cho câu hỏi tương tự
+
+        Returns:
+            (answer, sources, similarity) hoặc None nếu miss
+        """
+        query = self._normalize(query_vector)
+
+        with self._lock:
+            self._check_version()
+            self._evict_expired()
+
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix = np.vstack(self._vectors)
+
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            _, answer, sources, latency_ms, _ = self._entries[best]
+            self.hits += 1
+            self.saved_latency_ms += latency_ms
+            return answer, [s.model_copy() for s in sources], similarity
+
+    def store(self, question: str, query_vector, answer: str,
+              sources: list, latency_ms: float) -> None:
+        """Lưu câu trả lời grounded vào cache"""
+        with self._lock:
+            self._check_version()
+
+            self._entries.append((question, answer, list(sources), latency_ms, time.time()))
+            self._vectors.append(self._normalize(query_vector))
+
+            # Bỏ entry cũ nhất khi vượt quá giới hạn
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                del self._entries[:overflow]
+                del self._vectors[:overflow]
+            self._matrix = None
+
+    def _evict_expired(self) -> None:
+        """Bỏ các entry đã hết TTL (entries sắp xếp theo thời gian tạo)"""
+        cutoff = time.time() - self.ttl_seconds
+        expired = 0
+        for entry in self._entries:
+            if entry[4] >= cutoff:
+                break
+            expired += 1
+        if expired:
+            del self._entries[:expired]
+            del self._vectors[:expired]
+            self._matrix = None
+
+    def stats(self) -> dict:
+        """Thống kê hit rate và latency tiết kiệm được"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_latency_ms": round(self.saved_latency_ms, 2),
+            "invalidations": self.invalidations
+        }
@@ -15,6 +15,61 @@ class Settings(BaseSettings):
     # ==================== QDRANT SETTINGS ====================
     QDRANT_URL: str = "http://localhost:6333"
     QDRANT_COLLECTION_NAME: str = "abc_corp_docs"
+    QDRANT_API_KEY: Optional[str] = None
+
+    # Transport: gRPC (protobuf, port 6334) nhanh hơn REST/JSON khi gửi vector
+    QDRANT_PREFER_GRPC: bool = True
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_TIMEOUT: int = 10  # giây
+    QDRANT_POOL_SIZE: int = 20  # số connection tối đa (REST)
+
+    # ==================== QDRANT STORAGE / INDEX ====================
+    # Quantization: "none", "scalar" (int8, RAM /4) hoặc "binary" (RAM /32)
+    # Vector gốc vẫn được lưu → rescore lại top candidates bằng float32
+    QDRANT_QUANTIZATION: str = "none"
+    QDRANT_QUANTIZATION_ALWAYS_RAM: bool = True  # giữ vector quantized trong RAM
+    QDRANT_QUANTIZATION_RESCORE: bool = True
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = 2.0  # lấy k × oversampling candidates rồi rescore
+
+    # Lưu vector gốc / payload (full text) trên disk (mmap) thay vì RAM
+    QDRANT_VECTORS_ON_DISK: bool = False
+    QDRANT_PAYLOAD_ON_DISK: bool = False
+
+    # HNSW: m, ef_construct lúc build; ef lúc search (cao = recall tốt, chậm hơn)
+    QDRANT_HNSW_M: int = 16
+    QDRANT_HNSW_EF_CONSTRUCT: int = 100
+    QDRANT_HNSW_EF: int = 128
+
+    # Blue/green rebuild: QDRANT_COLLECTION_NAME là alias trỏ tới collection
+    # version mới nhất; giữ thêm N version cũ để rollback
+    QDRANT_KEEP_OLD_VERSIONS: int = 1
+
+    # ==================== INGEST ====================
+    # Manifest (hash từng file) cho incremental ingest: chỉ xử lý file mới / đã sửa
+    INGEST_MANIFEST_PATH: str = "index/ingest_manifest.json"
+
+    # PDF extraction song song (process pool): 0 = số CPU
+    INGEST_WORKERS: int = 0
+    INGEST_PAGES_PER_TASK: int = 16  # số trang PDF mỗi task
+
+    # Streaming ingest: số phần tử tối đa giữa 2 stage, số chunks mỗi lần embed
+    INGEST_QUEUE_SIZE: int = 4
+    INGEST_EMBED_WINDOW: int = 256
+
+    # PDF text engine: "pdfium" (pypdfium2, nhanh) | "pdfplumber" (layout analysis, chậm)
+    PDF_TEXT_ENGINE: str = "pdfium"
+    # Chỉ chạy extract_tables trên trang có đường kẻ (ruling lines) - bảng
+    # không có đường kẻ pdfplumber cũng không nhận ra với settings mặc định
+    PDF_TABLE_DETECTION: bool = True
+    # Cache nội dung từng trang theo hash file (None = tắt)
+    PDF_PAGE_CACHE_PATH: Optional[str] = "cache/pdf_pages.sqlite"
+
+    # ==================== RETRIEVAL BACKEND ====================
+    # "qdrant": Qdrant server (mặc định)
+    # "numpy": exact search in-process trên ma trận memory-mapped (corpus nhỏ)
+    RETRIEVAL_BACKEND: str = "qdrant"
+    NUMPY_INDEX_DIR: str = "index/numpy"
+    NUMPY_INDEX_DTYPE: str = "float16"  # float16 (nhỏ gọn) hoặc float32
     
     # ==================== POSTGRESQL SETTINGS (from .env) ====================
     POSTGRES_HOST: str
@@ -29,17 +84,80 @@ class Settings(BaseSettings):
     
     # Ngưỡng similarity (0-1). Dưới ngưỡng này = không liên quan
     SIMILARITY_THRESHOLD: float = 0.25
+    # Gửi ngưỡng kèm query → Qdrant lọc luôn, không trả về hits bị loại
+    SERVER_SIDE_THRESHOLD: bool = True
     
     # Chunking parameters (tăng để có context đầy đủ hơn)
     CHUNK_SIZE: int = 500
     CHUNK_OVERLAP: int = 100
     
+    # ==================== HYBRID SEARCH (DENSE + SPARSE) ====================
+    # Tên named vectors trong Qdrant collection
+    DENSE_VECTOR_NAME: str = "dense"
+    SPARSE_VECTOR_NAME: str = "sparse"
+    
+    # Bật sparse lexical leg + Reciprocal Rank Fusion
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_CANDIDATES: int = 20  # Số candidates mỗi leg trước khi fuse
+    RRF_K: int = 60
+    
+    # Hit có sparse score (BM25-like) >= ngưỡng này được coi là liên quan
+    # kể cả khi cosine < SIMILARITY_THRESHOLD (exact match mã form, số hiệu)
+    HYBRID_SPARSE_THRESHOLD: float = 4.0
+    
+    # ==================== RERANKING (CROSS-ENCODER) ====================
+    # Retrieve RERANK_CANDIDATES chunks, chấm lại bằng cross-encoder,
+    # chỉ gửi RERANK_TOP_N chunks tốt nhất cho LLM (prompt ngắn hơn)
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "BAAI/bge-reranker-v2-m3"  # multilingual, hỗ trợ Tiếng Việt
+    RERANK_CANDIDATES: int = 20
+    RERANK_TOP_N: int = 3
+    RERANK_BATCH_SIZE: int = 32
+    RERANK_MAX_LENGTH: int = 512
+    RERANK_CACHE_SIZE: int = 20000  # số cặp (query, chunk) được cache
+    
+    # ==================== CONTEXT PACKING ====================
+    # Gộp chunks liền kề (bỏ phần overlap) + giới hạn số token của context
+    CONTEXT_PACKING_ENABLED: bool = True
+    CONTEXT_TOKEN_BUDGET: int = 2000
+    # Tokenizer để đếm token (HuggingFace name). None = tokenizer của embedding model
+    CONTEXT_TOKENIZER: Optional[str] = None
+    
     # ==================== EMBEDDING MODEL ====================
     # BGE-M3: Multilingual model tốt nhất cho Tiếng Việt (BAAI)
     # Hỗ trợ 100+ ngôn ngữ, SOTA performance
     EMBEDDING_MODEL: str = "BAAI/bge-m3"
     EMBEDDING_DIM: int = 1024  # BGE-M3 có 1024 dimensions
-    
+
+    # Backend: "sentence_transformers" (PyTorch fp32) hoặc "onnx" (ONNX Runtime int8)
+    EMBEDDING_BACKEND: str = "sentence_transformers"
+    ONNX_MODEL_DIR: str = "models/bge-m3-onnx"
+    ONNX_QUANTIZE: bool = True  # dynamic int8 quantization
+    ONNX_NUM_THREADS: int = 0   # 0 = để onnxruntime tự chọn
+
+    # Số thread tối đa cho embedding (CPU-bound) trong async API path
+    EMBEDDING_WORKERS: int = 2
+
+    # Độ dài tối đa (token) khi encode. None = CHUNK_SIZE + 2 (chunk tối đa
+    # CHUNK_SIZE ký tự → không vượt quá CHUNK_SIZE token + [CLS]/[SEP])
+    EMBEDDING_MAX_SEQ_LENGTH: Optional[int] = None
+
+    # Ingest: tổng số token (đã padding) tối đa trong 1 batch encode
+    EMBEDDING_BATCH_TOKEN_BUDGET: int = 16384
+
+    # Micro-batching: gộp các embed_query đồng thời thành 1 lần encode
+    EMBEDDING_BATCHING_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+
+    # Cache embedding câu hỏi (LRU trong RAM + SQLite trên disk nếu có path)
+    QUERY_EMBEDDING_CACHE_SIZE: int = 10000  # 0 = tắt cache
+    QUERY_EMBEDDING_CACHE_PATH: Optional[str] = "cache/query_embeddings.sqlite"
+
+    # Store embedding của chunk khi ingest (key = model + hash nội dung chunk)
+    # → rebuild không embed lại chunk không đổi; None = tắt
+    CHUNK_EMBEDDING_STORE_DIR: Optional[str] = "cache/chunk_embeddings"
+
     # ==================== LLM SETTINGS ====================
     # API Key (load từ .env)
     OPENROUTER_API_KEY: Optional[str] = None
@@ -54,6 +172,16 @@ class Settings(BaseSettings):
     # API endpoint
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     
+    # ==================== SEMANTIC ANSWER CACHE ====================
+    # Trả lại câu trả lời cũ nếu câu hỏi mới đủ giống (cosine) câu hỏi đã hỏi
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_TTL_SECONDS: int = 60 * 60 * 24  # 24 giờ
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000
+    
+    # File đánh dấu version của index (build_index ghi mới → cache bị xóa)
+    INDEX_VERSION_FILE: str = "cache/index_version"
+    
     # ==================== CONVERSATION MEMORY ====================
     # Số lượng lượt hội thoại giữ lại (1 lượt = user + assistant)
     MAX_HISTORY_TURNS: int = 5
@@ -65,6 +193,18 @@ class Settings(BaseSettings):
     # CORS settings
     CORS_ORIGINS: list = ["*"]  # Production nên chỉ định cụ thể
     
+    # /chat/batch: số lời gọi LLM chạy đồng thời tối đa
+    BATCH_LLM_CONCURRENCY: int = 4
+    
+    # Sources gọn: không trả full_content (client lấy qua GET /chunks/{point_id})
+    COMPACT_SOURCES: bool = True
+    CHUNK_CACHE_MAX_AGE: int = 3600  # giây (Cache-Control của /chunks)
+    
+    # Background index jobs: chu kỳ ghi progress xuống DB (giây)
+    INDEX_JOB_PROGRESS_INTERVAL: float = 2.0
+    # Upload / xóa document: chờ tối đa N giây nếu đang có thao tác index 1 file khác
+    INDEX_FILE_LOCK_TIMEOUT: float = 30.0
+    
     # ==================== JWT / AUTH SETTINGS ====================
     # # Secret key cho JWT
 
@@ -121,12 +261,17 @@ def print_config():
     print("\n QDRANT:")
     print(f"  URL: {settings.QDRANT_URL}")
     print(f"  Collection: {settings.QDRANT_COLLECTION_NAME}")
+    transport = f"gRPC :{settings.QDRANT_GRPC_PORT}" if settings.QDRANT_PREFER_GRPC else "REST"
+    print(f"  Transport: {transport} (timeout {settings.QDRANT_TIMEOUT}s)")
     
     print("\n RAG PARAMETERS:")
     print(f"  Top K: {settings.TOP_K}")
     print(f"  Similarity Threshold: {settings.SIMILARITY_THRESHOLD}")
     print(f"  Chunk Size: {settings.CHUNK_SIZE}")
     print(f"  Chunk Overlap: {settings.CHUNK_OVERLAP}")
+    if settings.RERANK_ENABLED:
+        print(f"  Rerank: {settings.RERANK_MODEL} "
+              f"({settings.RERANK_CANDIDATES} → {settings.RERANK_TOP_N})")
     
     print("\n LLM SETTINGS:")
     print(f"  Model: {settings.MODEL_NAME}")
@@ -0,0 +1,120 @@
+"""
+Context Packer
+
+Chunks liền kề (cùng source + page, chunk_id liên tiếp) lặp lại
+CHUNK_OVERLAP ký tự của nhau. Packer gộp chúng thành 1 đoạn, bỏ phần
+overlap, rồi chọn các đoạn theo thứ tự liên quan cho đến khi đầy
+token budget (đếm bằng tokenizer thật).
+
+Kết quả packed được dùng cho cả build_context và format_sources
+→ [Nguồn i] trong prompt luôn trùng với sources[i - 1].
+"""
+
+from typing import Callable, List, Tuple
+
+from app.models import RetrievedChunk
+
+
+# Overlap ngắn hơn ngưỡng này coi như trùng hợp ngẫu nhiên, không cắt
+MIN_OVERLAP_CHARS = 10
+
+
+def overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """Độ dài đoạn dài nhất vừa là đuôi của left vừa là đầu của right"""
+    limit = min(len(left), len(right), max_overlap)
+    for length in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def merge_texts(left: str, right: str, max_overlap: int) -> str:
+    """Nối 2 chunk liền kề, bỏ phần overlap"""
+    length = overlap_length(left, right, max_overlap)
+    if length:
+        return left + right[length:]
+    return f"{left}\n{right}"
+
+
+def merge_adjacent(results: List[Tuple], max_overlap: int) -> List[Tuple]:
+    """
+    Gộp các chunk cùng (source, page) có chunk_id liên tiếp
+
+    Args:
+        results: List[(RetrievedChunk, score)] theo thứ tự liên quan
+
+    Returns:
+        List[(RetrievedChunk, score)] đã gộp, xếp theo rank tốt nhất của các
+        chunk trong mỗi đoạn; score = score cao nhất trong đoạn
+    """
+    # (source, page) → [(chunk_id, rank, doc, score)]
+    groups = {}
+    for rank, (doc, score) in enumerate(results):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        groups.setdefault(key, []).append((doc.metadata.get("chunk_id", 0), rank, doc, score))
+
+    # Mỗi run: [best_rank, doc, score, chunk_ids, text, point_ids]
+    runs = []
+    for items in groups.values():
+        items.sort(key=lambda item: item[0])
+        current = None
+        for chunk_id, rank, doc, score in items:
+            if current is not None and chunk_id == current[3][-1] + 1:
+                current[0] = min(current[0], rank)
+                current[2] = max(current[2], score)
+                current[3].append(chunk_id)
+                current[4] = merge_texts(current[4], doc.page_content, max_overlap)
+                current[5].append(doc.metadata.get("point_id"))
+                continue
+            current = [rank, doc, score, [chunk_id], doc.page_content, [doc.metadata.get("point_id")]]
+            runs.append(current)
+
+    runs.sort(key=lambda run: run[0])
+
+    merged = []
+    for _, doc, score, chunk_ids, text, point_ids in runs:
+        if len(chunk_ids) > 1:
+            doc = RetrievedChunk(
+                page_content=text,
+                metadata={
+                    **doc.metadata,
+                    "chunk_id": chunk_ids[0],
+                    "merged_chunk_ids": chunk_ids,
+                    "merged_point_ids": point_ids
+                }
+            )
+        merged.append((doc, score))
+    return merged
+
+
+def pack_results(
+    results: List[Tuple],
+    count_tokens: Callable[[str], int],
+    token_budget: int,
+    max_overlap: int
+) -> List[Tuple]:
+    """
+    Gộp chunks liền kề rồi chọn đoạn theo thứ tự liên quan trong token budget
+
+    - Đoạn không vừa budget còn lại bị bỏ qua (đoạn sau ngắn hơn vẫn được thử)
+    - Đoạn đầu tiên luôn được giữ (cắt bớt nếu 1 mình đã vượt budget)
+
+    Returns:
+        List[(RetrievedChunk, score)] - dùng chung cho build_context và format_sources
+    """
+    packed = []
+    used = 0
+    for doc, score in merge_adjacent(results, max_overlap):
+        tokens = count_tokens(doc.page_content)
+
+        if used + tokens <= token_budget:
+            packed.append((doc, score))
+            used += tokens
+        elif not packed:
+            # Cắt theo tỉ lệ ký tự / token
+            keep = max(1, int(len(doc.page_content) * token_budget / tokens))
+            doc = RetrievedChunk(page_content=doc.page_content[:keep], metadata=dict(doc.metadata))
+            packed.append((doc, score))
+            used = token_budget
+
+    return packed
@@ -4,7 +4,8 @@ Quản lý kết nối và operations với PostgreSQL
 """
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor, execute_values
 from contextlib import contextmanager
 from typing import Optional, List, Dict, Any
 import json
@@ -30,18 +31,23 @@ class Database:
         self._create_tables()
         print(" PostgreSQL Database initialized")
     
+    def open_connection(self):
+        """Kết nối mới (autocommit), dùng riêng cho session-level lock"""
+        connection = psycopg2.connect(
+            host=settings.POSTGRES_HOST,
+            port=settings.POSTGRES_PORT,
+            user=settings.POSTGRES_USER,
+            password=settings.POSTGRES_PASSWORD or "",
+            dbname=settings.POSTGRES_DATABASE,
+            cursor_factory=RealDictCursor
+        )
+        connection.autocommit = True
+        return connection
+    
     def _connect(self) -> None:
         """Tạo kết nối đến PostgreSQL"""
         try:
-            self._connection = psycopg2.connect(
-                host=settings.POSTGRES_HOST,
-                port=settings.POSTGRES_PORT,
-                user=settings.POSTGRES_USER,
-                password=settings.POSTGRES_PASSWORD or "",
-                dbname=settings.POSTGRES_DATABASE,
-                cursor_factory=RealDictCursor
-            )
-            self._connection.autocommit = True
+            self._connection = self.open_connection()
             print(f"  ✓ Connected to PostgreSQL at {settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}")
         except psycopg2.OperationalError as e:
             print(f"  ✗ PostgreSQL connection failed: {e}")
@@ -95,6 +101,24 @@ class Database:
         CREATE INDEX IF NOT EXISTS idx_user_email ON users(email);
         """
         
+        # Bảng index_jobs (rebuild / update index chạy nền)
+        create_index_jobs = """
+        CREATE TABLE IF NOT EXISTS index_jobs (
+            id SERIAL PRIMARY KEY,
+            job_id VARCHAR(64) UNIQUE NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            progress JSONB,
+            result JSONB,
+            error TEXT,
+            requested_by VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_index_jobs_created_at ON index_jobs(created_at);
+        """
+        
         # Function và Trigger để tự động cập nhật updated_at
         create_update_trigger = """
         CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -128,6 +152,7 @@ class Database:
             cursor.execute(create_sessions)
             cursor.execute(create_messages)
             cursor.execute(create_users)
+            cursor.execute(create_index_jobs)
             cursor.execute(create_update_trigger)
         
         print("  ✓ Tables created/verified")
@@ -284,6 +309,47 @@ class MessageRepository:
             
             return message_id
     
+    def add_messages(self, messages: List[Dict]) -> int:
+        """
+        Thêm nhiều messages trong 1 transaction (batch API)
+        
+        Mỗi message: dict với session_id, role, content và (optional)
+        sources, latency, is_grounded
+        """
+        if not messages:
+            return 0
+        
+        session_ids = sorted({m["session_id"] for m in messages})
+        with self.db.get_cursor() as cursor:
+            execute_values(
+                cursor,
+                "INSERT INTO sessions (session_id) VALUES %s ON CONFLICT DO NOTHING",
+                [(session_id,) for session_id in session_ids]
+            )
+            
+            execute_values(cursor, """
+                INSERT INTO messages 
+                (session_id, role, content, sources, latency, is_grounded)
+                VALUES %s
+            """, [
+                (
+                    m["session_id"],
+                    m["role"],
+                    m["content"],
+                    json.dumps(m.get("sources"), ensure_ascii=False) if m.get("sources") else None,
+                    m.get("latency"),
+                    m.get("is_grounded")
+                )
+                for m in messages
+            ])
+            
+            cursor.execute(
+                "UPDATE sessions SET updated_at = CURRENT_TIMESTAMP WHERE session_id = ANY(%s)",
+                (session_ids,)
+            )
+        
+        return len(messages)
+    
     def get_messages(self, session_id: str, limit: int = 100) -> List[Dict]:
         """Lấy messages của session"""
         with self.db.get_cursor() as cursor:
@@ -463,6 +529,154 @@ class UserRepository:
             return cursor.fetchone() is not None
 
 
+# ================================================================
+# INDEX JOB OPERATIONS
+# ================================================================
+
+class IndexJobRepository:
+    """Repository pattern cho background index jobs"""
+    
+    # Key của pg advisory lock: chỉ 1 thao tác ghi index tại 1 thời điểm,
+    # trên mọi process (uvicorn --workers N, run.py --mode update...)
+    INDEX_LOCK_KEY = 74010022
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def try_lock_index(self):
+        """
+        pg_try_advisory_lock trên 1 connection riêng
+        
+        Returns:
+            Connection đang giữ lock (đưa vào unlock_index), None nếu
+            process khác đang giữ. Process chết → Postgres tự nhả lock.
+        """
+        connection = self.db.open_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s) AS locked", (self.INDEX_LOCK_KEY,))
+                locked = cursor.fetchone()["locked"]
+        except Exception:
+            connection.close()
+            raise
+        if not locked:
+            connection.close()
+            return None
+        return connection
+    
+    def lock_index(self, timeout_seconds: float):
+        """
+        Như try_lock_index nhưng chờ tối đa timeout_seconds
+        
+        Returns:
+            Connection đang giữ lock, None nếu hết thời gian chờ
+        """
+        connection = self.db.open_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SET lock_timeout = %s", (f"{int(timeout_seconds * 1000)}ms",))
+                cursor.execute("SELECT pg_advisory_lock(%s)", (self.INDEX_LOCK_KEY,))
+                cursor.execute("SET lock_timeout = 0")
+        except psycopg2.errors.LockNotAvailable:
+            connection.close()
+            return None
+        except Exception:
+            connection.close()
+            raise
+        return connection
+    
+    def unlock_index(self, connection) -> None:
+        """Nhả lock (đóng session cũng nhả lock)"""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (self.INDEX_LOCK_KEY,))
+        finally:
+            connection.close()
+    
+    def get_unfinished_job(self) -> Optional[Dict]:
+        """Job queued/running mới nhất (có thể của process khác)"""
+        with self.db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT * FROM index_jobs WHERE status IN ('queued', 'running')
+                ORDER BY created_at DESC LIMIT 1
+            """)
+            return cursor.fetchone()
+    
+    def create_job(self, job_id: str, kind: str, status: str,
+                   progress: Dict, requested_by: Optional[str] = None) -> None:
+        """Tạo job mới"""
+        with self.db.get_cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO index_jobs (job_id, kind, status, progress, requested_by)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (job_id, kind, status, json.dumps(progress), requested_by))
+    
+    def update_job(self, job_id: str, status: Optional[str] = None,
+                   progress: Optional[Dict] = None, result: Optional[Dict] = None,
+                   error: Optional[str] = None, started: bool = False,
+                   finished: bool = False) -> None:
+        """Cập nhật status / progress / kết quả của job"""
+        fields = []
+        values = []
+        if status is not None:
+            fields.append("status = %s")
+            values.append(status)
+        if progress is not None:
+            fields.append("progress = %s")
+            values.append(json.dumps(progress))
+        if result is not None:
+            fields.append("result = %s")
+            values.append(json.dumps(result))
+        if error is not None:
+            fields.append("error = %s")
+            values.append(error)
+        if started:
+            fields.append("started_at = CURRENT_TIMESTAMP")
+        if finished:
+            fields.append("finished_at = CURRENT_TIMESTAMP")
+        if not fields:
+            return
+        
+        values.append(job_id)
+        with self.db.get_cursor() as cursor:
+            cursor.execute(
+                f"UPDATE index_jobs SET {', '.join(fields)} WHERE job_id = %s",
+                values
+            )
+    
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Lấy job theo job_id"""
+        with self.db.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM index_jobs WHERE job_id = %s",
+                (job_id,)
+            )
+            return cursor.fetchone()
+    
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        """Các job mới nhất"""
+        with self.db.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM index_jobs ORDER BY created_at DESC LIMIT %s",
+                (limit,)
+            )
+            return cursor.fetchall()
+    
+    def fail_unfinished(self, error: str) -> int:
+        """
+        Đánh dấu failed các job queued/running còn sót (server bị restart)
+        
+        Chỉ gọi khi đang giữ index lock: không process nào còn chạy job
+        """
+        with self.db.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE index_jobs
+                SET status = 'failed', error = %s, finished_at = CURRENT_TIMESTAMP
+                WHERE status IN ('queued', 'running')
+            """, (error,))
+            return cursor.rowcount
+
+
 # ================================================================
 # SINGLETON INSTANCES
 # ================================================================
@@ -472,3 +686,4 @@ db = Database()
 session_repo = SessionRepository(db)
 message_repo = MessageRepository(db)
 user_repo = UserRepository(db)
+index_job_repo = IndexJobRepository(db)
@@ -0,0 +1,356 @@
+"""
+Embedding Utilities
+
+Features:
+    - Embedding backends: SentenceTransformer (fp32) hoặc ONNX Runtime (int8)
+    - Sparse lexical encoder cho hybrid search (exact match mã form, số hiệu)
+    - EmbeddingBatcher: gộp nhiều embed_query đồng thời thành 1 lần encode
+"""
+
+import os
+import re
+import math
+import time
+import zlib
+import queue
+import threading
+import unicodedata
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, List, Tuple, Union
+
+import numpy as np
+
+from app.config import settings
+
+
+# ================================================================
+# EMBEDDING BACKENDS
+# ================================================================
+
+def load_embedding_model(backend: str = None):
+    """
+    Tạo embedding model theo settings.EMBEDDING_BACKEND
+
+    - "sentence_transformers": SentenceTransformer fp32 (mặc định)
+    - "onnx": ONNX Runtime, dynamic int8 quantization (CPU)
+
+    Cả 2 đều có method encode(sentences, batch_size, show_progress_bar)
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+
+    if backend == "sentence_transformers":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(settings.EMBEDDING_MODEL)
+
+    if backend == "onnx":
+        return OnnxEmbeddingModel(
+            model_name=settings.EMBEDDING_MODEL,
+            model_dir=settings.ONNX_MODEL_DIR,
+            quantize=settings.ONNX_QUANTIZE,
+            num_threads=settings.ONNX_NUM_THREADS
+        )
+
+    raise ValueError(
+        f"EMBEDDING_BACKEND không hợp lệ: '{backend}' "
+        f"(chỉ hỗ trợ 'sentence_transformers' hoặc 'onnx')"
+    )
+
+
+def embedding_model_id() -> str:
+    """
+    ID của model + backend (dùng làm cache key)
+
+    Backend khác cho vector hơi khác → không dùng chung cache
+    """
+    if settings.EMBEDDING_BACKEND == "sentence_transformers":
+        return settings.EMBEDDING_MODEL
+    suffix = "-int8" if settings.EMBEDDING_BACKEND == "onnx" and settings.ONNX_QUANTIZE else ""
+    return f"{settings.EMBEDDING_MODEL}#{settings.EMBEDDING_BACKEND}{suffix}"
+
+
+class OnnxEmbeddingModel:
+    """
+    Embedding bằng ONNX Runtime trên CPU
+
+    Lần đầu chạy: export model HuggingFace sang ONNX (optimum) và
+    quantize dynamic int8 (onnxruntime.quantization), lưu vào model_dir.
+    Các lần sau chỉ load file .onnx đã có.
+
+    Pooling: CLS token + L2 normalize (giống bge-m3 dense embedding)
+    """
+
+    FP32_FILE = "model.onnx"
+    INT8_FILE = "model_int8.onnx"
+
+    def __init__(self, model_name: str, model_dir: str,
+                 quantize: bool = True, num_threads: int = 0,
+                 max_seq_length: int = 512):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "ONNX backend cần thêm packages: "
+                "pip install onnxruntime optimum[onnxruntime] transformers"
+            ) from e
+
+        self.model_name = model_name
+        self.model_dir = model_dir
+        self.max_seq_length = max_seq_length
+
+        model_path = self._ensure_model(quantize)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        print(f"  ✓ ONNX embedding: {model_path}")
+
+    def _ensure_model(self, quantize: bool) -> str:
+        """Export + quantize nếu chưa có, trả về path của file .onnx"""
+        fp32_path = os.path.join(self.model_dir, self.FP32_FILE)
+        int8_path = os.path.join(self.model_dir, self.INT8_FILE)
+
+        if not os.path.exists(fp32_path):
+            print(f"  Exporting {self.model_name} to ONNX → {self.model_dir}")
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+
+            model = ORTModelForFeatureExtraction.from_pretrained(self.model_name, export=True)
+            model.save_pretrained(self.model_dir)
+            AutoTokenizer.from_pretrained(self.model_name).save_pretrained(self.model_dir)
+
+        if not quantize:
+            return fp32_path
+
+        if not os.path.exists(int8_path):
+            print("  Quantizing ONNX model (dynamic int8)...")
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            quantize_dynamic(
+                model_input=fp32_path,
+                model_output=int8_path,
+                weight_type=QuantType.QInt8,
+                use_external_data_format=True  # bge-m3 fp32 > 2GB
+            )
+
+        return int8_path
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """Giống SentenceTransformer.encode: str → 1D, list → 2D"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            encoded = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            inputs = {k: v for k, v in encoded.items() if k in self._input_names}
+            last_hidden = self.session.run(None, inputs)[0]
+
+            # CLS pooling + L2 normalize
+            cls = last_hidden[:, 0]
+            cls = cls / np.linalg.norm(cls, axis=1, keepdims=True)
+            outputs.append(cls.astype(np.float32))
+
+            if show_progress_bar:
+                print(f"  → Encoded {min(start + batch_size, len(texts))}/{len(texts)}")
+
+        vectors = np.vstack(outputs) if outputs else np.zeros((0, settings.EMBEDDING_DIM), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+
+# ================================================================
+# SPARSE LEXICAL ENCODER (HYBRID SEARCH)
+# ================================================================
+
+# Từ/mã: chữ + số (Unicode), cho phép nối bằng - _ . / (vd: "HR-F01", "2.3")
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-_./]\w+)*")
+
+
+def lexical_tokens(text: str) -> List[str]:
+    """
+    Tách token cho sparse index
+
+    Token ghép (vd: "hr-f01") được giữ nguyên và thêm các phần con
+    ("hr", "f01") để vẫn match khi user gõ thiếu dấu nối.
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    tokens = []
+    for match in _TOKEN_PATTERN.findall(text):
+        tokens.append(match)
+        parts = re.split(r"[-_./]", match)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def _token_index(token: str) -> int:
+    """Hash token → index uint32 ổn định (không phụ thuộc PYTHONHASHSEED)"""
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def encode_sparse(text: str, is_query: bool = False) -> Tuple[List[int], List[float]]:
+    """
+    Sparse vector (indices, values) cho text
+
+    - Document: trọng số TF dạng 1 + log(tf)
+    - Query: mỗi term trọng số 1.0
+    IDF được Qdrant tính phía server (sparse vector modifier=IDF) → BM25-like
+    """
+    counts = Counter(_token_index(t) for t in lexical_tokens(text))
+    indices = sorted(counts)
+    if is_query:
+        values = [1.0] * len(indices)
+    else:
+        values = [1.0 + math.log(counts[i]) for i in indices]
+    return indices, values
+
+
+# ================================================================
+# TOKEN-BUDGETED BATCHING (INGEST)
+# ================================================================
+
+def plan_token_batches(lengths: List[int], token_budget: int) -> List[List[int]]:
+    """
+    Chia texts thành các batch theo tổng số token (sau padding)
+
+    - Sắp xếp theo độ dài giảm dần → text trong cùng batch dài gần bằng nhau,
+      padding ít; batch nặng nhất chạy đầu tiên (lỗi OOM lộ ra sớm)
+    - Mỗi batch: số text × độ dài text dài nhất <= token_budget
+      (luôn có ít nhất 1 text)
+
+    Returns:
+        List các batch, mỗi batch là list index trong `lengths`
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches = []
+    current = []
+    current_max = 0
+    for idx in order:
+        length = max(lengths[idx], 1)
+        new_max = max(current_max, length)
+        if current and new_max * (len(current) + 1) > token_budget:
+            batches.append(current)
+            current = []
+            new_max = length
+        current.append(idx)
+        current_max = new_max
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+# ================================================================
+# DYNAMIC MICRO-BATCHING
+# ================================================================
+
+class EmbeddingBatcher:
+    """
+    Gộp các request embedding đến gần nhau (vài ms) thành 1 batch
+
+    Một worker thread lấy request đầu tiên trong queue, chờ thêm tối đa
+    max_wait_ms (hoặc đến khi đủ max_batch_size), rồi gọi encode_fn 1 lần
+    cho cả batch. Mỗi caller nhận lại vector của mình qua Future.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], List[List[float]]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+
+        # Counters
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="embedding-batcher",
+            daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Gửi 1 text vào hàng đợi, trả về Future chứa vector"""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        """Blocking: chờ vector của text"""
+        return self.submit(text).result()
+
+    def _collect_batch(self) -> list:
+        """Lấy 1 batch từ queue (block đến khi có request đầu tiên)"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Hết thời gian chờ, chỉ lấy thêm những gì đã có sẵn
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+
+            # Bỏ các request đã bị hủy (client ngắt kết nối, ...)
+            batch = [(text, fut) for text, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                vectors = self.encode_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            for (_, fut), vector in zip(batch, vectors):
+                fut.set_result(vector)
+
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+    def stats(self) -> dict:
+        """Thống kê kích thước batch"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_seen": self.max_batch_seen
+        }
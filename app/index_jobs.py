@@ -0,0 +1,225 @@
+"""
+Background Index Jobs
+
+Rebuild / incremental update index chạy trên worker thread riêng:
+    - POST /admin/rebuild-index trả về job_id ngay, không block event loop
+    - Status + progress (files, pages, chunks, points) lưu trong bảng index_jobs
+    - Chỉ 1 job chạy tại 1 thời điểm trên mọi worker process (pg advisory
+      lock), chat vẫn được phục vụ trong lúc build
+    - Hủy bằng POST /admin/jobs/{job_id}/cancel
+"""
+
+import threading
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import IndexJobRepository, index_job_repo
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+JOB_KINDS = ("full", "incremental")
+
+
+class JobConflictError(Exception):
+    """Đã có job đang chạy"""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Index job {job_id} is already running")
+        self.job_id = job_id
+
+
+class IndexJobManager:
+    """
+    Chạy tối đa 1 index job tại 1 thời điểm
+
+    Job giữ pg advisory lock (IndexJobRepository.try_lock_index) trong suốt
+    thời gian chạy → worker process khác không submit được job thứ 2, và
+    lock tự nhả nếu process chạy job bị kill.
+
+    Progress của job đang chạy được đọc trực tiếp từ memory (realtime) và
+    ghi xuống DB mỗi INDEX_JOB_PROGRESS_INTERVAL giây. Job của process khác
+    chỉ thấy progress đã ghi xuống DB.
+    """
+
+    def __init__(self, repo: IndexJobRepository):
+        self.repo = repo
+        self._lock = threading.Lock()
+        self._job_id: Optional[str] = None
+        self._progress: Dict = {}
+        self._stop: Optional[threading.Event] = None
+
+        # Job queued/running còn sót chỉ là job "mồ côi" khi không process
+        # nào giữ lock (worker khác có thể đang chạy job thật)
+        lock = self.repo.try_lock_index()
+        if lock is not None:
+            try:
+                interrupted = self.repo.fail_unfinished("Interrupted (server restarted)")
+            finally:
+                self.repo.unlock_index(lock)
+            if interrupted:
+                print(f"  ⚠️ Marked {interrupted} unfinished index job(s) as failed")
+
+    @property
+    def running_job_id(self) -> Optional[str]:
+        return self._job_id
+
+    def submit(self, kind: str = "full", requested_by: Optional[str] = None) -> Dict:
+        """
+        Tạo job và chạy nền
+
+        Raises:
+            JobConflictError: đã có job đang chạy
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        with self._lock:
+            if self._job_id is not None:
+                raise JobConflictError(self._job_id)
+
+            index_lock = self.repo.try_lock_index()
+            if index_lock is None:
+                # Job của worker khác / đang index 1 file
+                running = self.repo.get_unfinished_job()
+                raise JobConflictError(running["job_id"] if running else "unknown")
+
+            # Chỉ nhận job sau khi đã ghi được vào DB (insert lỗi → không kẹt 409)
+            job_id = uuid.uuid4().hex
+            progress = {"stage": JOB_QUEUED}
+            try:
+                self.repo.create_job(job_id, kind, JOB_QUEUED, progress, requested_by)
+            except Exception:
+                self.repo.unlock_index(index_lock)
+                raise
+
+            self._job_id = job_id
+            self._progress = progress
+            self._stop = threading.Event()
+
+        thread = threading.Thread(
+            target=self._run,
+            args=(job_id, kind, self._progress, self._stop, index_lock),
+            name=f"index-job-{job_id[:8]}",
+            daemon=True
+        )
+        thread.start()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Job theo id (progress realtime nếu đang chạy)"""
+        job = self.repo.get_job(job_id)
+        if job is None:
+            return None
+        job = dict(job)
+        if job_id == self._job_id:
+            job["progress"] = dict(self._progress)
+            if self._stop is not None and self._stop.is_set() and job["status"] == JOB_RUNNING:
+                job["status"] = "cancelling"
+        return job
+
+    def list(self, limit: int = 20) -> List[Dict]:
+        return [self.get(job["job_id"]) or dict(job) for job in self.repo.list_jobs(limit)]
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        Yêu cầu hủy job đang chạy (job dừng ở điểm kiểm tra tiếp theo)
+
+        Chỉ hủy được job chạy trong process này (request tới worker khác
+        trả về job không đổi)
+
+        Returns:
+            Job sau khi yêu cầu hủy, None nếu không tồn tại
+        """
+        with self._lock:
+            if job_id == self._job_id and self._stop is not None:
+                self._stop.set()
+        return self.get(job_id)
+
+    def run_exclusive(self, fn: Callable, *args) -> Tuple[bool, Any]:
+        """
+        Chạy 1 thao tác index ngắn (index_file / unindex_file) dưới index lock
+
+        Không bao giờ chạy chồng lên job rebuild / update (trên mọi worker)
+        hay thao tác index 1 file khác. Đang có job → bỏ qua ngay (file sẽ
+        được xử lý ở lần update sau), thao tác 1 file khác → chờ tối đa
+        INDEX_FILE_LOCK_TIMEOUT giây. Blocking: gọi qua asyncio.to_thread.
+
+        Returns:
+            (True, kết quả của fn) hoặc (False, None) nếu không lấy được lock
+        """
+        if self._job_id is not None or self.repo.get_unfinished_job() is not None:
+            return False, None
+        index_lock = self.repo.lock_index(settings.INDEX_FILE_LOCK_TIMEOUT)
+        if index_lock is None:
+            return False, None
+        try:
+            return True, fn(*args)
+        finally:
+            self.repo.unlock_index(index_lock)
+
+    def _run(self, job_id: str, kind: str, progress: Dict, stop: threading.Event, index_lock) -> None:
+        from app.ingest import build_index, update_index
+        from app.pipeline import PipelineStopped
+        from app.rag_engine import rag_engine
+
+        self.repo.update_job(job_id, status=JOB_RUNNING, started=True)
+
+        # Ghi progress xuống DB định kỳ
+        finished = threading.Event()
+
+        def report():
+            while not finished.wait(settings.INDEX_JOB_PROGRESS_INTERVAL):
+                try:
+                    self.repo.update_job(job_id, progress=dict(progress))
+                except Exception as e:
+                    print(f" Index job {job_id}: progress update failed - {e}")
+
+        reporter = threading.Thread(target=report, name=f"index-job-report-{job_id[:8]}", daemon=True)
+        reporter.start()
+
+        status, result, error = JOB_SUCCEEDED, None, None
+        try:
+            # Dùng lại embedding model của rag_engine (không load model thứ 2)
+            ingest = update_index if kind == "incremental" else build_index
+            result = ingest(embeddings=rag_engine.embeddings, progress=progress, stop=stop)
+            rag_engine.reload_db()
+        except PipelineStopped:
+            status = JOB_CANCELLED
+            # Incremental: các file đã xử lý trước khi hủy vẫn được giữ lại
+            if kind == "incremental":
+                rag_engine.reload_db()
+        except Exception as e:
+            traceback.print_exc()
+            status, error = JOB_FAILED, str(e)
+        finally:
+            finished.set()
+            reporter.join()
+            try:
+                self.repo.update_job(
+                    job_id, status=status, progress=dict(progress),
+                    result=result, error=error, finished=True
+                )
+            finally:
+                with self._lock:
+                    self._job_id = None
+                    self._stop = None
+                try:
+                    self.repo.unlock_index(index_lock)
+                except Exception as e:
+                    # Connection đã mất → Postgres đã tự nhả lock
+                    print(f" Index job {job_id}: unlock failed - {e}")
+            print(f" Index job {job_id}: {status}")
+
+
+# ================================================================
+# SINGLETON INSTANCE
+# ================================================================
+
+index_jobs = IndexJobManager(index_job_repo)
@@ -4,18 +4,52 @@ Hỗ trợ PDF (bao gồm bảng), Markdown, Text
 """
 
 import os
+import json
+import time
 import uuid
+import hashlib
+import threading
+import multiprocessing
 from pathlib import Path
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 import pdfplumber
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from sentence_transformers import SentenceTransformer
 from langchain.embeddings.base import Embeddings
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    PointStruct,
+    SparseVectorParams,
+    SparseVector,
+    Modifier
+)
 
 from app.config import settings
+from app.cache import EmbeddingCache, ChunkEmbeddingStore, PdfPageCache, mark_index_updated
+from app.numpy_index import write_numpy_index, replace_source_rows
+from app.pipeline import Stage, PipelineStopped, run_pipeline, format_stats
+from app.vector_store import (
+    create_qdrant_client,
+    create_payload_indexes,
+    dense_vector_params,
+    storage_settings,
+    new_version_name,
+    resolve_alias,
+    switch_alias,
+    garbage_collect_versions,
+    delete_source_points
+)
+from app.embeddings import (
+    EmbeddingBatcher,
+    load_embedding_model,
+    embedding_model_id,
+    plan_token_batches,
+    encode_sparse
+)
 
 # ================================================================
 # EMBEDDING MODEL (Local - FREE)
@@ -23,19 +57,155 @@ from app.config import settings
 
 class LocalEmbedding(Embeddings):
     """
-    Local Embedding sử dụng SentenceTransformer
-    Model được cấu hình trong config.py
+    Local Embedding sử dụng SentenceTransformer hoặc ONNX Runtime
+    Model + backend được cấu hình trong config.py
+    
+    - embed_query dùng EmbeddingCache (key theo EMBEDDING_MODEL + normalized text)
+    - Các embed_query đồng thời được gộp batch qua EmbeddingBatcher
+    - embed_documents sắp xếp theo độ dài, chia batch theo token budget;
+      chunk đã embed ở lần ingest trước lấy từ ChunkEmbeddingStore
     """
     def __init__(self):
-        print(f" Loading embedding: {settings.EMBEDDING_MODEL}")
-        self.model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        print(f" Loading embedding: {settings.EMBEDDING_MODEL} ({settings.EMBEDDING_BACKEND})")
+        self.model = load_embedding_model()
         self.dimension = settings.EMBEDDING_DIM
+        
+        # Giới hạn max_seq_length (bge-m3 mặc định 8192) theo CHUNK_SIZE
+        max_seq_length = settings.EMBEDDING_MAX_SEQ_LENGTH or settings.CHUNK_SIZE + 2
+        self.model.max_seq_length = min(self.model.max_seq_length, max_seq_length)
+        
+        self.query_cache = None
+        if settings.QUERY_EMBEDDING_CACHE_SIZE > 0:
+            self.query_cache = EmbeddingCache(
+                model_name=embedding_model_id(),
+                max_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+                disk_path=settings.QUERY_EMBEDDING_CACHE_PATH
+            )
+        
+        self.chunk_store = None
+        if settings.CHUNK_EMBEDDING_STORE_DIR:
+            self.chunk_store = ChunkEmbeddingStore(
+                root_dir=settings.CHUNK_EMBEDDING_STORE_DIR,
+                model_name=embedding_model_id(),
+                dim=self.dimension
+            )
+        
+        self.batcher = None
+        if settings.EMBEDDING_BATCHING_ENABLED:
+            self.batcher = EmbeddingBatcher(
+                encode_fn=self._encode_batch,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS
+            )
     
-    def embed_documents(self, texts):
-        return self.model.encode(texts, show_progress_bar=True).tolist()
+    def _encode_batch(self, texts):
+        return self.model.encode(texts, batch_size=len(texts)).tolist()
+    
+    def token_lengths(self, texts) -> List[int]:
+        """Số token của mỗi text (đã cắt theo max_seq_length)"""
+        input_ids = self.model.tokenizer(texts, add_special_tokens=True)["input_ids"]
+        return [min(len(ids), self.model.max_seq_length) for ids in input_ids]
+    
+    def iter_embed_documents(self, texts, show_progress: bool = True) -> Iterator[Tuple[List[int], List[List[float]]]]:
+        """
+        Embed documents theo từng batch (sắp xếp theo độ dài, token budget)
+        
+        Yields:
+            (indices, vectors): index trong `texts` và vector tương ứng
+        """
+        batches = plan_token_batches(
+            self.token_lengths(texts),
+            settings.EMBEDDING_BATCH_TOKEN_BUDGET
+        )
+        
+        done = 0
+        for batch in batches:
+            batch_texts = [texts[i] for i in batch]
+            vectors = self.model.encode(batch_texts, batch_size=len(batch_texts)).tolist()
+            done += len(batch)
+            if show_progress:
+                print(f" → Embedded {done}/{len(texts)} chunks")
+            yield batch, vectors
+    
+    def embed_documents(self, texts, show_progress: bool = True):
+        """
+        Embed documents, kết quả giữ đúng thứ tự của `texts`
+        
+        Chunk đã có trong chunk_store không encode lại; text trùng nhau chỉ
+        encode 1 lần
+        """
+        if self.chunk_store is None:
+            return self._embed_texts(texts, show_progress)
+        
+        results = self.chunk_store.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        if missing:
+            vectors = self._embed_texts(missing, show_progress)
+            self.chunk_store.put_many(missing, vectors)
+            encoded = dict(zip(missing, vectors))
+            results = [vector if vector is not None else encoded[text] for text, vector in zip(texts, results)]
+        return results
+    
+    def _embed_texts(self, texts, show_progress: bool = True):
+        results = [None] * len(texts)
+        for indices, vectors in self.iter_embed_documents(texts, show_progress):
+            for idx, vector in zip(indices, vectors):
+                results[idx] = vector
+        return results
+    
+    def submit_query(self, text) -> Future:
+        """
+        Embed query không blocking, trả về Future
+        
+        Cache hit → Future đã có kết quả; miss → gửi vào batcher
+        """
+        if self.query_cache is not None:
+            vector = self.query_cache.get(text)
+            if vector is not None:
+                future = Future()
+                future.set_result(vector)
+                return future
+        
+        if self.batcher is not None:
+            future = self.batcher.submit(text)
+        else:
+            future = Future()
+            future.set_result(self.model.encode(text).tolist())
+        
+        if self.query_cache is not None:
+            def _store(done: Future):
+                if not done.cancelled() and done.exception() is None:
+                    self.query_cache.put(text, done.result())
+            future.add_done_callback(_store)
+        
+        return future
     
     def embed_query(self, text):
-        return self.model.encode(text).tolist()
+        return self.submit_query(text).result()
+    
+    def embed_queries(self, texts) -> List[List[float]]:
+        """
+        Embed nhiều câu hỏi cùng lúc (batch API)
+        
+        Câu đã có trong cache lấy từ cache, phần còn lại encode trong 1 lần
+        """
+        results = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            vector = self.query_cache.get(text) if self.query_cache is not None else None
+            if vector is None:
+                missing.append(i)
+            else:
+                results[i] = vector
+        
+        if missing:
+            vectors = self._encode_batch([texts[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                results[i] = vector
+                if self.query_cache is not None:
+                    self.query_cache.put(texts[i], vector)
+        
+        return results
 
 
 # ================================================================
@@ -73,60 +243,329 @@ def format_table(table: list, table_num: int) -> str:
     return "\n".join(lines)
 
 
-def extract_pdf_with_tables(pdf_path: str) -> list:
+def extract_table_texts(page) -> List[str]:
+    """Các bảng (đã format) của 1 trang pdfplumber"""
+    texts = []
+    for table_idx, table in enumerate(page.extract_tables(), 1):
+        if table and len(table) > 1:
+            table_text = format_table(table, table_idx)
+            if table_text:
+                texts.append(table_text)
+    return texts
+
+
+def extract_page_content(page) -> str:
+    """Text thường + bảng (đã format) của 1 trang pdfplumber"""
+    page_content = []
+    
+    # 1. Extract text thường
+    text = page.extract_text()
+    if text:
+        page_content.append(text)
+    
+    # 2. Extract bảng (tables) với format đẹp
+    page_content.extend(extract_table_texts(page))
+    
+    # Gộp content
+    return "\n\n".join(page_content)
+
+
+# Ruling line: path object mỏng (≤ RULE_MAX_THICKNESS) và dài (≥ RULE_MIN_LENGTH), đơn vị pt
+RULE_MAX_THICKNESS = 3.0
+RULE_MIN_LENGTH = 5.0
+
+# Tolerance (pt) khi ghép text pdfium thành dòng / từ - giống mặc định của pdfplumber
+TEXT_Y_TOLERANCE = 3.0
+TEXT_X_TOLERANCE = 3.0
+
+# pypdfium2 không thread-safe (upload song song gọi index_file trên nhiều thread)
+_pdfium_lock = threading.Lock()
+
+
+def has_ruling_lines(page) -> bool:
     """
-    Extract PDF bao gồm bảng với PDFPlumber
+    Trang pdfium có đủ đường kẻ ngang + dọc để có thể chứa bảng không
+
+    Chỉ duyệt path objects (không layout analysis). Với settings mặc định
+    pdfplumber chỉ tìm bảng từ đường kẻ (lines / rects), nên trang không
+    qua được kiểm tra này cũng không có bảng nào bị bỏ sót.
     """
-    docs = []
-    filename = Path(pdf_path).name
-    
+    horizontal = vertical = 0
+    for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_PATH,), max_depth=15):
+        left, bottom, right, top = obj.get_pos()
+        width, height = right - left, top - bottom
+        if height <= RULE_MAX_THICKNESS and width >= RULE_MIN_LENGTH:
+            horizontal += 1
+        elif width <= RULE_MAX_THICKNESS and height >= RULE_MIN_LENGTH:
+            vertical += 1
+        elif width >= RULE_MIN_LENGTH and height >= RULE_MIN_LENGTH:
+            # Rect / lưới vẽ bằng 1 path: tính như 4 cạnh
+            horizontal += 2
+            vertical += 2
+        if horizontal >= 2 and vertical >= 2:
+            return True
+    return False
+
+
+def pdfium_page_text(textpage) -> str:
+    """
+    Text của 1 trang pdfium theo thứ tự đọc (trên → dưới, trái → phải)
+
+    get_text_bounded() trả text theo thứ tự content stream (vd: footer
+    "... Trang N" vẽ ngay sau header → nằm giữa text). Ghép lại từ các
+    đoạn (text rects) theo vị trí, cùng tolerance mặc định của pdfplumber
+    → cùng output với extract_text().
+    """
+    segments = []
+    for i in range(textpage.count_rects()):
+        left, bottom, right, top = textpage.get_rect(i)
+        text = textpage.get_text_bounded(left, bottom, right, top)
+        text = text.replace("\r\n", " ").replace("\r", " ").replace("\n", " ")
+        if text.strip():
+            segments.append((top, bottom, left, right, text))
+
+    # Gom thành dòng: top gần nhau, hoặc chồng nhau > 1/2 chiều cao (ký tự ghép như "<=")
+    segments.sort(key=lambda segment: (-segment[0], segment[2]))
+    lines = []  # [top, bottom, [(left, right, text)]]
+    for top, bottom, left, right, text in segments:
+        if lines:
+            line = lines[-1]
+            overlap = min(line[0], top) - max(line[1], bottom)
+            if (abs(line[0] - top) <= TEXT_Y_TOLERANCE
+                    or overlap > 0.5 * min(line[0] - line[1], top - bottom)):
+                line[1] = min(line[1], bottom)
+                line[2].append((left, right, text))
+                continue
+        lines.append([top, bottom, [(left, right, text)]])
+
+    out = []
+    for _, _, parts in lines:
+        parts.sort()
+        text, previous_right = "", None
+        for left, right, part in parts:
+            if (text and not text[-1].isspace() and not part[0].isspace()
+                    and left - previous_right > TEXT_X_TOLERANCE):
+                text += " "
+            text += part
+            previous_right = right
+        out.append(" ".join(text.split()))
+    return "\n".join(out)
+
+
+def extract_pages_pdfium(pdf_path: str, page_nums: List[int]) -> Tuple[Dict[int, str], int]:
+    """
+    Fast path: text bằng pdfium, extract_tables của pdfplumber chỉ chạy
+    trên trang có đường kẻ (PDF_TABLE_DETECTION)
+
+    Chỉ giữ _pdfium_lock trong lượt pdfium (text + phát hiện đường kẻ);
+    lượt pdfplumber tìm bảng chạy ngoài lock.
+
+    Returns:
+        ({page_num: content}, số trang đã chạy extract_tables)
+    """
+    texts = {}
+    table_candidates = []
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            for page_num in page_nums:
+                page = pdf[page_num - 1]
+                textpage = page.get_textpage()
+                texts[page_num] = pdfium_page_text(textpage)
+                textpage.close()
+                if not settings.PDF_TABLE_DETECTION or has_ruling_lines(page):
+                    table_candidates.append(page_num)
+                page.close()
+        finally:
+            pdf.close()
+
+    tables = {}
+    if table_candidates:
+        # Chỉ mở bằng pdfplumber khi thật sự cần tìm bảng
+        with pdfplumber.open(pdf_path) as plumber:
+            for page_num in table_candidates:
+                plumber_page = plumber.pages[page_num - 1]
+                tables[page_num] = extract_table_texts(plumber_page)
+                plumber_page.close()
+
+    contents = {}
+    for page_num in page_nums:
+        page_content = [texts[page_num]] if texts[page_num].strip() else []
+        page_content.extend(tables.get(page_num, []))
+        contents[page_num] = "\n\n".join(page_content)
+    return contents, len(table_candidates)
+
+
+def extract_pages_pdfplumber(pdf_path: str, page_nums: List[int]) -> Dict[int, str]:
+    """Đường cũ: extract_text + extract_tables của pdfplumber cho mọi trang"""
+    contents = {}
     with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, 1):
-            page_content = []
-            
-            # 1. Extract text thường
-            text = page.extract_text()
-            if text:
-                page_content.append(text)
-            
-            # 2. Extract bảng (tables) với format đẹp
-            tables = page.extract_tables()
-            for table_idx, table in enumerate(tables, 1):
-                if table and len(table) > 1:
-                    table_text = format_table(table, table_idx)
-                    if table_text:
-                        page_content.append(table_text)
-            
-            # Gộp content
-            full_content = "\n\n".join(page_content)
-            
-            if full_content.strip():
-                doc = Document(
-                    page_content=full_content,
-                    metadata={
-                        "source": filename,
-                        "file_type": "pdf",
-                        "page": page_num
-                    }
-                )
-                docs.append(doc)
+        for page_num in page_nums:
+            page = pdf.pages[page_num - 1]
+            contents[page_num] = extract_page_content(page)
+            # Giải phóng cache layout của trang (PDF lớn)
+            page.close()
+    return contents
+
+
+def pdf_extractor_id() -> str:
+    """Định danh cách extract - nằm trong key của page cache"""
+    if settings.PDF_TEXT_ENGINE == "pdfplumber":
+        return "pdfplumber:v1"
+    return f"pdfium:{'gated' if settings.PDF_TABLE_DETECTION else 'all'}:v2"
+
+
+_page_cache = None
+
+
+def pdf_page_cache() -> Optional[PdfPageCache]:
+    """Page cache của process hiện tại (mỗi worker process mở connection riêng)"""
+    global _page_cache
+    if not settings.PDF_PAGE_CACHE_PATH:
+        return None
+    if _page_cache is None or _page_cache.path != settings.PDF_PAGE_CACHE_PATH:
+        _page_cache = PdfPageCache(settings.PDF_PAGE_CACHE_PATH)
+    return _page_cache
+
+
+def extract_pdf_pages(pdf_path: str, start: int, end: int,
+                      file_hash: Optional[str] = None) -> Tuple[List[Tuple[int, str]], float]:
+    """
+    Extract trang [start, end) của 1 PDF (đơn vị công việc của process pool)
+
+    end phải ≤ số trang. Có file_hash thì trang đã có trong page cache
+    không phải mở PDF nữa.
+
+    Returns:
+        ([(page_num, content)], giây xử lý) - page_num bắt đầu từ 1
+    """
+    started = time.perf_counter()
+    page_nums = list(range(start + 1, end + 1))
+    
+    extractor = pdf_extractor_id()
+    cache = pdf_page_cache() if file_hash else None
+    contents = cache.get_many(file_hash, page_nums, extractor) if cache is not None else {}
+    
+    missing = [page_num for page_num in page_nums if page_num not in contents]
+    if missing:
+        if settings.PDF_TEXT_ENGINE == "pdfplumber":
+            extracted = extract_pages_pdfplumber(pdf_path, missing)
+        else:
+            extracted, _ = extract_pages_pdfium(pdf_path, missing)
+        if cache is not None:
+            cache.put_many(file_hash, extracted, extractor)
+        contents.update(extracted)
     
-    return docs
+    pages = [(page_num, contents[page_num]) for page_num in page_nums]
+    return pages, time.perf_counter() - started
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+
+def pages_to_documents(pages: List[Tuple[int, str]], filename: str) -> list:
+    """[(page_num, content)] → Document (bỏ trang trống)"""
+    return [
+        Document(
+            page_content=content,
+            metadata={
+                "source": filename,
+                "file_type": "pdf",
+                "page": page_num
+            }
+        )
+        for page_num, content in pages
+        if content.strip()
+    ]
+
+
+def extract_pdf_with_tables(pdf_path: str) -> list:
+    """
+    Extract PDF bao gồm bảng với PDFPlumber
+    """
+    pages, _ = extract_pdf_pages(pdf_path, 0, pdf_page_count(pdf_path), file_sha256(pdf_path))
+    return pages_to_documents(pages, Path(pdf_path).name)
 
 
 # ================================================================
 # DOCUMENT LOADING
 # ================================================================
 
-def load_documents(data_dir: str):
+SUPPORTED_EXTENSIONS = ('.pdf', '.md', '.txt')
+
+
+def list_source_files(data_dir: str) -> List[str]:
+    """Tên các file được hỗ trợ trong data_dir (sorted)"""
+    if not os.path.isdir(data_dir):
+        return []
+    return [
+        file for file in sorted(os.listdir(data_dir))
+        if file.endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(os.path.join(data_dir, file))
+    ]
+
+
+def load_file(path: str) -> list:
     """
-    Load tất cả documents: .pdf, .md, .txt
+    Load 1 file (.pdf, .md, .txt) thành list Document
+
+    Raises:
+        ValueError: định dạng không hỗ trợ
+    """
+    file = os.path.basename(path)
+
+    # ==================== PDF (với table support) ====================
+    if file.endswith('.pdf'):
+        return extract_pdf_with_tables(path)
+
+    # ==================== MARKDOWN & TEXT ====================
+    if file.endswith(('.md', '.txt')):
+        loader = TextLoader(path, encoding="utf-8")
+        loaded_docs = loader.load()
+
+        for doc in loaded_docs:
+            doc.metadata["source"] = file
+            doc.metadata["file_type"] = "markdown" if file.endswith('.md') else "text"
+
+        return loaded_docs
+
+    raise ValueError(f"Unsupported format: {file}")
+
+
+def ingest_workers() -> int:
+    return settings.INGEST_WORKERS or os.cpu_count() or 1
+
+
+def iter_documents(data_dir: str, workers: Optional[int] = None,
+                   progress: Optional[dict] = None,
+                   failed: Optional[set] = None) -> Iterator[Tuple[str, list]]:
+    """
+    Extract documents theo kiểu streaming: yield (file, docs)
+
+    PDF được chia thành các đoạn INGEST_PAGES_PER_TASK trang và extract song
+    song trên process pool (pdfplumber chỉ chạy 1 core). Tối đa 2 × workers
+    task đang chạy cùng lúc. Kết quả luôn theo thứ tự file → trang, không
+    phụ thuộc worker nào xong trước. Docs của 1 file chỉ được yield khi mọi
+    đoạn trang của file đều extract xong → file lỗi giữa chừng (PDF hỏng...)
+    không bao giờ được index 1 nửa, chỉ bị bỏ qua, không dừng cả lần ingest.
+
+    progress: nếu có, cập nhật files_done / pages
+    failed: nếu có, thêm tên các file bị lỗi (để không ghi vào manifest)
     """
-    docs = []
+    workers = workers or ingest_workers()
+    load_started = time.perf_counter()
+    progress = progress if progress is not None else {}
+    failed = failed if failed is not None else set()
     
-    print(f"Source: {data_dir}")
+    print(f"Source: {data_dir} ({workers} workers)")
     print()
     
+    files = []
     for file in sorted(os.listdir(data_dir)):
         path = os.path.join(data_dir, file)
         
@@ -134,117 +573,755 @@ def load_documents(data_dir: str):
         if os.path.isdir(path):
             continue
         
-        try:
-            # ==================== PDF (với table support) ====================
-            if file.endswith('.pdf'):
-                loaded_docs = extract_pdf_with_tables(path)
-                docs.extend(loaded_docs)
-                print(f" {file} ({len(loaded_docs)} pages, tables extracted)")
+        if not file.endswith(SUPPORTED_EXTENSIONS):
+            print(f" Skipped: {file} (unsupported format)")
+            continue
+        files.append(file)
+    
+    def iter_tasks():
+        """(file, path, start, end, file_hash, last) - start None = file text/markdown"""
+        for file in files:
+            path = os.path.join(data_dir, file)
+            if not file.endswith('.pdf'):
+                yield file, path, None, None, None, True
+                continue
+            try:
+                page_count = pdf_page_count(path)
+                file_hash = file_sha256(path) if settings.PDF_PAGE_CACHE_PATH else None
+            except Exception as e:
+                print(f"Error: {file} - {e}")
+                failed.add(file)
+                progress["files_done"] = progress.get("files_done", 0) + 1
+                continue
+            starts = range(0, page_count, settings.INGEST_PAGES_PER_TASK)
+            for start in starts:
+                end = min(start + settings.INGEST_PAGES_PER_TASK, page_count)
+                yield file, path, start, end, file_hash, start == starts[-1]
+    
+    # spawn: an toàn khi gọi từ API server (process đã có threads / torch)
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    
+    tasks = iter_tasks()
+    pending = deque()
+    
+    def submit_next() -> bool:
+        task = next(tasks, None)
+        if task is None:
+            return False
+        file, path, start, end, file_hash, _ = task
+        future = None
+        if pool is not None and start is not None:
+            future = pool.submit(extract_pdf_pages, path, start, end, file_hash)
+        pending.append((task, future))
+        return True
+    
+    elapsed = {}
+    buffered = {}
+    try:
+        while len(pending) < 2 * workers and submit_next():
+            pass
+        
+        while pending:
+            (file, path, start, end, file_hash, last), future = pending.popleft()
+            submit_next()
+            if file in failed:
+                continue
             
-            # ==================== MARKDOWN & TEXT ====================
-            elif file.endswith(('.md', '.txt')):
-                loader = TextLoader(path, encoding="utf-8")
-                loaded_docs = loader.load()
-                
-                for doc in loaded_docs:
-                    doc.metadata["source"] = file
-                    doc.metadata["file_type"] = "markdown" if file.endswith('.md') else "text"
-                
-                docs.extend(loaded_docs)
-                print(f" {file}")
+            try:
+                if start is None:
+                    started = time.perf_counter()
+                    docs = load_file(path)
+                    took = time.perf_counter() - started
+                else:
+                    extracted, took = (
+                        future.result() if future is not None
+                        else extract_pdf_pages(path, start, end, file_hash)
+                    )
+                    docs = pages_to_documents(extracted, file)
+            except Exception as e:
+                print(f"Error: {file} - {e}")
+                failed.add(file)
+                buffered.pop(file, None)
+                progress["files_done"] = progress.get("files_done", 0) + 1
+                continue
             
-            else:
-                print(f" Skipped: {file} (unsupported format)")
-                
-        except Exception as e:
-            print(f"Error: {file} - {e}")
+            elapsed[file] = elapsed.get(file, 0.0) + took
+            buffered.setdefault(file, []).extend(docs)
+            progress["pages"] = progress.get("pages", 0) + len(docs)
+            if last:
+                docs = buffered.pop(file)
+                progress["files_done"] = progress.get("files_done", 0) + 1
+                if start is None:
+                    print(f" {file} ({elapsed[file]:.2f}s)")
+                else:
+                    print(f" {file} ({len(docs)} pages, {elapsed[file]:.2f}s)")
+                yield file, docs
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
     
-    return docs
+    print(f"\n Extracted {len(elapsed)} files in {time.perf_counter() - load_started:.2f}s")
+
+
+def load_documents(data_dir: str, workers: Optional[int] = None):
+    """
+    Load tất cả documents: .pdf, .md, .txt
+    """
+    return [doc for _, docs in iter_documents(data_dir, workers) for doc in docs]
 
 
 # ================================================================
-# QDRANT INDEX BUILDING
+# CHUNKING
 # ================================================================
-def build_index():
-    # 1.Load data
-    docs = load_documents(settings.DATA_DIR)
-    if not docs:
-        print("\n No documents found")
-        return
-    print(f"\n Total loaded: {len(docs)} documents")
-    # 2. Chunking
-    print("\n Chunking...")
+
+def chunk_documents(docs: list, counters: Optional[Dict[str, int]] = None) -> list:
+    """
+    Chia documents thành chunks và gán chunk_id
+
+    counters: chunk_id tiếp theo của mỗi source - truyền vào khi chunk 1 file
+    thành nhiều phần (streaming) để chunk_id vẫn liên tục
+    """
     splitter = RecursiveCharacterTextSplitter(
         chunk_size = settings.CHUNK_SIZE,
         chunk_overlap = settings.CHUNK_OVERLAP,
         separators = ["\n\n", "\n", ".", "!", "?", ",", " ", ""] #ngắt 
     )
     chunks = splitter.split_documents(docs)
-    # Thêm chunk_id vào metadata
-    for i, chunk in enumerate(chunks):
-        chunk.metadata["chunk_id"] = i
-    # 3. Create embeddings
-    print("\n Creating embeddings...")
-    embeddings = LocalEmbedding()
-    texts = [chunk.page_content for chunk in chunks]
-    vectors = embeddings.embed_documents(texts)
-    # 4. Connect to Qdrant
-    print("\n Connecting to Qdrant...")
-    client = QdrantClient(url = settings.QDRANT_URL)
-    # 5. Xóa cũ nếu có
-    collection_name = settings.QDRANT_COLLECTION_NAME
-    # Xóa collection cũ nếu đã tồn tại
-    try:
-        client.delete_collection(collection_name)
-        print(f" Xóa collection cũ: {collection_name}")
-    except:
-        pass
-    #Tạo collection mới
-    client.create_collection(
-        collection_name = collection_name,
-        vectors_config = VectorParams(
-            size = embeddings.dimension,
-            distance = Distance.COSINE
-        )
-    )
-    print(f" Tạo collection: {collection_name}")
+    # chunk_id đánh số riêng trong từng file → không đổi khi file khác thay đổi
+    counters = {} if counters is None else counters
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "unknown")
+        chunk.metadata["chunk_id"] = counters.get(source, 0)
+        counters[source] = chunk.metadata["chunk_id"] + 1
+    return chunks
+
+
+# ================================================================
+# DETERMINISTIC POINTS + MANIFEST
+# ================================================================
+
+# Namespace cố định cho uuid5 (point id phải giống nhau giữa các lần ingest)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a8e-3b4d-5e6f-8a9b-0c1d2e3f4a5b")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id_for(source: str, content_hash: str, occurrence: int = 0) -> str:
+    """
+    Point id = uuid5(source, hash nội dung chunk)
+
+    Chunk không đổi → id không đổi → upsert lại chỉ ghi đè, không tạo trùng.
+    occurrence phân biệt các chunk có nội dung giống hệt nhau trong cùng file.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}:{content_hash}:{occurrence}"))
 
-    # 6.Upload vectors
-    print("\n Uploading to Qdrant...")
+
+def build_points(chunks: list, vectors: list, seen: Optional[dict] = None) -> List[PointStruct]:
+    """
+    Chunks + dense vectors → PointStruct (dense + sparse, id deterministic)
+
+    seen: số lần đã gặp (source, hash) - truyền vào khi build theo nhiều window
+    """
     points = [] #trong Qdrant là Point = [id, vector, payload]
-    for i, (chunk, vector) in enumerate(zip(chunks, vectors)):
+    seen = {} if seen is None else seen
+    for chunk, vector in zip(chunks, vectors):
+        source = chunk.metadata.get("source", "unknown")
+        content_hash = text_hash(chunk.page_content)
+        occurrence = seen.get((source, content_hash), 0)
+        seen[(source, content_hash)] = occurrence + 1
+
+        sparse_indices, sparse_values = encode_sparse(chunk.page_content)
         point = PointStruct(
-            id = str(uuid.uuid4()),
-            vector = vector,
+            id = point_id_for(source, content_hash, occurrence),
+            vector = {
+                settings.DENSE_VECTOR_NAME: vector,
+                settings.SPARSE_VECTOR_NAME: SparseVector(
+                    indices = sparse_indices,
+                    values = sparse_values
+                )
+            },
             payload = {
                 "content": chunk.page_content,
-                "source": chunk.metadata.get("source", "unknown"),
+                "source": source,
                 "file_type": chunk.metadata.get("file_type", "unknown"),
                 "page": chunk.metadata.get("page", 0), 
-                "chunk_id": chunk.metadata.get("chunk_id", i)
+                "chunk_id": chunk.metadata.get("chunk_id", 0)
             }
         )
         points.append(point)
-    
-    # Upload theo batch
-    batch_size = 100
-    for i in range(0, len(points), batch_size):
-        batch = points[i:i + batch_size]
-        client.upsert(
+    return points
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_config() -> dict:
+    """Các settings ảnh hưởng tới points - đổi bất kỳ cái nào → phải full rebuild"""
+    return {
+        "embedding_model": embedding_model_id(),
+        "embedding_dim": settings.EMBEDDING_DIM,
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP
+    }
+
+
+def load_manifest(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    """Ghi file tạm rồi rename (không để lại manifest ghi dở)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def scan_file(data_dir: str, file: str, previous: Optional[dict] = None) -> dict:
+    """
+    Manifest entry (sha256, size, mtime_ns) của 1 file
+
+    File có size + mtime giống entry cũ thì dùng lại hash cũ (không đọc file)
+    """
+    path = os.path.join(data_dir, file)
+    stat = os.stat(path)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        sha256 = previous["sha256"]
+    else:
+        sha256 = file_sha256(path)
+    return {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def scan_files(data_dir: str, previous: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """Hash nội dung các file trong data_dir (xem scan_file)"""
+    previous = previous or {}
+    return {file: scan_file(data_dir, file, previous.get(file)) for file in list_source_files(data_dir)}
+
+
+# Manifest + points của 1 file chỉ được sửa bởi 1 thao tác tại 1 thời điểm
+# (update_index, upload / xóa document)
+_manifest_lock = threading.Lock()
+
+
+def index_source(client, collection_name: str, file: str, embeddings) -> Tuple[int, int, List[PointStruct]]:
+    """
+    Extract → chunk → embed → upsert 1 file vào collection
+
+    Upsert xong mới xóa points cũ không còn trong version mới của file
+    → file không bao giờ biến mất khỏi search trong lúc cập nhật.
+
+    Returns:
+        (pages, chunks, points đã upsert)
+    """
+    docs = load_file(os.path.join(settings.DATA_DIR, file))
+    chunks = chunk_documents(docs)
+    vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks]) if chunks else []
+    points = build_points(chunks, vectors)
+
+    for i in range(0, len(points), 100):
+        client.upsert(collection_name = collection_name, points = points[i:i + 100], wait = True)
+    delete_source_points(client, collection_name, file, keep_ids = [point.id for point in points])
+    return len(docs), len(chunks), points
+
+
+def update_manifest_entry(client, file: str, points: Optional[int]) -> None:
+    """
+    Ghi nhận 1 file vừa được index (points=None: vừa bị xóa) vào manifest
+
+    Bỏ qua nếu manifest không còn khớp index hiện tại (update_index sẽ full rebuild)
+    """
+    manifest = load_manifest(settings.INGEST_MANIFEST_PATH)
+    if manifest is None or manifest.get("config") != manifest_config():
+        return
+    if resolve_alias(client, settings.QDRANT_COLLECTION_NAME) != manifest.get("collection"):
+        return
+
+    if points is None:
+        manifest["files"].pop(file, None)
+    else:
+        # Chỉ hash file vừa index, không scan lại cả corpus
+        if not os.path.isfile(os.path.join(settings.DATA_DIR, file)):
+            return
+        entry = scan_file(settings.DATA_DIR, file, manifest["files"].get(file))
+        manifest["files"][file] = {**entry, "points": points}
+    save_manifest(settings.INGEST_MANIFEST_PATH, manifest)
+
+
+def finish_corpus_change(client, collection_name: str, file: Optional[str] = None,
+                         points: Optional[List[PointStruct]] = None) -> None:
+    """
+    Sau khi points thay đổi: cập nhật NumPy index (nếu dùng) + invalidate answer cache
+
+    file: chỉ file này thay đổi (points = points mới của file, [] = đã xóa)
+    → thay các row của file trong NumPy index đang có, không scroll lại Qdrant.
+    file=None (nhiều file thay đổi): export lại toàn bộ từ Qdrant.
+    """
+    if settings.RETRIEVAL_BACKEND == "numpy":
+        if file is not None and os.path.isdir(settings.NUMPY_INDEX_DIR):
+            count = replace_source_rows(
+                settings.NUMPY_INDEX_DIR, file,
+                [point.vector[settings.DENSE_VECTOR_NAME] for point in points or []],
+                [{**point.payload, "point_id": point.id} for point in points or []],
+                dtype = settings.NUMPY_INDEX_DTYPE
+            )
+        else:
+            count = export_numpy_index(client, collection_name)
+        print(f" → NumPy index: {count} vectors → {settings.NUMPY_INDEX_DIR}")
+    mark_index_updated(settings.INDEX_VERSION_FILE)
+
+
+def index_file(filename: str, embeddings: Optional[LocalEmbedding] = None, client = None) -> dict:
+    """
+    Index 1 file trong DATA_DIR vào collection đang chạy (qua alias)
+
+    Chi phí tỉ lệ với kích thước file, không phải cả corpus. Upload lại file
+    cùng tên: chunk không đổi giữ nguyên point, chunk cũ bị xóa.
+
+    Returns:
+        Thống kê: filename, pages, chunks, points, seconds
+    """
+    alias = settings.QDRANT_COLLECTION_NAME
+    client = client or create_qdrant_client()
+    embeddings = embeddings or LocalEmbedding()
+
+    with _manifest_lock:
+        started = time.perf_counter()
+        pages, chunks, points = index_source(client, alias, filename, embeddings)
+        update_manifest_entry(client, filename, len(points))
+        finish_corpus_change(client, alias, filename, points)
+        elapsed = time.perf_counter() - started
+
+    print(f" Indexed {filename}: {pages} pages, {chunks} chunks, {len(points)} points ({elapsed:.2f}s)")
+    return {
+        "filename": filename,
+        "pages": pages,
+        "chunks": chunks,
+        "points": len(points),
+        "seconds": round(elapsed, 2)
+    }
+
+
+def unindex_file(filename: str, client = None) -> None:
+    """Xóa toàn bộ points của 1 file khỏi collection đang chạy (filter theo source)"""
+    alias = settings.QDRANT_COLLECTION_NAME
+    client = client or create_qdrant_client()
+
+    with _manifest_lock:
+        delete_source_points(client, alias, filename)
+        update_manifest_entry(client, filename, None)
+        finish_corpus_change(client, alias, filename, [])
+    print(f" Unindexed {filename}")
+
+
+def export_numpy_index(client, collection_name: str) -> int:
+    """Ghi lại NumPy index từ toàn bộ points hiện có trong Qdrant"""
+    vectors, payloads = [], []
+    offset = None
+    while True:
+        records, offset = client.scroll(
             collection_name = collection_name,
-            points = batch
+            limit = 1000,
+            offset = offset,
+            with_payload = True,
+            with_vectors = [settings.DENSE_VECTOR_NAME]
         )
-        print(f" → Uploaded {min(i + batch_size, len(points))}/{len(points)} points")
-    # 7. Verify
-    collection_info = client.get_collection(collection_name)
+        for record in records:
+            vectors.append(record.vector[settings.DENSE_VECTOR_NAME])
+            payloads.append({**record.payload, "point_id": record.id})
+        if offset is None:
+            break
+    return write_numpy_index(
+        settings.NUMPY_INDEX_DIR, vectors, payloads,
+        dtype = settings.NUMPY_INDEX_DTYPE, dim = settings.EMBEDDING_DIM
+    )
+
+
+# ================================================================
+# QDRANT INDEX BUILDING
+# ================================================================
+def chunk_store_usage(embeddings: LocalEmbedding, before: Optional[dict]) -> Optional[dict]:
+    """Hit / miss của chunk embedding store trong lần ingest này"""
+    if embeddings.chunk_store is None:
+        return None
+    after = embeddings.chunk_store.stats()
+    before = before or {"hits": 0, "misses": 0}
+    return {
+        "hits": after["hits"] - before["hits"],
+        "misses": after["misses"] - before["misses"],
+        "entries": after["entries"]
+    }
+
+
+def verify_collection(client, collection_name: str, expected_count: int,
+                      probe: Optional[PointStruct]) -> None:
+    """
+    Kiểm tra collection mới trước khi chuyển alias
+
+    - Số points khớp với số chunks đã upload
+    - Smoke query: vector của point đầu tiên phải tìm lại được chính nó
+
+    Raises:
+        RuntimeError: collection chưa sẵn sàng để phục vụ
+    """
+    count = client.count(collection_name = collection_name, exact = True).count
+    if count != expected_count:
+        raise RuntimeError(f"Point count mismatch in {collection_name}: {count} != {expected_count}")
+
+    if probe is None:
+        return
+    result = client.query_points(
+        collection_name = collection_name,
+        query = probe.vector[settings.DENSE_VECTOR_NAME],
+        using = settings.DENSE_VECTOR_NAME,
+        limit = 5,
+        with_payload = False
+    )
+    if not any(str(hit.id) == str(probe.id) for hit in result.points):
+        raise RuntimeError(f"Smoke query failed on {collection_name}")
+    print(f" ✓ Verified {collection_name}: {count} points, smoke query OK")
+
+
+def build_index(
+    embeddings: Optional[LocalEmbedding] = None,
+    progress: Optional[dict] = None,
+    stop: Optional[threading.Event] = None
+) -> dict:
+    """
+    Full rebuild: extract → chunk → embed → upsert dạng streaming
+
+    Mỗi stage chạy trên 1 thread, nối nhau bằng queue giới hạn
+    (INGEST_QUEUE_SIZE) → các stage chạy chồng lên nhau và RAM không tăng
+    theo kích thước corpus (không giữ toàn bộ documents / vectors / points).
+
+    Args:
+        embeddings: model đã load sẵn (API dùng lại model của rag_engine)
+        progress: dict được cập nhật trong lúc chạy (stage, files, pages,
+            chunks, points_uploaded) - dùng cho background job
+        stop: set để hủy; collection đang build bị xóa, alias giữ nguyên
+
+    Returns:
+        Thống kê: collection, points, seconds, stages
+
+    Raises:
+        PipelineStopped: bị hủy trước khi chuyển alias
+    """
+    progress = progress if progress is not None else {}
+    
+    # Hash trước khi đọc → file sửa trong lúc build sẽ được update lần sau
+    files = scan_files(settings.DATA_DIR)
+    progress.update(stage = "extract", files_total = len(files), files_done = 0,
+                    pages = 0, chunks = 0, points_uploaded = 0)
+    if not files:
+        print("\n No documents found")
+        return {"full_rebuild": True, "points": 0}
+    
+    embeddings = embeddings or LocalEmbedding()
+    store_before = embeddings.chunk_store.stats() if embeddings.chunk_store is not None else None
+    
+    # 1. Connect to Qdrant
+    print("\n Connecting to Qdrant...")
+    client = create_qdrant_client()
+    # 2. Blue/green: build vào collection version mới, alias vẫn trỏ bản cũ
+    #    → /chat không bao giờ thấy collection trống / đang upload dở
+    alias = settings.QDRANT_COLLECTION_NAME
+    collection_name = new_version_name(alias)
+    client.create_collection(
+        collection_name = collection_name,
+        # Dense: quantization / on_disk / HNSW theo settings
+        vectors_config = {
+            settings.DENSE_VECTOR_NAME: dense_vector_params(embeddings.dimension)
+        },
+        # Sparse lexical vector, IDF tính phía server (hybrid search)
+        sparse_vectors_config = {
+            settings.SPARSE_VECTOR_NAME: SparseVectorParams(modifier = Modifier.IDF)
+        },
+        on_disk_payload = settings.QDRANT_PAYLOAD_ON_DISK
+    )
+    print(f" Tạo collection: {collection_name}")
+    # Payload indexes cho metadata filter (source, file_type, page)
+    create_payload_indexes(client, collection_name)
+    print(f" Storage: {storage_settings()}")
+
+    # 3. Pipeline: extract → chunk → embed → upsert
+    print("\n Extract → chunk → embed → upload...")
+    points_per_source = {}
+    failed_files = set()
+    uploaded = {"count": 0, "probe": None}
+
+    def chunk_stage(parts):
+        counters = {}
+        for _, docs in parts:
+            chunks = chunk_documents(docs, counters)
+            progress["chunks"] += len(chunks)
+            if chunks:
+                yield chunks
+
+    def embed_stage(chunk_lists):
+        seen = {}
+        window = []
+        for chunks in chunk_lists:
+            window.extend(chunks)
+            while len(window) >= settings.INGEST_EMBED_WINDOW:
+                batch, window = window[:settings.INGEST_EMBED_WINDOW], window[settings.INGEST_EMBED_WINDOW:]
+                vectors = embeddings.embed_documents([c.page_content for c in batch], show_progress = False)
+                yield build_points(batch, vectors, seen)
+        if window:
+            vectors = embeddings.embed_documents([c.page_content for c in window], show_progress = False)
+            yield build_points(window, vectors, seen)
+
+    def upsert_stage(point_lists):
+        # Upload theo batch
+        batch_size = 100
+        for points in point_lists:
+            for i in range(0, len(points), batch_size):
+                client.upsert(
+                    collection_name = collection_name,
+                    points = points[i:i + batch_size],
+                    wait = True
+                )
+            for point in points:
+                source = point.payload["source"]
+                points_per_source[source] = points_per_source.get(source, 0) + 1
+            if uploaded["probe"] is None:
+                uploaded["probe"] = points[0]
+            uploaded["count"] += len(points)
+            progress["points_uploaded"] = uploaded["count"]
+            print(f" → Uploaded {uploaded['count']} points")
+            yield points
+
+    stages = [
+        Stage("extract", lambda parts: parts, unit = "pages", size = lambda part: len(part[1])),
+        Stage("chunk", chunk_stage, unit = "chunks", size = len),
+        Stage("embed", embed_stage, unit = "chunks", size = len),
+        Stage("upsert", upsert_stage, unit = "points", size = len)
+    ]
+    pipeline_started = time.perf_counter()
+    try:
+        run_pipeline(
+            iter_documents(settings.DATA_DIR, progress = progress, failed = failed_files),
+            stages,
+            queue_size = settings.INGEST_QUEUE_SIZE,
+            stop = stop
+        )
+        if uploaded["count"] == 0:
+            raise RuntimeError("No chunks produced from documents")
+
+        # 4. Verify trước khi chuyển traffic
+        progress["stage"] = "verify"
+        verify_collection(client, collection_name, uploaded["count"], uploaded["probe"])
+        if stop is not None and stop.is_set():
+            raise PipelineStopped()
+    except Exception:
+        # Build lỗi → xóa version dở, alias vẫn giữ bản đang chạy
+        client.delete_collection(collection_name)
+        raise
+    pipeline_seconds = time.perf_counter() - pipeline_started
+
+    # 5. Chuyển alias (atomic) rồi dọn các version cũ
+    progress["stage"] = "switch_alias"
+    previous = switch_alias(client, alias, collection_name)
+    print(f" Alias {alias}: {previous or '-'} → {collection_name}")
+    removed = garbage_collect_versions(client, alias, keep = settings.QDRANT_KEEP_OLD_VERSIONS)
+    if removed:
+        print(f" Xóa version cũ: {', '.join(removed)}")
+
+    # 6. NumPy exact-search index (RETRIEVAL_BACKEND="numpy")
+    if settings.RETRIEVAL_BACKEND == "numpy":
+        count = export_numpy_index(client, collection_name)
+        print(f" → NumPy index: {count} vectors ({settings.NUMPY_INDEX_DTYPE}) → {settings.NUMPY_INDEX_DIR}")
+    
+    collection_info = client.get_collection(alias)
+    
+    # Manifest cho incremental ingest (update_index)
+    # File lỗi không vào manifest → lần update sau coi là file mới, thử lại
+    for source in failed_files:
+        files.pop(source, None)
+    for source, entry in files.items():
+        entry["points"] = points_per_source.get(source, 0)
+    save_manifest(settings.INGEST_MANIFEST_PATH, {
+        "config": manifest_config(),
+        "collection": collection_name,
+        "files": files
+    })
+    
+    # Page cache: bỏ trang của các file không còn trong corpus
+    page_cache = pdf_page_cache()
+    if page_cache is not None:
+        pruned = page_cache.prune([entry["sha256"] for entry in files.values()])
+        if pruned:
+            print(f" PDF page cache: xóa {pruned} trang của file cũ")
+    
+    # Đánh dấu corpus đã thay đổi → semantic answer cache bị invalidate
+    mark_index_updated(settings.INDEX_VERSION_FILE)
     print("\n" + "=" * 60)
     print(" QDRANT INDEX BUILT SUCCESSFULLY!")
-    print(f" Collection: {collection_name}")
+    print(f" Collection: {alias} → {collection_name}")
     print(f" Total vectors: {collection_info.points_count}")
+    print(f" Pipeline: {pipeline_seconds:.1f}s")
+    print(format_stats(stages))
+    store_usage = chunk_store_usage(embeddings, store_before)
+    if store_usage is not None:
+        print(f" Embedding store: {store_usage['hits']} hits, {store_usage['misses']} misses "
+              f"({store_usage['entries']} chunks stored)")
+    if failed_files:
+        print(f" Failed (not indexed): {', '.join(sorted(failed_files))}")
     print(f" Qdrant URL: {settings.QDRANT_URL}")
     print(f" Dashboard: http://localhost:6333/dashboard")
     print("=" * 60)
+    progress["stage"] = "done"
+    
+    return {
+        "full_rebuild": True,
+        "collection": collection_name,
+        "points": collection_info.points_count,
+        "seconds": round(pipeline_seconds, 2),
+        "stages": [stage.stats() for stage in stages],
+        "embedding_store": store_usage,
+        "failed": sorted(failed_files)
+    }
+
+
+
+def update_index(
+    embeddings: Optional[LocalEmbedding] = None,
+    progress: Optional[dict] = None,
+    stop: Optional[threading.Event] = None
+) -> dict:
+    """
+    Incremental ingest: chỉ xử lý file mới / đã sửa / đã xóa so với manifest
+
+    - File mới / đã sửa: extract → chunk → embed → upsert (id deterministic:
+      chunk không đổi thì ghi đè chính nó), rồi xóa points cũ không còn
+    - File đã xóa: xóa points theo filter source
+    - Chưa có manifest, settings chunk/embedding đổi, hoặc alias đã trỏ sang
+      collection khác → full rebuild (build_index)
+
+    Args: như build_index. Hủy giữa chừng: các file đã xử lý được giữ lại
+    (manifest ghi nhận), các file còn lại được xử lý ở lần update sau.
+
+    Returns:
+        Thống kê: added, changed, removed, unchanged, points_upserted
+    """
+    progress = progress if progress is not None else {}
+    alias = settings.QDRANT_COLLECTION_NAME
+    client = create_qdrant_client()
+
+    with _manifest_lock:
+        manifest = load_manifest(settings.INGEST_MANIFEST_PATH)
+
+        reason = None
+        if manifest is None:
+            reason = "chưa có manifest"
+        elif manifest.get("config") != manifest_config():
+            reason = "settings chunk/embedding đã thay đổi"
+        elif resolve_alias(client, alias) != manifest.get("collection"):
+            reason = "collection không khớp manifest"
+        if not reason:
+            return _apply_changes(client, alias, manifest, embeddings, progress, stop)
+
+    print(f" Full rebuild ({reason})")
+    summary = build_index(embeddings, progress, stop)
+    return {**summary, "reason": reason}
+
+
+def _apply_changes(client, alias: str, manifest: dict, embeddings, progress: dict,
+                   stop: Optional[threading.Event]) -> dict:
+    """Phần incremental của update_index (đã giữ _manifest_lock)"""
+    old_files = manifest["files"]
+    files = scan_files(settings.DATA_DIR, old_files)
+
+    added = [f for f in files if f not in old_files]
+    changed = [f for f in files if f in old_files and files[f]["sha256"] != old_files[f]["sha256"]]
+    removed = [f for f in old_files if f not in files]
+    for f in files:
+        if f not in added and f not in changed:
+            files[f]["points"] = old_files[f].get("points", 0)
+
+    print(f" Added: {len(added)}, changed: {len(changed)}, removed: {len(removed)}, "
+          f"unchanged: {len(files) - len(added) - len(changed)}")
+
+    store_before = None
+    if added or changed:
+        embeddings = embeddings or LocalEmbedding()
+        store_before = embeddings.chunk_store.stats() if embeddings.chunk_store is not None else None
+    points_upserted = 0
+    progress.update(stage = "update", files_total = len(added) + len(changed) + len(removed),
+                    files_done = 0, pages = 0, chunks = 0, points_uploaded = 0)
+
+    pending = added + changed
+    cancelled = False
+    for idx, file in enumerate(pending):
+        if stop is not None and stop.is_set():
+            # Hủy: file chưa xử lý giữ entry cũ trong manifest → lần sau làm tiếp
+            cancelled = True
+            for rest in pending[idx:]:
+                files.pop(rest)
+                if rest in old_files:
+                    files[rest] = old_files[rest]
+            break
+        try:
+            pages, chunks, upserted = index_source(client, alias, file, embeddings)
+            points = len(upserted)
+        except Exception as e:
+            # Giữ points cũ, lần update sau thử lại
+            print(f"Error: {file} - {e}")
+            files.pop(file)
+            if file in old_files:
+                files[file] = old_files[file]
+            progress["files_done"] += 1
+            continue
+
+        files[file]["points"] = points
+        points_upserted += points
+        progress["files_done"] += 1
+        progress["pages"] += pages
+        progress["chunks"] += chunks
+        progress["points_uploaded"] = points_upserted
+        print(f" → {file}: {points} points")
+
+    for file in removed:
+        if cancelled:
+            files[file] = old_files[file]
+            continue
+        delete_source_points(client, alias, file)
+        progress["files_done"] += 1
+        print(f" → {file}: removed")
+
+    if added or changed or removed:
+        finish_corpus_change(client, alias)
+
+    manifest["files"] = files
+    save_manifest(settings.INGEST_MANIFEST_PATH, manifest)
+    if cancelled:
+        raise PipelineStopped()
+    progress["stage"] = "done"
 
+    return {
+        "full_rebuild": False,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "unchanged": len(files) - len(added) - len(changed),
+        "points_upserted": points_upserted,
+        "embedding_store": chunk_store_usage(embeddings, store_before) if embeddings is not None else None
+    }
 
 
 # def build_index():
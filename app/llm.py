@@ -3,7 +3,7 @@
 # rag.py     → tìm đoạn liên quan
 # llm.py     → viết câu trả lời
 import httpx
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 from app.config import settings
 
@@ -18,6 +18,30 @@ client = OpenAI(
     http_client=http_client
 )
 
+# Prefix của message lỗi (call_llm không raise, trả về message lỗi)
+LLM_ERROR_PREFIX = "Lỗi khi gọi LLM"
+
+
+class LLMStreamError(Exception):
+    """Stream LLM lỗi giữa chừng (message đã có LLM_ERROR_PREFIX)"""
+
+# Async client cho API path (không block event loop)
+async_http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(60.0, connect=10.0)
+)
+
+async_client = AsyncOpenAI(
+    api_key=settings.OPENROUTER_API_KEY,
+    base_url=settings.OPENROUTER_BASE_URL,
+    http_client=async_http_client
+)
+
+
+def clean_answer(answer: str) -> str:
+    """Loại bỏ special tokens khỏi câu trả lời của LLM"""
+    return answer.replace("[/s]", "").replace("</s>", "").replace("[/INST]", "").replace("[INST]", "").strip()
+
+
 def call_llm(prompt: str) -> str:
     """
     Gọi LLM với prompt đã được xây dựng sẵn
@@ -38,11 +62,67 @@ def call_llm(prompt: str) -> str:
         # Lấy response và loại bỏ special tokens
         answer = response.choices[0].message.content
         # Strip các special tokens
-        answer = answer.replace("[/s]", "").replace("</s>", "").replace("[/INST]", "").replace("[INST]", "").strip()
-        return answer
+        return clean_answer(answer)
         
     except Exception as e:
-        return f"Lỗi khi gọi LLM: {str(e)}"
+        return f"{LLM_ERROR_PREFIX}: {str(e)}"
+
+
+async def acall_llm(prompt: str) -> str:
+    """
+    Phiên bản async của call_llm (dùng AsyncOpenAI)
+    
+    Args:
+        prompt: Prompt đầy đủ
+        
+    Returns:
+        Câu trả lời từ LLM
+    """
+    try:
+        response = await async_client.chat.completions.create(
+            model=settings.MODEL_NAME,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=settings.TEMPERATURE,
+            max_tokens=settings.MAX_TOKENS
+        )
+        answer = response.choices[0].message.content
+        return clean_answer(answer)
+        
+    except Exception as e:
+        return f"{LLM_ERROR_PREFIX}: {str(e)}"
+
+
+async def astream_llm(prompt: str):
+    """
+    Gọi LLM với stream=True, yield từng token delta
+    
+    Args:
+        prompt: Prompt đầy đủ
+        
+    Yields:
+        Đoạn text (delta) theo thứ tự LLM sinh ra
+        
+    Raises:
+        LLMStreamError: lỗi khi gọi / giữa stream (không yield message lỗi
+        như 1 token → không bị ghép vào câu trả lời)
+    """
+    try:
+        stream = await async_client.chat.completions.create(
+            model=settings.MODEL_NAME,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=settings.TEMPERATURE,
+            max_tokens=settings.MAX_TOKENS,
+            stream=True
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+                
+    except Exception as e:
+        raise LLMStreamError(f"{LLM_ERROR_PREFIX}: {str(e)}") from e
 
 
 # Legacy function for backward compatibility with app.py and rag.py
@@ -57,6 +57,15 @@ class ConversationMemory:
             is_grounded=is_grounded
         )
     
+    def add_messages(self, messages: List[dict]) -> int:
+        """
+        Lưu nhiều messages trong 1 transaction (dùng cho /chat/batch)
+        
+        Args:
+            messages: List dict với các key giống tham số của add_message
+        """
+        return self._message_repo.add_messages(messages)
+    
     def get_history(self, session_id: str) -> str:
         """
         Lấy lịch sử hội thoại dạng text (để ghép vào prompt)
@@ -4,7 +4,7 @@ Pydantic Models cho RAG ChatBot API
 """
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, Any, Dict, List, Optional
 from datetime import datetime
 from pydantic import BaseModel, EmailStr, Field
 
@@ -13,6 +13,38 @@ from pydantic import BaseModel, EmailStr, Field
 # API REQUEST MODELS
 # ================================================================
 
+class RetrievalFilter(BaseModel):
+    """
+    Giới hạn phạm vi tìm kiếm theo metadata của chunk
+    
+    Các điều kiện được AND với nhau; trong 1 list là OR
+    (vd: source=["hr_policy.pdf", "leave.md"] = 1 trong 2 file).
+    """
+    source: Optional[List[str]] = Field(
+        default=None,
+        description="Tên file tài liệu nguồn"
+    )
+    file_type: Optional[List[str]] = Field(
+        default=None,
+        description="Loại file: pdf, markdown, text"
+    )
+    page_from: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="Trang bắt đầu (PDF, tính cả trang này)"
+    )
+    page_to: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="Trang kết thúc (PDF, tính cả trang này)"
+    )
+    
+    def is_empty(self) -> bool:
+        """True nếu không có điều kiện nào"""
+        return not (self.source or self.file_type
+                    or self.page_from is not None or self.page_to is not None)
+
+
 class ChatRequest(BaseModel):
     """
     Request body cho endpoint /chat
@@ -20,6 +52,7 @@ class ChatRequest(BaseModel):
     Attributes:
         question: Câu hỏi của user (1-500 ký tự)
         session_id: ID để tracking conversation (default: "default")
+        filters: Giới hạn tìm kiếm theo source / file_type / page (optional)
     """
     question: str = Field(
         ...,  # Required field
@@ -33,12 +66,56 @@ class ChatRequest(BaseModel):
         max_length=100,
         description="Session ID để tracking conversation"
     )
+    filters: Optional[RetrievalFilter] = Field(
+        default=None,
+        description="Chỉ tìm trong các tài liệu khớp điều kiện"
+    )
     
     class Config:
         json_schema_extra = {
             "example": {
                 "question": "Thời gian thử việc tối đa là bao lâu?",
-                "session_id": "user_123"
+                "session_id": "user_123",
+                "filters": {"file_type": ["pdf"]}
+            }
+        }
+
+
+class ChatBatchRequest(BaseModel):
+    """
+    Request body cho endpoint /chat/batch
+    
+    Attributes:
+        questions: Danh sách câu hỏi (độc lập, không dùng history)
+        session_id: Session lưu toàn bộ Q&A của batch (default: tự tạo)
+        filters: Áp dụng cho mọi câu hỏi (optional)
+    """
+    # Mỗi câu hỏi cùng giới hạn với ChatRequest.question
+    questions: List[Annotated[str, Field(min_length=1, max_length=500)]] = Field(
+        ...,
+        min_length=1,
+        max_length=100,
+        description="Danh sách câu hỏi (mỗi câu 1-500 ký tự)"
+    )
+    session_id: str = Field(
+        default="default",
+        min_length=1,
+        max_length=100,
+        description="Session ID để lưu kết quả"
+    )
+    filters: Optional[RetrievalFilter] = Field(
+        default=None,
+        description="Chỉ tìm trong các tài liệu khớp điều kiện"
+    )
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "questions": [
+                    "Thời gian thử việc tối đa là bao lâu?",
+                    "Nhân viên được nghỉ phép bao nhiêu ngày?"
+                ],
+                "session_id": "hr_nightly_check"
             }
         }
 
@@ -56,8 +133,9 @@ class Source(BaseModel):
         chunk_id: ID của chunk trong file
         score: Điểm similarity (0-1)
         excerpt: Đoạn trích ngắn (preview)
-        full_content: Nội dung đầy đủ của chunk
+        full_content: Nội dung đầy đủ (None khi COMPACT_SOURCES)
         page: Số trang trong PDF (nếu có)
+        point_ids: ID các chunk trong Qdrant (GET /chunks/{point_id})
     """
     source: str = Field(
         ...,
@@ -79,14 +157,18 @@ class Source(BaseModel):
         max_length=200,
         description="Đoạn trích ngắn (preview)"
     )
-    full_content: str = Field(
-        default="",
-        description="Nội dung đầy đủ của chunk"
+    full_content: Optional[str] = Field(
+        default=None,
+        description="Nội dung đầy đủ của chunk (None khi dùng compact sources)"
     )
     page: Optional[int] = Field(
         default=None,
         description="Số trang trong PDF"
     )
+    point_ids: Optional[List[str]] = Field(
+        default=None,
+        description="ID các chunk (nhiều hơn 1 nếu các chunk liền kề đã được gộp)"
+    )
     
     def get_display_name(self) -> str:
         """Tên hiển thị đẹp hơn"""
@@ -112,6 +194,55 @@ class Source(BaseModel):
         }
 
 
+class ChunkResponse(BaseModel):
+    """Response cho endpoint GET /chunks/{point_id}"""
+    point_id: str = Field(..., description="ID của chunk trong Qdrant")
+    source: str = Field(..., description="Tên file tài liệu nguồn")
+    file_type: str = Field(default="unknown", description="Loại file")
+    page: Optional[int] = Field(default=None, description="Số trang trong PDF")
+    chunk_id: int = Field(default=0, ge=0, description="ID của chunk")
+    content: str = Field(..., description="Nội dung đầy đủ của chunk")
+
+
+class IndexJobResponse(BaseModel):
+    """Trạng thái 1 background index job (/admin/rebuild-index, /admin/jobs)"""
+    job_id: str = Field(..., description="ID của job")
+    kind: str = Field(..., description="full | incremental")
+    status: str = Field(..., description="queued | running | cancelling | succeeded | failed | cancelled")
+    progress: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Tiến độ: stage, files_total, files_done, pages, chunks, points_uploaded"
+    )
+    result: Optional[Dict[str, Any]] = Field(default=None, description="Thống kê khi hoàn thành")
+    error: Optional[str] = Field(default=None, description="Lỗi (nếu failed)")
+    requested_by: Optional[str] = Field(default=None, description="Email admin tạo job")
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+# ================================================================
+# RETRIEVAL HIT
+# ================================================================
+
+class RetrievedChunk:
+    """
+    Chunk trả về từ vector search (thay cho langchain Document)
+    
+    Class thường với __slots__: không validate như pydantic, tạo nhanh hơn
+    nhiều khi mỗi query có hàng chục hits. Cùng interface với Document
+    (page_content, metadata) nên build_context / format_sources dùng được cả 2.
+    """
+    __slots__ = ("page_content", "metadata")
+    
+    def __init__(self, page_content: str, metadata: dict):
+        self.page_content = page_content
+        self.metadata = metadata
+    
+    def __repr__(self) -> str:
+        return f"RetrievedChunk(metadata={self.metadata!r}, page_content={self.page_content[:40]!r}...)"
+
+
 # ================================================================
 # METADATA MODELS
 # ================================================================
@@ -126,6 +257,8 @@ class Metadata(BaseModel):
         top_k: Số lượng documents retrieved
         sources_count: Số nguồn được sử dụng trong câu trả lời
         timestamp: Thời điểm xử lý
+        timings: Thời gian từng bước (ms): dense_embed_ms, sparse_encode_ms,
+            search_ms, llm_ms, ...
     """
     model: str = Field(
         ...,
@@ -150,6 +283,10 @@ class Metadata(BaseModel):
         default_factory=datetime.now,
         description="Thời điểm xử lý"
     )
+    timings: Optional[Dict[str, float]] = Field(
+        default=None,
+        description="Thời gian từng bước xử lý (ms)"
+    )
     
     class Config:
         json_schema_extra = {
@@ -224,6 +361,70 @@ class ChatResponse(BaseModel):
         }
 
 
+class ChatStreamDone(BaseModel):
+    """
+    Event cuối cùng ("done") của endpoint /chat/stream
+
+    Attributes:
+        answer: Câu trả lời đầy đủ đã clean (bản được lưu vào history) -
+            client thay thế text đã ghép từ các token
+        meta: Metadata về quá trình xử lý
+        session_id: Session ID của conversation
+        is_grounded: True nếu câu trả lời dựa trên tài liệu
+    """
+    answer: str = Field(
+        ...,
+        description="Câu trả lời đầy đủ đã clean"
+    )
+    meta: Metadata = Field(
+        ...,
+        description="Metadata xử lý"
+    )
+    session_id: str = Field(
+        ...,
+        description="Session ID"
+    )
+    is_grounded: bool = Field(
+        default=True,
+        description="True nếu trả lời dựa trên tài liệu"
+    )
+
+
+class ChatBatchItem(BaseModel):
+    """
+    1 dòng NDJSON của /chat/batch (gửi ngay khi câu hỏi đó xong)
+    
+    Attributes:
+        index: Vị trí câu hỏi trong request
+        question: Câu hỏi
+        answer: Câu trả lời
+        sources: Danh sách nguồn trích dẫn
+        is_grounded: True nếu câu trả lời dựa trên tài liệu
+        latency_ms: Thời gian từ đầu batch đến khi câu này xong
+        error: Message lỗi (nếu có)
+    """
+    index: int = Field(..., ge=0, description="Vị trí câu hỏi trong request")
+    question: str = Field(..., description="Câu hỏi")
+    answer: str = Field(default="", description="Câu trả lời")
+    sources: List[Source] = Field(default=[], description="Danh sách nguồn trích dẫn")
+    is_grounded: bool = Field(default=False, description="True nếu trả lời dựa trên tài liệu")
+    latency_ms: float = Field(default=0.0, ge=0, description="Thời gian xử lý (ms)")
+    error: Optional[str] = Field(default=None, description="Message lỗi (nếu có)")
+
+
+class ChatBatchDone(BaseModel):
+    """Dòng NDJSON cuối cùng của /chat/batch"""
+    done: bool = Field(default=True)
+    session_id: str = Field(..., description="Session ID đã lưu kết quả")
+    total: int = Field(..., ge=0, description="Số câu hỏi")
+    errors: int = Field(default=0, ge=0, description="Số câu hỏi bị lỗi")
+    latency_ms: float = Field(..., ge=0, description="Tổng thời gian xử lý (ms)")
+    timings: Optional[Dict[str, float]] = Field(
+        default=None,
+        description="Thời gian từng bước dùng chung cho cả batch (ms)"
+    )
+
+
 # ================================================================
 # CONVERSATION MEMORY MODELS
 # ================================================================
@@ -367,6 +568,22 @@ class HealthResponse(BaseModel):
         ge=0,
         description="Số vectors trong Qdrant"
     )
+    qdrant_storage: Optional[dict] = Field(
+        default=None,
+        description="Cấu hình storage của collection (quantization, on_disk, HNSW)"
+    )
+    embedding_cache: Optional[dict] = Field(
+        default=None,
+        description="Thống kê cache embedding câu hỏi (hits/misses)"
+    )
+    answer_cache: Optional[dict] = Field(
+        default=None,
+        description="Thống kê semantic answer cache (hit rate, latency tiết kiệm)"
+    )
+    reranker: Optional[dict] = Field(
+        default=None,
+        description="Thống kê cross-encoder reranker (số cặp đã chấm, cache hit)"
+    )
 
 
 class StatsResponse(BaseModel):
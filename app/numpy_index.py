@@ -0,0 +1,254 @@
+"""
+NumPy Exact-Search Index (in-process, memory-mapped)
+
+Thay thế Qdrant cho corpus nhỏ/vừa: 1 phép nhân ma trận-vector thay vì
+1 network hop. Được ghi bởi build_index khi RETRIEVAL_BACKEND="numpy",
+upload / xóa 1 document chỉ thay các row của file đó (replace_source_rows).
+
+Layout của index_dir:
+    - CURRENT       : tên thư mục version đang dùng (đổi bằng os.replace → atomic)
+    - v-<ns>/       : 1 version của index, gồm:
+        - vectors.npy   : ma trận (N, dim) đã L2-normalize, float16/float32
+        - payloads.jsonl: 1 dòng JSON payload cho mỗi vector (cùng thứ tự)
+        - offsets.npy   : byte offset của từng dòng trong payloads.jsonl
+
+Index_dir không có CURRENT (layout cũ): 3 file nằm thẳng trong index_dir.
+"""
+
+import os
+import json
+import mmap
+import time
+import shutil
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+VECTORS_FILE = "vectors.npy"
+PAYLOADS_FILE = "payloads.jsonl"
+OFFSETS_FILE = "offsets.npy"
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v-"
+
+# Giữ lại version trước version đang dùng: reader vừa đọc CURRENT cũ vẫn
+# mở được file của nó
+KEEP_VERSIONS = 2
+
+# Số dòng xử lý mỗi lần khi ma trận là float16 (đổi sang float32 theo block)
+SEARCH_BLOCK_ROWS = 65536
+
+
+def resolve_index_dir(index_dir: str) -> str:
+    """Thư mục chứa file của version đang dùng"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), encoding="utf-8") as f:
+            return os.path.join(index_dir, f.read().strip())
+    except FileNotFoundError:
+        return index_dir
+
+
+def _cleanup_versions(index_dir: str, current: str) -> None:
+    """Xóa version cũ, file của layout cũ và thư mục ghi dở (crash)"""
+    versions = sorted(
+        (name for name in os.listdir(index_dir) if name.startswith(VERSION_PREFIX)),
+        key=lambda name: int(name[len(VERSION_PREFIX):]) if name[len(VERSION_PREFIX):].isdigit() else 0,
+        reverse=True
+    )
+    keep = {current, *[name for name in versions if name != current][:KEEP_VERSIONS - 1]}
+    for name in versions:
+        if name not in keep:
+            # Windows: version còn được map bởi reader → để lần ghi sau xóa
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+    for name in (VECTORS_FILE, PAYLOADS_FILE, OFFSETS_FILE):
+        try:
+            os.remove(os.path.join(index_dir, name))
+        except OSError:
+            pass
+    for suffix in (".tmp", ".old"):
+        shutil.rmtree(index_dir.rstrip("/\\") + suffix, ignore_errors=True)
+
+
+def write_numpy_index(index_dir: str, vectors: Sequence, payloads: Iterable[dict],
+                      dtype: str = "float16", dim: Optional[int] = None) -> int:
+    """
+    Ghi index ra disk
+
+    Ghi vào thư mục version mới rồi mới đổi CURRENT (os.replace, atomic)
+    → reader luôn thấy đủ 1 version, không có lúc nào index_dir bị thiếu.
+
+    dim: số chiều vector - bắt buộc khi có thể không còn vector nào
+    (vd: xóa file cuối cùng), để vẫn ghi được ma trận (0, dim)
+
+    Returns:
+        Số vectors đã ghi
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if dim is not None:
+        matrix = matrix.reshape(-1, dim)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = (matrix / norms).astype(dtype)
+
+    version = f"{VERSION_PREFIX}{time.time_ns()}"
+    version_dir = os.path.join(index_dir, version)
+    os.makedirs(version_dir)
+
+    try:
+        np.save(os.path.join(version_dir, VECTORS_FILE), matrix)
+
+        offsets = []
+        with open(os.path.join(version_dir, PAYLOADS_FILE), "wb") as f:
+            for payload in payloads:
+                offsets.append(f.tell())
+                f.write(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+        np.save(os.path.join(version_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+        if len(offsets) != len(matrix):
+            raise ValueError(f"Số payloads ({len(offsets)}) khác số vectors ({len(matrix)})")
+
+        # Đổi version (atomic)
+        pointer_tmp = os.path.join(index_dir, f"{CURRENT_FILE}.{version}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(pointer_tmp, os.path.join(index_dir, CURRENT_FILE))
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+
+    _cleanup_versions(index_dir, version)
+    return len(matrix)
+
+
+def replace_source_rows(index_dir: str, source: str, vectors: List, payloads: List[dict],
+                        dtype: str = "float16") -> int:
+    """
+    Thay các row của 1 source bằng vectors / payloads mới (upload / xóa 1 file)
+
+    Đọc phần còn lại từ chính index trên disk thay vì scroll lại Qdrant.
+    Vẫn ghi lại toàn bộ file (O(corpus) I/O cục bộ + parse cột source),
+    nhưng không có network hop và không đụng tới vectors của file khác.
+
+    Returns:
+        Số vectors sau khi ghi
+    """
+    index = NumpyIndex(index_dir)
+    try:
+        dim = index.vectors.shape[1]
+        keep = [row for row, value in enumerate(index.column("source")) if value != source]
+        kept_vectors = np.asarray(index.vectors[keep], dtype=np.float32)
+        kept_payloads = [index.payload(row) for row in keep]
+    finally:
+        index.close()
+
+    if len(vectors):
+        kept_vectors = np.concatenate([kept_vectors, np.asarray(vectors, dtype=np.float32).reshape(-1, dim)])
+    return write_numpy_index(index_dir, kept_vectors, kept_payloads + list(payloads), dtype=dtype, dim=dim)
+
+
+class NumpyIndex:
+    """
+    Exact cosine search trên ma trận memory-mapped
+
+    - Vectors đã normalize khi ghi → dot product = cosine
+    - Top-k bằng argpartition (O(N)) rồi sort k phần tử
+    - Payload đọc lazy theo offset (không load toàn bộ vào RAM)
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        files_dir = resolve_index_dir(index_dir)
+        self.vectors = np.load(os.path.join(files_dir, VECTORS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(files_dir, OFFSETS_FILE))
+
+        self._payload_file = open(os.path.join(files_dir, PAYLOADS_FILE), "rb")
+        # mmap không map được file rỗng (index không còn vector nào)
+        if os.fstat(self._payload_file.fileno()).st_size:
+            self._payloads = mmap.mmap(self._payload_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._payloads = b""
+
+        # Cột payload đã đọc (cho metadata filter), load lazy
+        self._columns = {}
+        self._lookups = {}
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dtype(self) -> str:
+        return str(self.vectors.dtype)
+
+    def scores(self, query_vector) -> np.ndarray:
+        """Cosine similarity của query với toàn bộ vectors"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ query
+
+        # float16: không có BLAS fp16 trên CPU → đổi sang float32 theo block
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = block @ query
+        return out
+
+    def search(self, query_vector, k: int, rows: Optional[np.ndarray] = None,
+               score_threshold: Optional[float] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k vectors giống query nhất
+
+        Args:
+            rows: Chỉ xét các row này (metadata filter), None = tất cả
+            score_threshold: Bỏ các row có cosine < ngưỡng
+
+        Returns:
+            List[(row index, cosine score)] sắp xếp giảm dần
+        """
+        if len(self) == 0:
+            return []
+
+        scores = self.scores(query_vector)
+        candidates = np.arange(len(scores)) if rows is None else np.asarray(rows, dtype=np.int64)
+        if len(candidates) == 0:
+            return []
+
+        candidate_scores = scores[candidates]
+        if score_threshold is not None:
+            keep = candidate_scores >= score_threshold
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+            if len(candidates) == 0:
+                return []
+        k = min(k, len(candidates))
+
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top])]
+        return [(int(candidates[i]), float(candidate_scores[i])) for i in top]
+
+    def column(self, field: str) -> list:
+        """Giá trị của 1 field payload cho mọi row (cache sau lần đầu)"""
+        if field not in self._columns:
+            self._columns[field] = [self.payload(row).get(field) for row in range(len(self))]
+        return self._columns[field]
+
+    def payload(self, row: int) -> dict:
+        """Đọc payload của 1 row"""
+        start = int(self.offsets[row])
+        end = self._payloads.find(b"\n", start)
+        return json.loads(self._payloads[start:end])
+
+    def find(self, field: str, value) -> Optional[int]:
+        """Row đầu tiên có payload[field] == value (None nếu không có)"""
+        if field not in self._lookups:
+            lookup = {}
+            for row, item in enumerate(self.column(field)):
+                lookup.setdefault(item, row)
+            self._lookups[field] = lookup
+        return self._lookups[field].get(value)
+
+    def close(self) -> None:
+        if isinstance(self._payloads, mmap.mmap):
+            self._payloads.close()
+        self._payload_file.close()
@@ -0,0 +1,177 @@
+"""
+Streaming Pipeline (bounded queues)
+
+Chạy các stage của ingest (extract → chunk → embed → upsert) trên các
+thread riêng, nối nhau bằng queue.Queue có giới hạn:
+    - Các stage chạy chồng lên nhau (embed batch này trong lúc extract file sau)
+    - Stage nhanh bị chặn khi queue phía sau đầy → RAM không tăng theo corpus
+    - Mỗi stage ghi lại số đơn vị đã xử lý, thời gian bận / chờ → throughput
+
+Mỗi stage là 1 transform: Iterable[input] → Iterable[output] (generator),
+nên stage có thể giữ state (đếm chunk_id theo file, gom window để embed...).
+"""
+
+import time
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    """Pipeline bị dừng (stage khác lỗi hoặc bị hủy)"""
+
+
+class Stage:
+    """
+    1 stage của pipeline
+
+    Args:
+        name: tên hiển thị
+        transform: Iterable[input] → Iterable[output]
+        unit: đơn vị đếm (pages, chunks, points...)
+        size: số đơn vị trong 1 output (mặc định 1)
+    """
+
+    def __init__(self, name: str, transform: Callable[[Iterable], Iterable],
+                 unit: str = "items", size: Optional[Callable] = None):
+        self.name = name
+        self.transform = transform
+        self.unit = unit
+        self.size = size or (lambda item: 1)
+
+        # Counters
+        self.count = 0
+        self.outputs = 0
+        self.wait_seconds = 0.0   # chờ input từ stage trước
+        self.block_seconds = 0.0  # chờ queue phía sau có chỗ trống
+        self.total_seconds = 0.0
+
+    @property
+    def busy_seconds(self) -> float:
+        return max(self.total_seconds - self.wait_seconds - self.block_seconds, 0.0)
+
+    def stats(self) -> dict:
+        busy = self.busy_seconds
+        return {
+            "stage": self.name,
+            "unit": self.unit,
+            "count": self.count,
+            "busy_s": round(busy, 2),
+            "wait_s": round(self.wait_seconds, 2),
+            "blocked_s": round(self.block_seconds, 2),
+            "per_second": round(self.count / busy, 1) if busy > 0 else 0.0
+        }
+
+
+def _iter_queue(q: queue.Queue, stage: Stage, stop: threading.Event) -> Iterator:
+    """Đọc input từ queue đến khi gặp _DONE (dừng sớm nếu pipeline bị stop)"""
+    while True:
+        started = time.perf_counter()
+        while True:
+            if stop.is_set():
+                raise PipelineStopped()
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stage.wait_seconds += time.perf_counter() - started
+        if item is _DONE:
+            return
+        yield item
+
+
+def _put(q: queue.Queue, item, stage: Stage, stop: threading.Event) -> None:
+    """Ghi vào queue (block khi đầy, thoát nếu pipeline bị stop)"""
+    started = time.perf_counter()
+    while True:
+        if stop.is_set():
+            raise PipelineStopped()
+        try:
+            q.put(item, timeout=0.1)
+            break
+        except queue.Full:
+            continue
+    stage.block_seconds += time.perf_counter() - started
+
+
+def run_pipeline(source: Iterable, stages: List[Stage], queue_size: int = 4,
+                 stop: Optional[threading.Event] = None) -> None:
+    """
+    Chạy pipeline đến khi source hết
+
+    Stage cuối chạy trên thread gọi hàm (thường là upsert), các stage còn
+    lại mỗi stage 1 thread. Lỗi ở bất kỳ stage nào → dừng mọi stage và raise
+    lại ở đây. Set `stop` từ bên ngoài để hủy (raise PipelineStopped).
+    """
+    stop = stop or threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages[:-1]]
+    errors = []
+
+    def run_stage(index: int, inputs: Iterable) -> None:
+        stage = stages[index]
+        started = time.perf_counter()
+        outputs = stage.transform(inputs)
+        try:
+            for item in outputs:
+                stage.count += stage.size(item)
+                stage.outputs += 1
+                if index < len(queues):
+                    _put(queues[index], item, stage, stop)
+            if index < len(queues):
+                _put(queues[index], _DONE, stage, stop)
+        finally:
+            stage.total_seconds += time.perf_counter() - started
+            # Đóng generator → chạy finally của chúng (vd: shutdown process pool)
+            for gen in (outputs, inputs):
+                if hasattr(gen, "close"):
+                    gen.close()
+
+    def worker(index: int) -> None:
+        inputs = source if index == 0 else _iter_queue(queues[index - 1], stages[index], stop)
+        try:
+            run_stage(index, inputs)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [
+        threading.Thread(target=worker, args=(i,), name=f"pipeline-{stage.name}", daemon=True)
+        for i, stage in enumerate(stages[:-1])
+    ]
+    for thread in threads:
+        thread.start()
+
+    last = len(stages) - 1
+    try:
+        inputs = source if last == 0 else _iter_queue(queues[last - 1], stages[last], stop)
+        run_stage(last, inputs)
+    except PipelineStopped:
+        if not errors:
+            raise
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def format_stats(stages: List[Stage]) -> str:
+    """Bảng throughput của từng stage"""
+    lines = [f" {'stage':<10}{'count':>10}{'unit':>8}{'busy (s)':>10}{'wait (s)':>10}{'blocked (s)':>13}{'/s':>10}"]
+    for stage in stages:
+        s = stage.stats()
+        lines.append(
+            f" {s['stage']:<10}{s['count']:>10}{s['unit']:>8}{s['busy_s']:>10.2f}"
+            f"{s['wait_s']:>10.2f}{s['blocked_s']:>13.2f}{s['per_second']:>10.1f}"
+        )
+    return "\n".join(lines)
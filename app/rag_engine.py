@@ -8,19 +8,81 @@ Features:
     - Citation formatting (trích dẫn nguồn)
     - Integration với Conversation Memory
     - Fallback handling (khi không tìm thấy nguồn)
+    - Async pipeline (aask) cho API, không block event loop
+    - Semantic answer cache (bỏ qua LLM khi câu hỏi gần giống câu đã trả lời)
+    - Hybrid retrieval: dense + sparse lexical, fuse bằng RRF
+    - Retrieval backend: Qdrant server hoặc NumPy exact search in-process
+    - Cross-encoder reranking (optional): nhiều candidates → ít chunks tốt nhất
+    - Context packing: gộp chunks liền kề, giới hạn token budget
+    - Batch Q&A (ask_batch): 1 lần encode + 1 round trip Qdrant cho nhiều câu hỏi
 """
 
 import os
 import time
-from typing import List, Tuple, Optional
+import uuid
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional, Union, Awaitable, AsyncIterator
 
-from qdrant_client import QdrantClient
-from langchain.schema import Document
+import numpy as np
+from qdrant_client.models import QueryRequest, SparseVector
 
 from app.ingest import LocalEmbedding
-from app.models import Source
+from app.embeddings import encode_sparse
+from app.numpy_index import NumpyIndex
+from app.vector_store import (
+    create_qdrant_client,
+    create_async_qdrant_client,
+    describe_transport,
+    dense_search_params,
+    storage_settings,
+    build_payload_filter,
+    payload_matches,
+    resolve_alias
+)
+from app.models import Source, RetrievalFilter, RetrievedChunk
 from app.config import settings
-from app.llm import call_llm
+from app.llm import call_llm, acall_llm, astream_llm, clean_answer, LLM_ERROR_PREFIX, LLMStreamError
+from app.cache import SemanticCache
+from app.reranker import CrossEncoderReranker
+from app.context_packer import pack_results
+
+
+# Payload fields cần cho context + citations (không lấy field khác từ Qdrant)
+RETRIEVAL_PAYLOAD_FIELDS = ["content", "source", "file_type", "page", "chunk_id"]
+
+# Message cứng khi không tìm thấy nguồn
+FALLBACK_ERROR_ANSWER = (
+    "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu nội bộ. "
+    "Vui lòng liên hệ bộ phận HR hoặc Legal để được hỗ trợ."
+)
+
+NO_SOURCE_ANSWER = (
+    "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu nội bộ. "
+    "Vui lòng liên hệ:\n"
+    "- HR: hr@abccorp.vn\n"
+    "- Legal: legal@abccorp.vn\n"
+    "- IT Support: it@abccorp.vn"
+)
+
+
+def reciprocal_rank_fusion(rankings: List[list], k: int = 60) -> List[Tuple]:
+    """
+    Reciprocal Rank Fusion: score(d) = Σ 1 / (k + rank(d))
+    
+    Args:
+        rankings: Các danh sách id đã sắp xếp (mỗi leg 1 danh sách)
+        k: Hằng số làm mượt (60 theo paper gốc)
+        
+    Returns:
+        List[(id, rrf_score)] sắp xếp giảm dần
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, 1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
 
 
 class RAGEngine:
@@ -42,21 +104,62 @@ class RAGEngine:
         # Embedding model (same as ingest)
         self.embeddings = LocalEmbedding()
         
-        # Qdrant client
+        # Thread pool giới hạn cho embedding (CPU-bound) trong async path
+        self._embed_executor = ThreadPoolExecutor(
+            max_workers=settings.EMBEDDING_WORKERS,
+            thread_name_prefix="embed"
+        )
+        
+        # Semantic answer cache
+        self.answer_cache = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            self.answer_cache = SemanticCache(
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS,
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                version_path=settings.INDEX_VERSION_FILE
+            )
+        
+        # Cross-encoder reranker (optional)
+        self.reranker = None
+        if settings.RERANK_ENABLED:
+            self.reranker = CrossEncoderReranker(
+                model_name=settings.RERANK_MODEL,
+                batch_size=settings.RERANK_BATCH_SIZE,
+                max_length=settings.RERANK_MAX_LENGTH,
+                cache_size=settings.RERANK_CACHE_SIZE
+            )
+        
+        # Tokenizer đếm token cho context packing
+        self.context_tokenizer = None
+        if settings.CONTEXT_PACKING_ENABLED:
+            self.context_tokenizer = self._load_context_tokenizer()
+        
+        # Qdrant clients (sync + async) hoặc NumPy index
         self.client = None
+        self.aclient = None
+        self.numpy_index = None
         self.collection_name = settings.QDRANT_COLLECTION_NAME
         self._connect_db()
         
         print("RAG Engine ready!")
     
     def _connect_db(self) -> None:
-        """Kết nối đến Qdrant server"""
+        """Kết nối đến Qdrant server (hoặc load NumPy index)"""
+        if settings.RETRIEVAL_BACKEND == "numpy":
+            self._load_numpy_index()
+            return
+        
         try:
-            self.client = QdrantClient(url=settings.QDRANT_URL)
+            # Giữ client cũ khi reload → tái sử dụng connection/channel
+            if self.client is None:
+                self.client = create_qdrant_client()
+            if self.aclient is None:
+                self.aclient = create_async_qdrant_client()
             
             # Verify collection exists
             collection_info = self.client.get_collection(self.collection_name)
-            print(f"  ✓ Connected to Qdrant at '{settings.QDRANT_URL}'")
+            print(f"  ✓ Connected to Qdrant at '{settings.QDRANT_URL}' ({describe_transport()})")
             print(f"  ✓ Collection: {self.collection_name} ({collection_info.points_count} vectors)")
         except Exception as e:
             raise ConnectionError(
@@ -65,10 +168,59 @@ class RAGEngine:
                 f"Error: {e}"
             )
     
+    def _load_numpy_index(self) -> None:
+        """
+        Load NumPy index (memory-mapped) do build_index ghi ra
+
+        Chỉ đổi reference, không close index cũ: search / aget_chunk đang
+        chạy trên thread khác có thể vẫn giữ nó, mmap được giải phóng khi
+        không còn ai tham chiếu.
+        """
+        try:
+            self.numpy_index = NumpyIndex(settings.NUMPY_INDEX_DIR)
+            print(f"  ✓ NumPy index: {settings.NUMPY_INDEX_DIR} "
+                  f"({len(self.numpy_index)} vectors, {self.numpy_index.dtype})")
+        except Exception as e:
+            raise ConnectionError(
+                f"Cannot load NumPy index at '{settings.NUMPY_INDEX_DIR}'. "
+                f"Run 'python -m app.ingest' with RETRIEVAL_BACKEND=numpy first!\n"
+                f"Error: {e}"
+            )
+    
+    def _load_context_tokenizer(self):
+        """Tokenizer của CONTEXT_TOKENIZER, mặc định dùng lại tokenizer của embedding model"""
+        if settings.CONTEXT_TOKENIZER:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(settings.CONTEXT_TOKENIZER)
+        return self.embeddings.model.tokenizer
+    
+    def count_tokens(self, text: str) -> int:
+        """Số token của text (không cắt theo max length)"""
+        return len(self.context_tokenizer(text, add_special_tokens=False)["input_ids"])
+    
+    def on_documents_changed(self) -> None:
+        """
+        1 document vừa được index / xóa trực tiếp trên collection đang chạy
+
+        Không cần reconnect: chỉ bỏ câu trả lời đã cache (corpus đã khác) và
+        load lại NumPy index nếu dùng backend numpy. Rerank score giữ nguyên
+        (key theo point id, chunk không đổi thì id không đổi).
+        """
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+        if self.numpy_index is not None:
+            self._load_numpy_index()
+    
     def reload_db(self) -> None:
         """Reconnect to Qdrant (sau khi update index)"""
         print("Reconnecting to Qdrant...")
         self._connect_db()
+        
+        # Corpus có thể đã thay đổi → câu trả lời / rerank score cũ không còn hợp lệ
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+        if self.reranker is not None:
+            self.reranker.clear()
         print("Reconnected!")
     
     # ================================================================
@@ -78,47 +230,308 @@ class RAGEngine:
     def retrieve_with_scores(
         self, 
         query: str, 
-        k: int = None
+        k: int = None,
+        query_vector: List[float] = None,
+        timings: Optional[dict] = None,
+        filters: Optional[RetrievalFilter] = None,
+        score_threshold: Optional[float] = None
     ) -> List[Tuple]:
         """
         Retrieve documents từ Qdrant với similarity scores
         
+        Hybrid mode (HYBRID_SEARCH_ENABLED): dense + sparse trong 1 round trip
+        (query_batch_points), fuse bằng Reciprocal Rank Fusion
+        
         Args:
             query: Câu hỏi của user
             k: Số documents cần retrieve (default: TOP_K từ config)
+            query_vector: Embedding đã tính sẵn của query (optional)
+            timings: Dict để ghi thời gian từng bước (ms, optional)
+            filters: Chỉ search trong chunks khớp source/file_type/page (optional)
+            score_threshold: Ngưỡng cosine áp dụng phía Qdrant (None = không lọc)
             
         Returns:
-            List[(Document, similarity_score)]
+            List[(RetrievedChunk, similarity_score)]
             Score từ 0-1, càng cao càng giống (COSINE similarity)
         """
         k = k or settings.TOP_K
+        timings = timings if timings is not None else {}
+        
+        # Embed query (dense leg)
+        if query_vector is None:
+            start = time.perf_counter()
+            query_vector = self.embeddings.embed_query(query)
+            timings["dense_embed_ms"] = (time.perf_counter() - start) * 1000
         
-        # Embed query
-        query_vector = self.embeddings.embed_query(query)
+        if self.numpy_index is not None:
+            return self._numpy_search(query_vector, k, timings, filters, score_threshold)
         
-        # Search in Qdrant (query_points for newer versions)
-        from qdrant_client.models import NamedVector
+        requests = self._build_search_requests(
+            query, query_vector, k, timings, filters, score_threshold
+        )
         
-        results = self.client.query_points(
+        # Search in Qdrant (1 round trip cho cả 2 legs)
+        start = time.perf_counter()
+        responses = self.client.query_batch_points(
             collection_name=self.collection_name,
-            query=query_vector,
-            limit=k,
-            with_payload=True
-        ).points
+            requests=requests
+        )
+        timings["search_ms"] = (time.perf_counter() - start) * 1000
         
-        # Convert Qdrant results to (Document, score) format
+        return self._fuse_results(query_vector, responses, k)
+    
+    async def aembed_query(self, query: str) -> List[float]:
+        """
+        Embed query không block event loop
+        
+        - Có batcher: chờ Future của batcher (gộp với các request đồng thời)
+        - Không có: chạy trong thread pool riêng
+        """
+        if self.embeddings.batcher is not None:
+            return await asyncio.wrap_future(self.embeddings.submit_query(query))
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._embed_executor,
+            self.embeddings.embed_query,
+            query
+        )
+    
+    async def aretrieve_with_scores(
+        self,
+        query: str,
+        k: int = None,
+        query_vector: List[float] = None,
+        timings: Optional[dict] = None,
+        filters: Optional[RetrievalFilter] = None,
+        score_threshold: Optional[float] = None
+    ) -> List[Tuple]:
+        """
+        Phiên bản async của retrieve_with_scores
+        
+        Embedding chạy trong thread pool, search dùng AsyncQdrantClient
+        """
+        k = k or settings.TOP_K
+        timings = timings if timings is not None else {}
+        
+        if query_vector is None:
+            start = time.perf_counter()
+            query_vector = await self.aembed_query(query)
+            timings["dense_embed_ms"] = (time.perf_counter() - start) * 1000
+        
+        if self.numpy_index is not None:
+            return await asyncio.to_thread(
+                self._numpy_search, query_vector, k, timings, filters, score_threshold
+            )
+        
+        requests = self._build_search_requests(
+            query, query_vector, k, timings, filters, score_threshold
+        )
+        
+        start = time.perf_counter()
+        responses = await self.aclient.query_batch_points(
+            collection_name=self.collection_name,
+            requests=requests
+        )
+        timings["search_ms"] = (time.perf_counter() - start) * 1000
+        
+        return self._fuse_results(query_vector, responses, k)
+    
+    async def aretrieve_batch(
+        self,
+        queries: List[str],
+        query_vectors: List[List[float]],
+        k: int = None,
+        timings: Optional[dict] = None,
+        filters: Optional[RetrievalFilter] = None,
+        score_threshold: Optional[float] = None
+    ) -> List[List[Tuple]]:
+        """
+        Retrieve cho nhiều câu hỏi trong 1 lần query_batch_points
+        
+        Returns:
+            List[(RetrievedChunk, score)] cho từng câu hỏi (cùng thứ tự `queries`)
+        """
+        k = k or settings.TOP_K
+        timings = timings if timings is not None else {}
+        
+        if self.numpy_index is not None:
+            return await asyncio.to_thread(lambda: [
+                self._numpy_search(vector, k, timings, filters, score_threshold)
+                for vector in query_vectors
+            ])
+        
+        # Mỗi câu hỏi 1-2 requests (dense + sparse) → ghi lại vị trí để fuse
+        requests = []
+        spans = []
+        for query, vector in zip(queries, query_vectors):
+            query_requests = self._build_search_requests(
+                query, vector, k, {}, filters, score_threshold
+            )
+            spans.append((len(requests), len(query_requests)))
+            requests.extend(query_requests)
+        
+        start = time.perf_counter()
+        responses = await self.aclient.query_batch_points(
+            collection_name=self.collection_name,
+            requests=requests
+        )
+        timings["search_ms"] = (time.perf_counter() - start) * 1000
+        
+        return [
+            self._fuse_results(vector, responses[offset:offset + count], k)
+            for vector, (offset, count) in zip(query_vectors, spans)
+        ]
+    
+    def _numpy_search(
+        self,
+        query_vector: List[float],
+        k: int,
+        timings: dict,
+        filters: Optional[RetrievalFilter] = None,
+        score_threshold: Optional[float] = None
+    ) -> List[Tuple]:
+        """Exact dense search trên NumPy index (không có sparse leg)"""
+        start = time.perf_counter()
+        # 1 reference cho cả lần search (index có thể được swap giữa chừng)
+        index = self.numpy_index
+        rows = None
+        if filters is not None and not filters.is_empty():
+            rows = np.flatnonzero([
+                payload_matches(source, file_type, page, filters)
+                for source, file_type, page in zip(
+                    index.column("source"), index.column("file_type"), index.column("page")
+                )
+            ])
+        hits = index.search(query_vector, k, rows=rows, score_threshold=score_threshold)
+        results = [
+            (self._payload_to_document(index.payload(row)), score)
+            for row, score in hits
+        ]
+        timings["search_ms"] = (time.perf_counter() - start) * 1000
+        return results
+    
+    def _build_search_requests(
+        self,
+        query: str,
+        query_vector: List[float],
+        k: int,
+        timings: dict,
+        filters: Optional[RetrievalFilter] = None,
+        score_threshold: Optional[float] = None
+    ) -> List[QueryRequest]:
+        """
+        Tạo các QueryRequest: [dense] hoặc [dense, sparse] (hybrid)
+        
+        - Metadata filter được áp dụng cho cả 2 legs (dùng payload index)
+        - score_threshold: Qdrant chỉ trả về hits đủ ngưỡng (dense: cosine,
+          sparse: HYBRID_SPARSE_THRESHOLD) → không truyền/parse hits bị loại
+        - Payload chỉ gồm RETRIEVAL_PAYLOAD_FIELDS
+        """
+        hybrid = settings.HYBRID_SEARCH_ENABLED
+        limit = max(k, settings.HYBRID_CANDIDATES) if hybrid else k
+        query_filter = build_payload_filter(filters)
+        
+        requests = [
+            QueryRequest(
+                query=query_vector,
+                using=settings.DENSE_VECTOR_NAME,
+                limit=limit,
+                with_payload=RETRIEVAL_PAYLOAD_FIELDS,
+                params=dense_search_params(),
+                filter=query_filter,
+                score_threshold=score_threshold
+            )
+        ]
+        
+        if hybrid:
+            start = time.perf_counter()
+            indices, values = encode_sparse(query, is_query=True)
+            timings["sparse_encode_ms"] = (time.perf_counter() - start) * 1000
+            
+            if indices:
+                # Lấy kèm dense vector để tính cosine cho hit chỉ có ở sparse leg
+                requests.append(QueryRequest(
+                    query=SparseVector(indices=indices, values=values),
+                    using=settings.SPARSE_VECTOR_NAME,
+                    limit=limit,
+                    with_payload=RETRIEVAL_PAYLOAD_FIELDS,
+                    with_vector=[settings.DENSE_VECTOR_NAME],
+                    filter=query_filter,
+                    score_threshold=(
+                        settings.HYBRID_SPARSE_THRESHOLD if score_threshold is not None else None
+                    )
+                ))
+        
+        return requests
+    
+    def _fuse_results(
+        self,
+        query_vector: List[float],
+        responses: list,
+        k: int
+    ) -> List[Tuple]:
+        """
+        Gộp kết quả dense (+ sparse) bằng Reciprocal Rank Fusion
+        
+        Score trả về vẫn là cosine similarity (để dùng SIMILARITY_THRESHOLD);
+        thứ tự theo RRF. Sparse score được ghi vào metadata["sparse_score"].
+        """
+        dense_points = responses[0].points
+        if len(responses) < 2:
+            return self._hits_to_documents(dense_points[:k])
+        sparse_points = responses[1].points
+        
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        
+        # point_id → (point, cosine score, sparse score)
+        hits = {}
+        for point in dense_points:
+            hits[point.id] = [point, point.score, None]
+        for point in sparse_points:
+            if point.id in hits:
+                hits[point.id][2] = point.score
+                continue
+            dense = np.asarray(point.vector[settings.DENSE_VECTOR_NAME], dtype=np.float32)
+            cosine = float(dense @ query / (np.linalg.norm(dense) or 1.0))
+            hits[point.id] = [point, max(cosine, 0.0), point.score]
+        
+        fused = reciprocal_rank_fusion(
+            [[p.id for p in dense_points], [p.id for p in sparse_points]],
+            k=settings.RRF_K
+        )
+        
+        results = []
+        for point_id, rrf_score in fused[:k]:
+            point, cosine, sparse_score = hits[point_id]
+            doc = self._payload_to_document(point.payload, point.id)
+            doc.metadata["rrf_score"] = rrf_score
+            if sparse_score is not None:
+                doc.metadata["sparse_score"] = sparse_score
+            results.append((doc, cosine))
+        
+        return results
+    
+    def _payload_to_document(self, payload: dict, point_id=None) -> RetrievedChunk:
+        """Tạo RetrievedChunk từ Qdrant payload"""
+        return RetrievedChunk(
+            page_content=payload.get("content", ""),
+            metadata={
+                "source": payload.get("source", "unknown"),
+                "file_type": payload.get("file_type", "unknown"),
+                "page": payload.get("page", 0),
+                "chunk_id": payload.get("chunk_id", 0),
+                "point_id": point_id if point_id is not None else payload.get("point_id")
+            }
+        )
+    
+    def _hits_to_documents(self, results) -> List[Tuple]:
+        """Convert Qdrant results to (RetrievedChunk, score) format"""
         results_with_similarity = []
         for hit in results:
-            # Tạo Document từ payload
-            doc = Document(
-                page_content=hit.payload.get("content", ""),
-                metadata={
-                    "source": hit.payload.get("source", "unknown"),
-                    "file_type": hit.payload.get("file_type", "unknown"),
-                    "page": hit.payload.get("page", 0),
-                    "chunk_id": hit.payload.get("chunk_id", 0)
-                }
-            )
+            # Tạo RetrievedChunk từ payload
+            doc = self._payload_to_document(hit.payload, hit.id)
             # Qdrant COSINE score đã là 0-1
             similarity = hit.score
             results_with_similarity.append((doc, similarity))
@@ -130,15 +543,119 @@ class RAGEngine:
         Lọc kết quả theo ngưỡng similarity
         
         Args:
-            results: List[(Document, score)]
+            results: List[(RetrievedChunk, score)]
             
         Returns:
-            List[(Document, score)] đã lọc
+            List[(RetrievedChunk, score)] đã lọc
         """
         threshold = settings.SIMILARITY_THRESHOLD
-        filtered = [(doc, score) for doc, score in results if score >= threshold]
+        sparse_threshold = settings.HYBRID_SPARSE_THRESHOLD
+        filtered = [
+            (doc, score) for doc, score in results
+            if score >= threshold
+            or doc.metadata.get("sparse_score", 0) >= sparse_threshold
+        ]
         return filtered
     
+    # ================================================================
+    # CHUNK LOOKUP
+    # ================================================================
+    
+    def _chunk_payload(self, point_id: str) -> Optional[dict]:
+        """Payload của 1 chunk trong NumPy index (None nếu không có)"""
+        index = self.numpy_index
+        row = index.find("point_id", point_id)
+        return index.payload(row) if row is not None else None
+    
+    async def aget_chunk(self, point_id: str) -> Optional[dict]:
+        """
+        Lấy nội dung đầy đủ của 1 chunk theo point id
+        
+        Returns:
+            Dict (point_id, source, file_type, page, chunk_id, content) hoặc None
+        """
+        if self.numpy_index is not None:
+            payload = await asyncio.to_thread(self._chunk_payload, point_id)
+        else:
+            # Qdrant point id là UUID hoặc số nguyên
+            try:
+                qdrant_id = int(point_id) if point_id.isdigit() else str(uuid.UUID(point_id))
+            except ValueError:
+                return None
+            points = await self.aclient.retrieve(
+                collection_name=self.collection_name,
+                ids=[qdrant_id],
+                with_payload=True,
+                with_vectors=False
+            )
+            payload = points[0].payload if points else None
+        
+        if payload is None:
+            return None
+        
+        return {
+            "point_id": point_id,
+            "source": os.path.basename(payload.get("source", "unknown")),
+            "file_type": payload.get("file_type", "unknown"),
+            "page": payload.get("page"),
+            "chunk_id": payload.get("chunk_id", 0),
+            "content": payload.get("content", "")
+        }
+    
+    # ================================================================
+    # RERANKING
+    # ================================================================
+    
+    @property
+    def search_threshold(self) -> Optional[float]:
+        """Ngưỡng cosine gửi kèm query cho Qdrant (None = lọc sau ở Python)"""
+        return settings.SIMILARITY_THRESHOLD if settings.SERVER_SIDE_THRESHOLD else None
+    
+    @property
+    def candidate_k(self) -> int:
+        """Số chunks cần retrieve (nhiều hơn TOP_K khi có rerank)"""
+        if self.reranker is not None:
+            return max(settings.RERANK_CANDIDATES, settings.RERANK_TOP_N)
+        return settings.TOP_K
+    
+    def rerank(
+        self,
+        question: str,
+        filtered_results: List[Tuple],
+        timings: Optional[dict] = None
+    ) -> List[Tuple]:
+        """
+        Giữ RERANK_TOP_N chunks tốt nhất theo cross-encoder
+        (không có reranker → trả về nguyên results)
+        """
+        if self.reranker is None or not filtered_results:
+            return filtered_results
+        
+        start = time.perf_counter()
+        reranked = self.reranker.rerank(question, filtered_results, settings.RERANK_TOP_N)
+        if timings is not None:
+            timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+        return reranked
+    
+    async def arerank(
+        self,
+        question: str,
+        filtered_results: List[Tuple],
+        timings: Optional[dict] = None
+    ) -> List[Tuple]:
+        """Phiên bản async của rerank (cross-encoder chạy trong thread pool)"""
+        if self.reranker is None or not filtered_results:
+            return filtered_results
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._embed_executor,
+            self.rerank,
+            question,
+            filtered_results,
+            timings
+        )
+    
     # ================================================================
     # CITATION FORMATTING
     # ================================================================
@@ -148,7 +665,7 @@ class RAGEngine:
         Chuyển results thành Source objects (citations)
         
         Args:
-            results: List[(Document, score)]
+            results: List[(RetrievedChunk, score)]
             
         Returns:
             List[Source] với đầy đủ thông tin trích dẫn
@@ -175,14 +692,19 @@ class RAGEngine:
             page = doc.metadata.get("page")
             chunk_id = doc.metadata.get("chunk_id", idx)
             
+            # ID chunk để client lấy nội dung đầy đủ khi cần (GET /chunks/{point_id})
+            point_ids = doc.metadata.get("merged_point_ids") or [doc.metadata.get("point_id")]
+            point_ids = [str(pid) for pid in point_ids if pid is not None] or None
+            
             # Tạo Source object
             sources.append(Source(
                 source=source_file,
                 chunk_id=chunk_id,
                 score=round(score, 4),
                 excerpt=excerpt,
-                full_content=full_content,
-                page=page
+                full_content=None if settings.COMPACT_SOURCES else full_content,
+                page=page,
+                point_ids=point_ids
             ))
         
         return sources
@@ -191,12 +713,29 @@ class RAGEngine:
     # CONTEXT BUILDING
     # ================================================================
     
+    def pack_context(self, results: List[Tuple]) -> List[Tuple]:
+        """
+        Gộp chunks liền kề (cùng source/page) và cắt theo CONTEXT_TOKEN_BUDGET
+        
+        Kết quả dùng chung cho build_context và format_sources để
+        số thứ tự [Nguồn i] khớp với citations
+        """
+        if self.context_tokenizer is None or not results:
+            return results
+        
+        return pack_results(
+            results,
+            count_tokens=self.count_tokens,
+            token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            max_overlap=settings.CHUNK_OVERLAP
+        )
+    
     def build_context(self, results: List[Tuple]) -> str:
         """
         Ghép các documents thành context string cho LLM
         
         Args:
-            results: List[(Document, score)]
+            results: List[(RetrievedChunk, score)]
             
         Returns:
             String chứa context đã format
@@ -306,6 +845,91 @@ Hãy trả lời lịch sự, gợi ý người dùng liên hệ bộ phận ph
 
 Trả lời:"""
     
+    # ================================================================
+    # GENERATION PREP (dùng chung cho ask / aask / astream_ask / ask_batch)
+    # ================================================================
+    
+    def prepare_generation(
+        self,
+        question: str,
+        filtered_results: List[Tuple],
+        history: str = "",
+        use_fallback: bool = True
+    ) -> Tuple[Optional[str], List[Source], bool]:
+        """
+        Chuẩn bị prompt + sources từ kết quả đã lọc (dùng chung cho ask/aask)
+        
+        Returns:
+            Tuple gồm:
+            - prompt: Prompt cho LLM (None nếu không gọi LLM)
+            - sources: List[Source] citations
+            - is_grounded: True nếu có nguồn hỗ trợ
+        """
+        is_grounded = len(filtered_results) > 0
+        
+        if is_grounded:
+            # Có nguồn → gộp chunks liền kề + build context
+            packed_results = self.pack_context(filtered_results)
+            context = self.build_context(packed_results)
+            prompt = self.build_prompt(question, context, history)
+            return prompt, self.format_sources(packed_results), True
+        
+        if use_fallback:
+            # Dùng fallback prompt
+            return self.build_fallback_prompt(question, history), [], False
+        
+        # Không dùng LLM, trả về message cứng
+        return None, [], False
+    
+    # ================================================================
+    # SEMANTIC ANSWER CACHE
+    # ================================================================
+    
+    def lookup_cached_answer(
+        self,
+        query_vector: List[float],
+        history: str = "",
+        filters: Optional[RetrievalFilter] = None
+    ) -> Optional[Tuple[str, List[Source]]]:
+        """
+        Tìm câu trả lời đã cache cho câu hỏi tương tự
+        
+        Chỉ dùng khi không có history (câu trả lời follow-up phụ thuộc ngữ cảnh)
+        và không có metadata filter (câu trả lời phụ thuộc phạm vi tìm kiếm)
+        """
+        if self.answer_cache is None or history:
+            return None
+        if filters is not None and not filters.is_empty():
+            return None
+        
+        cached = self.answer_cache.lookup(query_vector)
+        if cached is None:
+            return None
+        
+        answer, sources, _ = cached
+        return answer, sources
+    
+    def store_cached_answer(
+        self,
+        question: str,
+        query_vector: List[float],
+        answer: str,
+        sources: List[Source],
+        is_grounded: bool,
+        latency_ms: float,
+        history: str = "",
+        filters: Optional[RetrievalFilter] = None
+    ) -> None:
+        """Lưu câu trả lời grounded (không lỗi, không history, không filter) vào cache"""
+        if self.answer_cache is None or history or not is_grounded:
+            return
+        if filters is not None and not filters.is_empty():
+            return
+        if answer.startswith(LLM_ERROR_PREFIX):
+            return
+        
+        self.answer_cache.store(question, query_vector, answer, sources, latency_ms)
+    
     # ================================================================
     # MAIN ASK METHOD
     # ================================================================
@@ -314,7 +938,9 @@ Trả lời:"""
         self,
         question: str,
         history: str = "",
-        use_fallback: bool = True
+        use_fallback: bool = True,
+        timings: Optional[dict] = None,
+        filters: Optional[RetrievalFilter] = None
     ) -> Tuple[str, List[Source], bool, float]:
         """
         Main RAG method - xử lý câu hỏi và trả về answer với sources
@@ -323,6 +949,8 @@ Trả lời:"""
             question: Câu hỏi của user
             history: Lịch sử hội thoại (từ memory)
             use_fallback: Có dùng fallback khi không tìm thấy nguồn
+            timings: Dict để ghi thời gian từng bước (ms, optional)
+            filters: Chỉ tìm trong chunks khớp source/file_type/page (optional)
             
         Returns:
             Tuple gồm:
@@ -332,59 +960,323 @@ Trả lời:"""
             - latency_ms: Thời gian xử lý (milliseconds)
         """
         start_time = time.time()
+        timings = timings if timings is not None else {}
+        
+        # ============ STEP 0: EMBED + SEMANTIC CACHE ============
+        step = time.perf_counter()
+        query_vector = self.embeddings.embed_query(question)
+        timings["dense_embed_ms"] = (time.perf_counter() - step) * 1000
+        
+        cached = self.lookup_cached_answer(query_vector, history, filters)
+        if cached is not None:
+            answer, sources = cached
+            return answer, sources, True, (time.time() - start_time) * 1000
         
         # ============ STEP 1: RETRIEVE ============
-        results = self.retrieve_with_scores(question)
+        results = self.retrieve_with_scores(
+            question, k=self.candidate_k, query_vector=query_vector,
+            timings=timings, filters=filters, score_threshold=self.search_threshold
+        )
         
-        # ============ STEP 2: FILTER BY THRESHOLD ============
+        # ============ STEP 2: FILTER BY THRESHOLD (+ RERANK) ============
         filtered_results = self.filter_by_threshold(results)
+        filtered_results = self.rerank(question, filtered_results, timings)
         
-        # ============ STEP 3: CHECK IF GROUNDED ============
-        is_grounded = len(filtered_results) > 0
+        # ============ STEP 3: BUILD PROMPT + SOURCES ============
+        prompt, sources, is_grounded = self.prepare_generation(
+            question, filtered_results, history, use_fallback
+        )
         
         # ============ STEP 4: GENERATE ANSWER ============
-        if is_grounded:
-            # Có nguồn → build context và generate
-            context = self.build_context(filtered_results)
-            prompt = self.build_prompt(question, context, history)
-            
+        if prompt is None:
+            answer = NO_SOURCE_ANSWER
+        else:
+            step = time.perf_counter()
             try:
                 answer = call_llm(prompt)
             except Exception as e:
-                answer = f"Xin lỗi, đã có lỗi khi xử lý: {str(e)}"
-            
-            # Format sources
-            sources = self.format_sources(filtered_results)
-            
+                answer = (
+                    f"Xin lỗi, đã có lỗi khi xử lý: {str(e)}"
+                    if is_grounded else FALLBACK_ERROR_ANSWER
+                )
+            timings["llm_ms"] = (time.perf_counter() - step) * 1000
+        
+        # ============ STEP 5: CALCULATE LATENCY ============
+        latency_ms = (time.time() - start_time) * 1000
+        
+        self.store_cached_answer(
+            question, query_vector, answer, sources, is_grounded, latency_ms, history, filters
+        )
+        
+        return answer, sources, is_grounded, latency_ms
+    
+    # ================================================================
+    # ASYNC ASK / STREAM
+    # ================================================================
+    
+    async def _aembed_with_history(
+        self,
+        question: str,
+        history: Union[str, Awaitable[str]],
+        timings: dict
+    ) -> Tuple[List[float], str]:
+        """Embed câu hỏi, đồng thời chờ history nếu là awaitable"""
+        async def timed_embed():
+            start = time.perf_counter()
+            vector = await self.aembed_query(question)
+            timings["dense_embed_ms"] = (time.perf_counter() - start) * 1000
+            return vector
+        
+        if inspect.isawaitable(history):
+            query_vector, history = await asyncio.gather(timed_embed(), history)
         else:
-            # Không có nguồn phù hợp
-            if use_fallback:
-                # Dùng fallback prompt
-                prompt = self.build_fallback_prompt(question, history)
-                try:
-                    answer = call_llm(prompt)
-                except Exception as e:
-                    answer = (
-                        "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu nội bộ. "
-                        "Vui lòng liên hệ bộ phận HR hoặc Legal để được hỗ trợ."
-                    )
-            else:
-                # Không dùng LLM, trả về message cứng
+            query_vector = await timed_embed()
+        return query_vector, history
+    
+    async def aask(
+        self,
+        question: str,
+        history: Union[str, Awaitable[str]] = "",
+        use_fallback: bool = True,
+        timings: Optional[dict] = None,
+        filters: Optional[RetrievalFilter] = None
+    ) -> Tuple[str, List[Source], bool, float]:
+        """
+        Phiên bản async của ask() cho API
+        
+        - Embedding chạy trong thread pool giới hạn (EMBEDDING_WORKERS)
+        - Search dùng AsyncQdrantClient, generate dùng AsyncOpenAI
+        - Nếu history là awaitable (vd: đọc từ PostgreSQL), nó được
+          chạy song song với bước embed câu hỏi
+        
+        Returns:
+            Giống ask(): (answer, sources, is_grounded, latency_ms)
+        """
+        start_time = time.time()
+        timings = timings if timings is not None else {}
+        
+        # ============ STEP 0: EMBED (+ HISTORY song song) + CACHE ============
+        query_vector, history = await self._aembed_with_history(question, history, timings)
+        
+        cached = self.lookup_cached_answer(query_vector, history, filters)
+        if cached is not None:
+            answer, sources = cached
+            return answer, sources, True, (time.time() - start_time) * 1000
+        
+        # ============ STEP 1: RETRIEVE ============
+        results = await self.aretrieve_with_scores(
+            question, k=self.candidate_k, query_vector=query_vector,
+            timings=timings, filters=filters, score_threshold=self.search_threshold
+        )
+        
+        # ============ STEP 2: FILTER BY THRESHOLD (+ RERANK) ============
+        filtered_results = self.filter_by_threshold(results)
+        filtered_results = await self.arerank(question, filtered_results, timings)
+        
+        # ============ STEP 3: BUILD PROMPT + SOURCES ============
+        prompt, sources, is_grounded = self.prepare_generation(
+            question, filtered_results, history, use_fallback
+        )
+        
+        # ============ STEP 4: GENERATE ANSWER ============
+        if prompt is None:
+            answer = NO_SOURCE_ANSWER
+        else:
+            step = time.perf_counter()
+            try:
+                answer = await acall_llm(prompt)
+            except Exception as e:
                 answer = (
-                    "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu nội bộ. "
-                    "Vui lòng liên hệ:\n"
-                    "- HR: hr@abccorp.vn\n"
-                    "- Legal: legal@abccorp.vn\n"
-                    "- IT Support: it@abccorp.vn"
+                    f"Xin lỗi, đã có lỗi khi xử lý: {str(e)}"
+                    if is_grounded else FALLBACK_ERROR_ANSWER
                 )
-            
-            sources = []
+            timings["llm_ms"] = (time.perf_counter() - step) * 1000
         
         # ============ STEP 5: CALCULATE LATENCY ============
         latency_ms = (time.time() - start_time) * 1000
         
+        self.store_cached_answer(
+            question, query_vector, answer, sources, is_grounded, latency_ms, history, filters
+        )
+        
         return answer, sources, is_grounded, latency_ms
     
+    async def astream_ask(
+        self,
+        question: str,
+        history: Union[str, Awaitable[str]] = "",
+        use_fallback: bool = True,
+        timings: Optional[dict] = None,
+        filters: Optional[RetrievalFilter] = None
+    ) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Streaming version của aask() - yield events theo thứ tự:
+        
+        - ("sources", (sources, is_grounded)): ngay sau khi retrieve xong
+        - ("token", delta): từng đoạn text từ LLM (chưa clean)
+        - ("done", (answer, latency_ms)): câu trả lời đầy đủ đã clean - đây
+          là bản được cache / lưu history, client nên thay text đã stream
+        - ("error", message): LLM lỗi giữa chừng → kết thúc, không có "done",
+          câu trả lời dở không được cache
+        """
+        start_time = time.time()
+        timings = timings if timings is not None else {}
+        
+        # ============ STEP 0: EMBED (+ HISTORY song song) + CACHE ============
+        query_vector, history = await self._aembed_with_history(question, history, timings)
+        
+        cached = self.lookup_cached_answer(query_vector, history, filters)
+        if cached is not None:
+            answer, sources = cached
+            yield "sources", (sources, True)
+            yield "token", answer
+            yield "done", (answer, (time.time() - start_time) * 1000)
+            return
+        
+        # ============ STEP 1-3: RETRIEVE + FILTER + RERANK + BUILD PROMPT ============
+        results = await self.aretrieve_with_scores(
+            question, k=self.candidate_k, query_vector=query_vector,
+            timings=timings, filters=filters, score_threshold=self.search_threshold
+        )
+        filtered_results = self.filter_by_threshold(results)
+        filtered_results = await self.arerank(question, filtered_results, timings)
+        prompt, sources, is_grounded = self.prepare_generation(
+            question, filtered_results, history, use_fallback
+        )
+        
+        # Sources gửi trước để UI hiển thị trong lúc chờ LLM
+        yield "sources", (sources, is_grounded)
+        
+        # ============ STEP 4: STREAM ANSWER ============
+        if prompt is None:
+            answer = NO_SOURCE_ANSWER
+            yield "token", answer
+        else:
+            step = time.perf_counter()
+            parts = []
+            try:
+                async for delta in astream_llm(prompt):
+                    if not parts:
+                        timings["llm_first_token_ms"] = (time.perf_counter() - step) * 1000
+                    parts.append(delta)
+                    yield "token", delta
+            except LLMStreamError as e:
+                timings["llm_ms"] = (time.perf_counter() - step) * 1000
+                yield "error", str(e)
+                return
+            answer = clean_answer("".join(parts))
+            timings["llm_ms"] = (time.perf_counter() - step) * 1000
+        
+        # ============ STEP 5: CALCULATE LATENCY ============
+        latency_ms = (time.time() - start_time) * 1000
+        
+        self.store_cached_answer(
+            question, query_vector, answer, sources, is_grounded, latency_ms, history, filters
+        )
+        
+        yield "done", (answer, latency_ms)
+    
+    # ================================================================
+    # BATCH ASK
+    # ================================================================
+    
+    async def ask_batch(
+        self,
+        questions: List[str],
+        filters: Optional[RetrievalFilter] = None,
+        timings: Optional[dict] = None
+    ) -> AsyncIterator[Tuple[int, str, List[Source], bool, float, Optional[str]]]:
+        """
+        Trả lời nhiều câu hỏi độc lập (không history), yield theo thứ tự xong trước
+        
+        - Embed tất cả câu hỏi trong 1 lần encode
+        - Search tất cả trong 1 lần query_batch_points
+        - LLM chạy song song, tối đa BATCH_LLM_CONCURRENCY lời gọi cùng lúc
+        
+        Yields:
+            (index, answer, sources, is_grounded, latency_ms, error)
+            latency_ms tính từ lúc bắt đầu batch, error = None nếu không lỗi
+        """
+        start_time = time.time()
+        timings = timings if timings is not None else {}
+        
+        # ============ STEP 0: EMBED (1 lần encode) + SEMANTIC CACHE ============
+        step = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        query_vectors = await loop.run_in_executor(
+            self._embed_executor,
+            self.embeddings.embed_queries,
+            questions
+        )
+        timings["dense_embed_ms"] = (time.perf_counter() - step) * 1000
+        
+        pending = []
+        for index, query_vector in enumerate(query_vectors):
+            cached = self.lookup_cached_answer(query_vector, "", filters)
+            if cached is None:
+                pending.append(index)
+                continue
+            answer, sources = cached
+            yield index, answer, sources, True, (time.time() - start_time) * 1000, None
+        
+        if not pending:
+            return
+        
+        # ============ STEP 1: RETRIEVE (1 round trip) ============
+        batch_results = await self.aretrieve_batch(
+            [questions[i] for i in pending],
+            [query_vectors[i] for i in pending],
+            k=self.candidate_k,
+            timings=timings,
+            filters=filters,
+            score_threshold=self.search_threshold
+        )
+        
+        # ============ STEP 2-4: FILTER + RERANK + GENERATE (song song) ============
+        semaphore = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+        
+        async def answer_one(index: int, results: List[Tuple]):
+            question = questions[index]
+            error = None
+            try:
+                filtered_results = self.filter_by_threshold(results)
+                filtered_results = await self.arerank(question, filtered_results)
+                prompt, sources, is_grounded = self.prepare_generation(
+                    question, filtered_results
+                )
+                
+                if prompt is None:
+                    answer = NO_SOURCE_ANSWER
+                else:
+                    async with semaphore:
+                        answer = await acall_llm(prompt)
+                    if answer.startswith(LLM_ERROR_PREFIX):
+                        error = answer
+            except Exception as e:
+                answer = f"Xin lỗi, đã có lỗi khi xử lý: {str(e)}"
+                sources, is_grounded = [], False
+                error = str(e)
+            
+            latency_ms = (time.time() - start_time) * 1000
+            if error is None:
+                self.store_cached_answer(
+                    question, query_vectors[index], answer, sources, is_grounded,
+                    latency_ms, "", filters
+                )
+            return index, answer, sources, is_grounded, latency_ms, error
+        
+        tasks = [
+            asyncio.create_task(answer_one(index, results))
+            for index, results in zip(pending, batch_results)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client ngắt kết nối → hủy các lời gọi LLM còn lại
+            for task in tasks:
+                task.cancel()
+    
     # ================================================================
     # UTILITY METHODS
     # ================================================================
@@ -412,20 +1304,48 @@ Trả lời:"""
     
     def health_check(self) -> dict:
         """Kiểm tra trạng thái của RAG Engine"""
-        try:
-            collection_info = self.client.get_collection(self.collection_name)
-            points_count = collection_info.points_count
-        except:
-            points_count = 0
+        collection_version = None
+        if self.numpy_index is not None:
+            points_count = len(self.numpy_index)
+        else:
+            try:
+                collection_info = self.client.get_collection(self.collection_name)
+                points_count = collection_info.points_count
+            except:
+                points_count = 0
+            try:
+                collection_version = resolve_alias(self.client, self.collection_name)
+            except:
+                collection_version = None
             
         return {
-            "db_connected": self.client is not None,
+            "db_connected": self.client is not None or self.numpy_index is not None,
+            "retrieval_backend": settings.RETRIEVAL_BACKEND,
             "qdrant_url": settings.QDRANT_URL,
+            "qdrant_transport": describe_transport(),
+            "qdrant_storage": storage_settings() if self.numpy_index is None else None,
             "collection": self.collection_name,
+            "collection_version": collection_version,
             "vectors_count": points_count,
             "embedding_model": settings.EMBEDDING_MODEL,
             "top_k": settings.TOP_K,
-            "threshold": settings.SIMILARITY_THRESHOLD
+            "threshold": settings.SIMILARITY_THRESHOLD,
+            "embedding_cache": (
+                self.embeddings.query_cache.stats()
+                if self.embeddings.query_cache is not None else None
+            ),
+            "embedding_batcher": (
+                self.embeddings.batcher.stats()
+                if self.embeddings.batcher is not None else None
+            ),
+            "answer_cache": (
+                self.answer_cache.stats()
+                if self.answer_cache is not None else None
+            ),
+            "reranker": (
+                self.reranker.stats()
+                if self.reranker is not None else None
+            )
         }
 
 
@@ -0,0 +1,125 @@
+"""
+Cross-Encoder Reranker
+
+Retrieve nhiều candidates (RERANK_CANDIDATES) bằng vector search, rồi chấm
+lại từng cặp (query, chunk) bằng cross-encoder trong 1 lần predict (batched,
+CPU) và chỉ giữ RERANK_TOP_N chunks tốt nhất cho LLM.
+
+Score của cặp (query, chunk) được cache theo chunk id → câu hỏi lặp lại
+chỉ phải chấm các chunk mới.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+from app.cache import normalize_text
+
+
+class CrossEncoderReranker:
+    """
+    Rerank (RetrievedChunk, score) bằng sentence_transformers.CrossEncoder
+
+    Score trả về vẫn là cosine gốc (giữ nguyên ý nghĩa SIMILARITY_THRESHOLD
+    và Source.score); rerank score được ghi vào metadata["rerank_score"].
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 32,
+                 max_length: int = 512, cache_size: int = 20000):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.calls = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        print(f"  ✓ Reranker: {model_name}")
+
+    @staticmethod
+    def _chunk_key(doc) -> str:
+        """ID ổn định của chunk (point id, fallback source:chunk_id)"""
+        point_id = doc.metadata.get("point_id")
+        if point_id is not None:
+            return str(point_id)
+        return f"{doc.metadata.get('source', 'unknown')}:{doc.metadata.get('chunk_id', 0)}"
+
+    def score(self, query: str, docs: list) -> List[float]:
+        """Score cho từng (query, doc) - chỉ predict các cặp chưa có trong cache"""
+        query_key = normalize_text(query)
+        keys = [(query_key, self._chunk_key(doc)) for doc in docs]
+
+        scores = [None] * len(docs)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    scores[i] = cached
+            self.cache_hits += len(docs) - len(missing)
+
+        if missing:
+            # 1 lần predict cho tất cả cặp mới
+            predicted = self.model.predict(
+                [(query, docs[i].page_content) for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+            with self._lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                self.pairs_scored += len(missing)
+
+        self.calls += 1
+        return scores
+
+    def rerank(self, query: str, results: List[Tuple], top_n: int) -> List[Tuple]:
+        """
+        Sắp xếp lại results theo cross-encoder score, giữ top_n
+
+        Args:
+            results: List[(RetrievedChunk, cosine score)]
+
+        Returns:
+            List[(RetrievedChunk, cosine score)] theo thứ tự rerank
+        """
+        if not results:
+            return []
+
+        scores = self.score(query, [doc for doc, _ in results])
+        ranked = sorted(zip(results, scores), key=lambda item: item[1], reverse=True)
+
+        reranked = []
+        for (doc, similarity), rerank_score in ranked[:top_n]:
+            doc.metadata["rerank_score"] = rerank_score
+            reranked.append((doc, similarity))
+        return reranked
+
+    def clear(self) -> None:
+        """Xóa cache (corpus đã thay đổi)"""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        """Thống kê số cặp đã chấm và cache hit"""
+        total = self.pairs_scored + self.cache_hits
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "pairs_scored": self.pairs_scored,
+            "cache_size": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / total, 4) if total else 0.0
+        }
@@ -513,13 +513,20 @@ def render_sidebar():
                                     f"{API_URL}/admin/upload-document",
                                     files=files,
                                     headers=headers,
-                                    timeout=30
+                                    timeout=300  # upload + index file
                                 )
                                 
                                 if response.status_code == 200:
                                     result = response.json()
-                                    st.success(f"Upload thành công: {result.get('filename')}")
-                                    st.info("Nhấn 'Rebuild Index' để cập nhật vector database")
+                                    if result.get("indexed"):
+                                        index = result.get("index", {})
+                                        st.success(
+                                            f"Upload + index thành công: {result.get('filename')} "
+                                            f"({index.get('points', 0)} chunks, {index.get('seconds', 0)}s)"
+                                        )
+                                    else:
+                                        st.success(f"Upload thành công: {result.get('filename')}")
+                                        st.info(result.get("note", "Nhấn 'Rebuild Index' để cập nhật vector database"))
                                 else:
                                     error_msg = response.json().get("detail", "Upload thất bại")
                                     st.error(f"Lỗi: {error_msg}")
@@ -547,10 +554,12 @@ def render_sidebar():
                                             "DELETE",
                                             f"/admin/document/{doc['filename']}",
                                             require_auth=True,
-                                            timeout=10
+                                            timeout=60
                                         )
                                         if del_result:
                                             st.success(f"Đã xóa {doc['filename']}")
+                                            if not del_result.get("unindexed"):
+                                                st.info(del_result.get("note", ""))
                                             st.rerun()
                         else:
                             st.info("Chưa có tài liệu nào")
@@ -561,15 +570,51 @@ def render_sidebar():
                     
                     # Rebuild Index
                     st.markdown("**Rebuild Vector Database:**")
-                    st.caption("Cập nhật index sau khi thêm/xóa tài liệu")
+                    st.caption("Upload / xóa đã tự cập nhật index; rebuild khi sửa file trực tiếp trong thư mục data")
                     
+                    incremental = st.checkbox("Chỉ cập nhật file thay đổi", value=True, key="chk_incremental")
                     if st.button("Rebuild Index", key="btn_rebuild", type="primary", use_container_width=True):
-                        with st.spinner("Đang rebuild index... (có thể mất vài phút)"):
-                            result = api_request("POST", "/admin/rebuild-index", require_auth=True, timeout=300)
-                            if result:
-                                st.success(f"Rebuild thành công! {result.get('vectors_count', 0)} vectors")
+                        endpoint = "/admin/rebuild-index" + ("?incremental=true" if incremental else "")
+                        job = api_request("POST", endpoint, require_auth=True, timeout=10)
+                        if job:
+                            st.session_state.index_job_id = job["job_id"]
+                    
+                    # Theo dõi background job (poll GET /admin/jobs/{job_id})
+                    if st.session_state.get("index_job_id"):
+                        job_id = st.session_state.index_job_id
+                        job = api_request("GET", f"/admin/jobs/{job_id}", require_auth=True, timeout=5)
+                        if job:
+                            progress = job.get("progress") or {}
+                            files_total = progress.get("files_total") or 0
+                            files_done = progress.get("files_done") or 0
+                            
+                            if job["status"] in ("queued", "running", "cancelling"):
+                                st.progress(
+                                    files_done / files_total if files_total else 0.0,
+                                    text=f"{progress.get('stage', job['status'])}: {files_done}/{files_total} files"
+                                )
+                                st.caption(
+                                    f"{progress.get('pages', 0)} trang · {progress.get('chunks', 0)} chunks · "
+                                    f"{progress.get('points_uploaded', 0)} points"
+                                )
+                                if st.button("Hủy", key="btn_cancel_job", use_container_width=True):
+                                    api_request("POST", f"/admin/jobs/{job_id}/cancel", require_auth=True, timeout=10)
+                                time.sleep(2)
+                                st.rerun()
+                            elif job["status"] == "succeeded":
+                                result = job.get("result") or {}
+                                if result.get("full_rebuild"):
+                                    st.success(f"Rebuild thành công! {result.get('points', 0)} vectors")
+                                else:
+                                    updated = len(result.get("added", [])) + len(result.get("changed", []))
+                                    st.success(f"Cập nhật thành công! {updated} file, {result.get('points_upserted', 0)} points")
+                                st.session_state.index_job_id = None
+                            elif job["status"] == "cancelled":
+                                st.warning("Đã hủy rebuild")
+                                st.session_state.index_job_id = None
                             else:
-                                st.error("Rebuild thất bại")
+                                st.error(f"Rebuild thất bại: {job.get('error')}")
+                                st.session_state.index_job_id = None
                 
                 st.divider()
         
@@ -664,10 +709,31 @@ def render_sidebar():
 # CHAT INTERFACE
 # ================================================================
 
+def fetch_chunk_content(point_ids: list) -> str:
+    """
+    Lấy nội dung đầy đủ của nguồn qua GET /chunks/{point_id}
+    
+    Cache trong session_state (nội dung chunk không đổi cho đến khi rebuild index)
+    """
+    if "chunk_cache" not in st.session_state:
+        st.session_state.chunk_cache = {}
+    cache = st.session_state.chunk_cache
+    
+    parts = []
+    for point_id in point_ids:
+        if point_id not in cache:
+            data = api_request("GET", f"/chunks/{point_id}", require_auth=True, timeout=10)
+            if data is None:
+                continue
+            cache[point_id] = data.get("content", "")
+        parts.append(cache[point_id])
+    return "\n".join(parts)
+
+
 def render_message(role: str, content: str, sources: list = None, 
                    latency: float = None, is_grounded: bool = True,
                    show_sources: bool = True, show_scores: bool = True,
-                   show_latency: bool = True):
+                   show_latency: bool = True, message_key: str = "msg"):
     """Render a chat message"""
     
     if role == "user":
@@ -692,7 +758,8 @@ def render_message(role: str, content: str, sources: list = None,
                     # Lấy thông tin
                     source_name = src.get('source', 'Unknown')
                     score = src.get('score', 0)
-                    full_content = src.get('full_content', '') or src.get('excerpt', '')
+                    full_content = src.get('full_content') or src.get('excerpt', '')
+                    point_ids = src.get('point_ids') or []
                     page = src.get('page')
                     chunk_id = src.get('chunk_id', i)
                     
@@ -713,6 +780,15 @@ def render_message(role: str, content: str, sources: list = None,
                     st.markdown(f"**{display_name}**{score_text}")
                     st.caption(location_info)
                     
+                    # Compact sources: chỉ có excerpt, lấy toàn văn khi user yêu cầu
+                    if not src.get('full_content') and point_ids:
+                        expanded_key = f"full_{message_key}_{i}"
+                        if st.session_state.get(expanded_key):
+                            full_content = fetch_chunk_content(point_ids) or full_content
+                        elif st.button("Xem toàn văn", key=f"btn_{expanded_key}"):
+                            st.session_state[expanded_key] = True
+                            full_content = fetch_chunk_content(point_ids) or full_content
+                    
                     # Nội dung đầy đủ trong container cuộn được
                     if full_content:
                         # Escape HTML characters
@@ -853,7 +929,7 @@ def main():
     
     # Display chat history
     with chat_container:
-        for msg in st.session_state.messages:
+        for msg_idx, msg in enumerate(st.session_state.messages):
             render_message(
                 role=msg["role"],
                 content=msg["content"],
@@ -862,7 +938,8 @@ def main():
                 is_grounded=msg.get("is_grounded", True),
                 show_sources=show_sources,
                 show_scores=show_scores,
-                show_latency=show_latency
+                show_latency=show_latency,
+                message_key=str(msg_idx)
             )
     
     # Check for pending quick question
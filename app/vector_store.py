@@ -0,0 +1,316 @@
+"""
+Qdrant Client Factory
+
+Một chỗ duy nhất tạo QdrantClient / AsyncQdrantClient cho RAGEngine,
+ingest và run.py --mode check:
+    - prefer_grpc: search qua gRPC (port 6334, protobuf) thay vì REST/JSON
+      → vector 1024 floats không phải serialize thành text
+    - Timeout và connection pool cấu hình qua settings
+    - Cấu hình storage của collection: quantization, on_disk, HNSW
+    - Payload indexes + metadata filter (source, file_type, page)
+    - Blue/green: collection theo version + alias QDRANT_COLLECTION_NAME
+"""
+
+import time
+from typing import List, Optional
+
+import httpx
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    HnswConfigDiff,
+    SearchParams,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Filter,
+    FieldCondition,
+    MatchAny,
+    MatchValue,
+    HasIdCondition,
+    FilterSelector,
+    Range,
+    PayloadSchemaType,
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation
+)
+
+from app.config import settings
+
+
+# Payload fields được index để filter (field → kiểu index)
+PAYLOAD_INDEX_FIELDS = {
+    "source": PayloadSchemaType.KEYWORD,
+    "file_type": PayloadSchemaType.KEYWORD,
+    "page": PayloadSchemaType.INTEGER,
+}
+
+
+def qdrant_client_kwargs() -> dict:
+    """
+    Tham số chung cho QdrantClient và AsyncQdrantClient
+
+    - REST: httpx connection pool (keep-alive) giới hạn QDRANT_POOL_SIZE
+    - gRPC: 1 channel HTTP/2 multiplex tất cả request → không cần pool
+    """
+    kwargs = {
+        "url": settings.QDRANT_URL,
+        "grpc_port": settings.QDRANT_GRPC_PORT,
+        "prefer_grpc": settings.QDRANT_PREFER_GRPC,
+        "api_key": settings.QDRANT_API_KEY,
+        "timeout": settings.QDRANT_TIMEOUT,
+    }
+    if settings.QDRANT_PREFER_GRPC:
+        kwargs["grpc_options"] = {
+            "grpc.keepalive_time_ms": 30000,
+            "grpc.max_receive_message_length": 64 * 1024 * 1024,
+        }
+    else:
+        kwargs["limits"] = httpx.Limits(
+            max_connections=settings.QDRANT_POOL_SIZE,
+            max_keepalive_connections=settings.QDRANT_POOL_SIZE
+        )
+    return kwargs
+
+
+def create_qdrant_client() -> QdrantClient:
+    """Sync client (ingest, scripts, health check)"""
+    return QdrantClient(**qdrant_client_kwargs())
+
+
+def create_async_qdrant_client() -> AsyncQdrantClient:
+    """Async client cho API path (không block event loop)"""
+    return AsyncQdrantClient(**qdrant_client_kwargs())
+
+
+def describe_transport() -> str:
+    """Mô tả transport đang dùng (cho log)"""
+    if settings.QDRANT_PREFER_GRPC:
+        return f"gRPC :{settings.QDRANT_GRPC_PORT}"
+    return f"REST (pool={settings.QDRANT_POOL_SIZE})"
+
+
+# ================================================================
+# COLLECTION STORAGE / INDEX CONFIG
+# ================================================================
+
+def quantization_config(mode: str = None):
+    """
+    Quantization config theo QDRANT_QUANTIZATION
+
+    - "scalar": int8 (mỗi chiều 1 byte, RAM giảm ~4 lần)
+    - "binary": 1 bit/chiều (RAM giảm ~32 lần, cần oversampling + rescore)
+    - "none": không quantize
+    """
+    mode = mode or settings.QDRANT_QUANTIZATION
+    always_ram = settings.QDRANT_QUANTIZATION_ALWAYS_RAM
+
+    if mode == "none":
+        return None
+    if mode == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=0.99,
+                always_ram=always_ram
+            )
+        )
+    if mode == "binary":
+        return BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=always_ram)
+        )
+
+    raise ValueError(
+        f"QDRANT_QUANTIZATION không hợp lệ: '{mode}' "
+        f"(chỉ hỗ trợ 'none', 'scalar' hoặc 'binary')"
+    )
+
+
+def dense_vector_params(size: int, quantization: str = None,
+                        on_disk: bool = None) -> VectorParams:
+    """VectorParams cho dense vector: on_disk + HNSW + quantization"""
+    return VectorParams(
+        size=size,
+        distance=Distance.COSINE,
+        on_disk=settings.QDRANT_VECTORS_ON_DISK if on_disk is None else on_disk,
+        hnsw_config=HnswConfigDiff(
+            m=settings.QDRANT_HNSW_M,
+            ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT
+        ),
+        quantization_config=quantization_config(quantization)
+    )
+
+
+def dense_search_params(quantization: str = None) -> SearchParams:
+    """SearchParams cho dense leg: hnsw_ef + oversampling/rescore khi có quantization"""
+    mode = quantization or settings.QDRANT_QUANTIZATION
+    quantization_params = None
+    if mode != "none":
+        quantization_params = QuantizationSearchParams(
+            rescore=settings.QDRANT_QUANTIZATION_RESCORE,
+            oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING
+        )
+    return SearchParams(
+        hnsw_ef=settings.QDRANT_HNSW_EF,
+        quantization=quantization_params
+    )
+
+
+def storage_settings() -> dict:
+    """Cấu hình storage / index hiện tại (báo cáo trong /health)"""
+    quantization = settings.QDRANT_QUANTIZATION
+    return {
+        "quantization": quantization,
+        "quantization_always_ram": settings.QDRANT_QUANTIZATION_ALWAYS_RAM if quantization != "none" else None,
+        "oversampling": settings.QDRANT_QUANTIZATION_OVERSAMPLING if quantization != "none" else None,
+        "rescore": settings.QDRANT_QUANTIZATION_RESCORE if quantization != "none" else None,
+        "vectors_on_disk": settings.QDRANT_VECTORS_ON_DISK,
+        "payload_on_disk": settings.QDRANT_PAYLOAD_ON_DISK,
+        "hnsw_m": settings.QDRANT_HNSW_M,
+        "hnsw_ef_construct": settings.QDRANT_HNSW_EF_CONSTRUCT,
+        "hnsw_ef": settings.QDRANT_HNSW_EF
+    }
+
+
+# ================================================================
+# PAYLOAD INDEXES + METADATA FILTER
+# ================================================================
+
+def create_payload_indexes(client: QdrantClient, collection_name: str) -> None:
+    """Tạo payload index cho các field filter (source, file_type, page)"""
+    for field, schema in PAYLOAD_INDEX_FIELDS.items():
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field,
+            field_schema=schema,
+            wait=True
+        )
+
+
+def build_payload_filter(filters) -> Optional[Filter]:
+    """
+    RetrievalFilter → Qdrant Filter (None nếu không có điều kiện)
+
+    Qdrant dùng payload index để chỉ search trong tập đã filter
+    """
+    if filters is None or filters.is_empty():
+        return None
+
+    must = []
+    if filters.source:
+        must.append(FieldCondition(key="source", match=MatchAny(any=filters.source)))
+    if filters.file_type:
+        must.append(FieldCondition(key="file_type", match=MatchAny(any=filters.file_type)))
+    if filters.page_from is not None or filters.page_to is not None:
+        must.append(FieldCondition(
+            key="page",
+            range=Range(gte=filters.page_from, lte=filters.page_to)
+        ))
+    return Filter(must=must)
+
+
+def delete_source_points(client: QdrantClient, collection_name: str, source: str,
+                         keep_ids: Optional[List[str]] = None) -> None:
+    """
+    Xóa points của 1 file (filter theo payload source)
+
+    keep_ids: points vẫn còn trong version mới của file → không xóa
+    """
+    selector = Filter(
+        must=[FieldCondition(key="source", match=MatchValue(value=source))],
+        must_not=[HasIdCondition(has_id=keep_ids)] if keep_ids else None
+    )
+    client.delete(
+        collection_name=collection_name,
+        points_selector=FilterSelector(filter=selector),
+        wait=True
+    )
+
+
+def payload_matches(source, file_type, page, filters) -> bool:
+    """Cùng điều kiện với build_payload_filter, áp dụng trên payload in-process"""
+    if filters.source and source not in filters.source:
+        return False
+    if filters.file_type and file_type not in filters.file_type:
+        return False
+    if filters.page_from is not None and (page is None or page < filters.page_from):
+        return False
+    if filters.page_to is not None and (page is None or page > filters.page_to):
+        return False
+    return True
+
+
+# ================================================================
+# BLUE/GREEN COLLECTIONS (ALIAS)
+# ================================================================
+
+def version_prefix(alias: str) -> str:
+    """Prefix tên các collection version của 1 alias"""
+    return f"{alias}__v"
+
+
+def new_version_name(alias: str) -> str:
+    """Tên collection cho lần build mới (vd: abc_corp_docs__v20250105103000)"""
+    return f"{version_prefix(alias)}{time.strftime('%Y%m%d%H%M%S')}"
+
+
+def resolve_alias(client: QdrantClient, alias: str) -> Optional[str]:
+    """Collection mà alias đang trỏ tới (None nếu alias chưa tồn tại)"""
+    for item in client.get_aliases().aliases:
+        if item.alias_name == alias:
+            return item.collection_name
+    return None
+
+
+def list_versions(client: QdrantClient, alias: str) -> List[str]:
+    """Các collection version của alias, cũ → mới"""
+    prefix = version_prefix(alias)
+    names = [c.name for c in client.get_collections().collections]
+    return sorted(name for name in names if name.startswith(prefix))
+
+
+def switch_alias(client: QdrantClient, alias: str, collection_name: str) -> Optional[str]:
+    """
+    Trỏ alias sang collection mới (atomic: xóa + tạo alias trong 1 request)
+
+    Returns:
+        Collection alias trỏ tới trước đó (None nếu chưa có)
+    """
+    previous = resolve_alias(client, alias)
+
+    # Lần đầu chuyển sang alias: collection cũ trùng tên alias phải bị xóa
+    # trước (alias và collection không thể trùng tên)
+    if previous is None and client.collection_exists(alias):
+        print(f" ⚠️ Xóa collection cũ '{alias}' để tạo alias cùng tên")
+        client.delete_collection(alias)
+
+    operations = []
+    if previous is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    operations.append(CreateAliasOperation(
+        create_alias=CreateAlias(collection_name=collection_name, alias_name=alias)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    return previous
+
+
+def garbage_collect_versions(client: QdrantClient, alias: str, keep: int) -> List[str]:
+    """
+    Xóa các version cũ, giữ lại version đang dùng + `keep` version trước đó
+
+    Returns:
+        Tên các collection đã xóa
+    """
+    current = resolve_alias(client, alias)
+    older = [name for name in list_versions(client, alias) if name != current]
+    to_delete = older[:-keep] if keep > 0 else older
+
+    for name in to_delete:
+        client.delete_collection(name)
+    return to_delete
@@ -72,10 +72,10 @@ def check_system():
     # 4. Check Qdrant connection
     print("\n🔍 Checking Qdrant connection...")
     try:
-        from qdrant_client import QdrantClient
-        client = QdrantClient(url=settings.QDRANT_URL)
+        from app.vector_store import create_qdrant_client, describe_transport
+        client = create_qdrant_client()
         collection_info = client.get_collection(settings.QDRANT_COLLECTION_NAME)
-        print(f"  Qdrant: ✅ Connected ({collection_info.points_count} vectors)")
+        print(f"  Qdrant: ✅ Connected via {describe_transport()} ({collection_info.points_count} vectors)")
     except Exception as e:
         print(f"  Qdrant: ⚠️ Not connected - {str(e)}")
         issues.append("Qdrant not running or collection not created - run 'python -m app.ingest' first")
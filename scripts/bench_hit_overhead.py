@@ -0,0 +1,151 @@
+"""
+Micro-benchmark: chi phí xử lý hits mỗi query
+
+So sánh 2 cách retrieve trên collection thật (QDRANT_COLLECTION_NAME):
+    - before: with_payload=True, không score_threshold, tạo langchain
+      Document cho mọi hit rồi lọc SIMILARITY_THRESHOLD bằng Python
+    - after : payload projection (RETRIEVAL_PAYLOAD_FIELDS), score_threshold
+      phía Qdrant, RetrievedChunk (__slots__)
+
+Query vectors lấy từ chính các vectors trong collection (cộng nhiễu nhỏ)
+để score phân bố giống câu hỏi thật.
+
+Usage:
+    python scripts/bench_hit_overhead.py
+    python scripts/bench_hit_overhead.py --queries 200 --limit 50
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+
+from app.config import settings
+from app.models import RetrievedChunk
+from app.rag_engine import RETRIEVAL_PAYLOAD_FIELDS
+from app.vector_store import create_qdrant_client, dense_search_params
+
+
+def sample_queries(client, n: int, noise: float, seed: int = 0) -> list:
+    """Lấy n vectors từ collection, cộng nhiễu Gaussian rồi normalize"""
+    points, _ = client.scroll(
+        collection_name=settings.QDRANT_COLLECTION_NAME,
+        limit=n,
+        with_payload=False,
+        with_vectors=[settings.DENSE_VECTOR_NAME]
+    )
+    rng = np.random.default_rng(seed)
+    queries = []
+    for point in points:
+        vec = np.asarray(point.vector[settings.DENSE_VECTOR_NAME], dtype=np.float32)
+        vec = vec + rng.normal(0, noise, vec.shape).astype(np.float32)
+        queries.append((vec / np.linalg.norm(vec)).tolist())
+    return queries
+
+
+def run_before(client, query, limit: int) -> int:
+    result = client.query_points(
+        collection_name=settings.QDRANT_COLLECTION_NAME,
+        query=query,
+        using=settings.DENSE_VECTOR_NAME,
+        limit=limit,
+        with_payload=True,
+        search_params=dense_search_params()
+    )
+    hits = [
+        (Document(page_content=p.payload.get("content", ""), metadata={
+            "source": p.payload.get("source", "unknown"),
+            "file_type": p.payload.get("file_type", "unknown"),
+            "page": p.payload.get("page", 0),
+            "chunk_id": p.payload.get("chunk_id", 0),
+            "point_id": p.id
+        }), p.score)
+        for p in result.points
+    ]
+    return len([h for h in hits if h[1] >= settings.SIMILARITY_THRESHOLD])
+
+
+def run_after(client, query, limit: int) -> int:
+    result = client.query_points(
+        collection_name=settings.QDRANT_COLLECTION_NAME,
+        query=query,
+        using=settings.DENSE_VECTOR_NAME,
+        limit=limit,
+        with_payload=RETRIEVAL_PAYLOAD_FIELDS,
+        search_params=dense_search_params(),
+        score_threshold=settings.SIMILARITY_THRESHOLD
+    )
+    hits = [
+        (RetrievedChunk(page_content=p.payload.get("content", ""), metadata={
+            "source": p.payload.get("source", "unknown"),
+            "file_type": p.payload.get("file_type", "unknown"),
+            "page": p.payload.get("page", 0),
+            "chunk_id": p.payload.get("chunk_id", 0),
+            "point_id": p.id
+        }), p.score)
+        for p in result.points
+    ]
+    return len(hits)
+
+
+def bench(fn, client, queries, limit: int) -> tuple:
+    fn(client, queries[0], limit)  # warmup
+    latencies = []
+    kept = 0
+    for query in queries:
+        start = time.perf_counter()
+        kept += fn(client, query, limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.mean(latencies), np.percentile(latencies, 50), np.percentile(latencies, 95), kept / len(queries)
+
+
+def bench_objects(n: int) -> tuple:
+    """µs để tạo 1 Document vs 1 RetrievedChunk"""
+    metadata = {"source": "a.pdf", "file_type": "pdf", "page": 1, "chunk_id": 0, "point_id": "x"}
+    content = "x" * 500
+
+    start = time.perf_counter()
+    for _ in range(n):
+        Document(page_content=content, metadata=dict(metadata))
+    document_us = (time.perf_counter() - start) * 1e6 / n
+
+    start = time.perf_counter()
+    for _ in range(n):
+        RetrievedChunk(page_content=content, metadata=dict(metadata))
+    chunk_us = (time.perf_counter() - start) * 1e6 / n
+    return document_us, chunk_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hit processing overhead benchmark")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=settings.HYBRID_CANDIDATES)
+    parser.add_argument("--noise", type=float, default=0.03)
+    args = parser.parse_args()
+
+    document_us, chunk_us = bench_objects(20000)
+
+    client = create_qdrant_client()
+    queries = sample_queries(client, args.queries, args.noise)
+
+    print("=" * 70)
+    print(f" HIT OVERHEAD BENCHMARK (limit={args.limit}, "
+          f"threshold={settings.SIMILARITY_THRESHOLD}, queries={len(queries)})")
+    print("=" * 70)
+    print(f" Object: Document {document_us:.2f}µs  vs  RetrievedChunk {chunk_us:.2f}µs")
+    print()
+    print(f" {'variant':<10}{'mean (ms)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}{'hits kept':>12}")
+    for name, fn in (("before", run_before), ("after", run_after)):
+        mean, p50, p95, kept = bench(fn, client, queries, args.limit)
+        print(f" {name:<10}{mean:>12.2f}{p50:>12.2f}{p95:>12.2f}{kept:>12.1f}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
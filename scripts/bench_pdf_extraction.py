@@ -0,0 +1,111 @@
+"""
+Benchmark: tốc độ extract PDF (pages/sec)
+
+So sánh trên các PDF trong DATA_DIR (mặc định data/legal_kb), 1 process:
+    - before: pdfplumber extract_text + extract_tables cho mọi trang
+    - pdfium : text bằng pdfium, extract_tables chỉ trên trang có đường kẻ
+    - cached : page cache đã warm (chỉ đọc SQLite)
+
+Kiểm tra thêm số bảng tìm được ở before và pdfium phải bằng nhau
+(gating không được làm mất bảng nào).
+
+Usage:
+    python scripts/bench_pdf_extraction.py
+    python scripts/bench_pdf_extraction.py --data-dir data/legal_kb --repeat 3
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.cache import PdfPageCache
+from app.ingest import (
+    extract_pages_pdfium,
+    extract_pages_pdfplumber,
+    pdf_page_count,
+    file_sha256
+)
+
+
+def count_tables(contents: dict) -> int:
+    return sum(content.count("[Bảng ") for content in contents.values())
+
+
+def bench(fn, pdfs: list, repeat: int) -> tuple:
+    """(pages/sec tốt nhất, kết quả lần chạy cuối)"""
+    best = None
+    results = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = {path: fn(path, page_count) for path, page_count in pdfs}
+        took = time.perf_counter() - started
+        best = took if best is None else min(best, took)
+    total_pages = sum(page_count for _, page_count in pdfs)
+    return total_pages / best if best else 0.0, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF extraction benchmark")
+    parser.add_argument("--data-dir", default=settings.DATA_DIR)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pdfs = [
+        (os.path.join(args.data_dir, file), None)
+        for file in sorted(os.listdir(args.data_dir)) if file.endswith(".pdf")
+    ]
+    pdfs = [(path, pdf_page_count(path)) for path, _ in pdfs]
+    total_pages = sum(page_count for _, page_count in pdfs)
+    if not total_pages:
+        print(f"No PDF pages in {args.data_dir}")
+        return
+
+    def run_before(path, page_count):
+        return extract_pages_pdfplumber(path, list(range(1, page_count + 1)))
+
+    table_pages = {}
+
+    def run_pdfium(path, page_count):
+        contents, table_pages[path] = extract_pages_pdfium(path, list(range(1, page_count + 1)))
+        return contents
+
+    before_rate, before = bench(run_before, pdfs, args.repeat)
+    pdfium_rate, fast = bench(run_pdfium, pdfs, args.repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PdfPageCache(os.path.join(tmp, "pages.sqlite"))
+        hashes = {path: file_sha256(path) for path, _ in pdfs}
+        for path, contents in fast.items():
+            cache.put_many(hashes[path], contents, "bench")
+
+        def run_cached(path, page_count):
+            return cache.get_many(file_sha256(path), list(range(1, page_count + 1)), "bench")
+
+        cached_rate, _ = bench(run_cached, pdfs, args.repeat)
+
+    tables_before = sum(count_tables(contents) for contents in before.values())
+    tables_fast = sum(count_tables(contents) for contents in fast.values())
+
+    print("=" * 70)
+    print(f" PDF EXTRACTION BENCHMARK ({len(pdfs)} files, {total_pages} pages, "
+          f"best of {args.repeat})")
+    print("=" * 70)
+    print(f" {'variant':<10}{'pages/s':>12}{'speedup':>12}")
+    for name, rate in (("before", before_rate), ("pdfium", pdfium_rate), ("cached", cached_rate)):
+        speedup = rate / before_rate if before_rate else 0.0
+        print(f" {name:<10}{rate:>12.1f}{speedup:>11.1f}x")
+    print()
+    print(f" Pages with ruling lines (extract_tables ran): "
+          f"{sum(table_pages.values())}/{total_pages}")
+    print(f" Tables found: before {tables_before}, pdfium {tables_fast}"
+          + ("" if tables_before == tables_fast else "  ⚠️ MISMATCH"))
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Qdrant Storage Benchmark: quantization / on_disk vs RAM và latency
+
+Với mỗi cấu hình (none, scalar, binary, on_disk + scalar...), tạo 1
+collection tạm chứa N vectors ngẫu nhiên (normalize), đo:
+    - Search latency p50 / p95 (dùng dense_search_params như RAGEngine)
+    - Recall@k so với exact search (NumPy brute force)
+    - RAM ước tính cho vectors (float32 gốc + vector quantized)
+
+HNSW m / ef_construct / ef lấy từ settings (QDRANT_HNSW_*).
+
+Usage:
+    python scripts/bench_quantization.py
+    python scripts/bench_quantization.py --size 200000 --configs none scalar binary
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.vector_store import create_qdrant_client, dense_vector_params, dense_search_params
+
+
+# name → (quantization, vectors on_disk)
+CONFIGS = {
+    "none": ("none", False),
+    "scalar": ("scalar", False),
+    "binary": ("binary", False),
+    "ondisk": ("none", True),
+    "ondisk_scalar": ("scalar", True),
+    "ondisk_binary": ("binary", True),
+}
+
+
+def random_vectors(n: int, dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def estimated_ram_mb(n: int, dim: int, quantization: str, on_disk: bool) -> float:
+    """RAM cho vectors (không tính HNSW graph và payload)"""
+    original = 0 if on_disk else n * dim * 4
+    quantized = {"none": 0, "scalar": n * dim, "binary": n * dim / 8}[quantization]
+    return (original + quantized) / (1024 * 1024)
+
+
+def bench_config(client, name: str, vectors: np.ndarray, queries: np.ndarray,
+                 truth: np.ndarray, k: int) -> dict:
+    quantization, on_disk = CONFIGS[name]
+    collection = f"bench_storage_{name}"
+
+    client.recreate_collection(
+        collection_name=collection,
+        vectors_config={
+            settings.DENSE_VECTOR_NAME: dense_vector_params(
+                vectors.shape[1], quantization=quantization, on_disk=on_disk
+            )
+        }
+    )
+    try:
+        client.upload_collection(
+            collection_name=collection,
+            vectors={settings.DENSE_VECTOR_NAME: vectors},
+            ids=range(len(vectors)),
+            batch_size=512,
+            wait=True
+        )
+        # Chờ optimizer build xong HNSW / quantized storage
+        while client.get_collection(collection).status != "green":
+            time.sleep(0.5)
+
+        params = dense_search_params(quantization)
+        latencies = []
+        recalls = []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = client.query_points(
+                collection_name=collection,
+                query=query.tolist(),
+                using=settings.DENSE_VECTOR_NAME,
+                limit=k,
+                search_params=params
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = {int(p.id) for p in result.points}
+            recalls.append(len(found & set(expected.tolist())) / k)
+
+        p50, p95 = np.percentile(latencies, [50, 95])
+        return {
+            "ram_mb": estimated_ram_mb(len(vectors), vectors.shape[1], quantization, on_disk),
+            "p50": p50,
+            "p95": p95,
+            "recall": float(np.mean(recalls))
+        }
+    finally:
+        client.delete_collection(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qdrant quantization / on_disk benchmark")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=settings.EMBEDDING_DIM)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=settings.TOP_K)
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    args = parser.parse_args()
+
+    vectors = random_vectors(args.size, args.dim, seed=0)
+    queries = random_vectors(args.queries, args.dim, seed=1)
+
+    # Ground truth: exact top-k
+    scores = queries @ vectors.T
+    truth = np.argsort(-scores, axis=1)[:, :args.top_k]
+    del scores
+
+    client = create_qdrant_client()
+
+    print("=" * 78)
+    print(f" STORAGE BENCHMARK (N={args.size:,}, dim={args.dim}, top_k={args.top_k}, "
+          f"hnsw m={settings.QDRANT_HNSW_M} ef={settings.QDRANT_HNSW_EF}, "
+          f"oversampling={settings.QDRANT_QUANTIZATION_OVERSAMPLING})")
+    print("=" * 78)
+    print(f" {'config':<16}{'RAM vectors (MB)':>18}{'p50 (ms)':>12}{'p95 (ms)':>12}{'recall@k':>12}")
+
+    for name in args.configs:
+        r = bench_config(client, name, vectors, queries, truth, args.top_k)
+        print(f" {name:<16}{r['ram_mb']:>18.1f}{r['p50']:>12.2f}{r['p95']:>12.2f}{r['recall']:>12.2%}")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
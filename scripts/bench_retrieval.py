@@ -0,0 +1,121 @@
+"""
+Retrieval Backend Benchmark: NumPy exact search vs Qdrant
+
+Sinh N vectors ngẫu nhiên (đã normalize, EMBEDDING_DIM chiều), ghi vào
+NumPy index (memory-mapped) và 1 Qdrant collection tạm, rồi đo latency
+top-k search cho từng backend.
+
+Usage:
+    python scripts/bench_retrieval.py                       # 1k, 100k, 1M
+    python scripts/bench_retrieval.py --sizes 1000 100000 --dtype float32
+    python scripts/bench_retrieval.py --skip-qdrant         # chỉ NumPy
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.numpy_index import NumpyIndex, write_numpy_index
+
+
+def random_vectors(n: int, dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentiles(latencies_ms: list) -> str:
+    p50, p95 = np.percentile(latencies_ms, [50, 95])
+    return f"p50={p50:8.2f}ms  p95={p95:8.2f}ms"
+
+
+def bench_numpy(vectors: np.ndarray, queries: np.ndarray, k: int, dtype: str) -> str:
+    index_dir = tempfile.mkdtemp(prefix="bench_numpy_")
+    try:
+        write_numpy_index(
+            os.path.join(index_dir, "index"),
+            vectors,
+            ({"chunk_id": i} for i in range(len(vectors))),
+            dtype=dtype
+        )
+        index = NumpyIndex(os.path.join(index_dir, "index"))
+        index.search(queries[0], k)  # warmup (page-in mmap)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        index.close()
+        return percentiles(latencies)
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+def bench_qdrant(vectors: np.ndarray, queries: np.ndarray, k: int) -> str:
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, VectorParams
+
+    client = QdrantClient(url=settings.QDRANT_URL)
+    collection = f"bench_{len(vectors)}"
+    client.recreate_collection(
+        collection_name=collection,
+        vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE)
+    )
+    try:
+        client.upload_collection(
+            collection_name=collection,
+            vectors=vectors,
+            ids=range(len(vectors)),
+            batch_size=1024,
+            wait=True
+        )
+        client.query_points(collection_name=collection, query=queries[0].tolist(), limit=k)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            client.query_points(collection_name=collection, query=query.tolist(), limit=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return percentiles(latencies)
+    finally:
+        client.delete_collection(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy vs Qdrant retrieval benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=settings.EMBEDDING_DIM)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=settings.TOP_K)
+    parser.add_argument("--dtype", default=settings.NUMPY_INDEX_DTYPE, choices=["float16", "float32"])
+    parser.add_argument("--skip-qdrant", action="store_true")
+    args = parser.parse_args()
+
+    queries = random_vectors(args.queries, args.dim, seed=1)
+
+    print("=" * 70)
+    print(f" RETRIEVAL BENCHMARK (dim={args.dim}, top_k={args.top_k}, numpy dtype={args.dtype})")
+    print("=" * 70)
+
+    for n in args.sizes:
+        vectors = random_vectors(n, args.dim, seed=0)
+        print(f"\n N = {n:,}")
+        print(f"   numpy : {bench_numpy(vectors, queries, args.top_k, args.dtype)}")
+        if not args.skip_qdrant:
+            print(f"   qdrant: {bench_qdrant(vectors, queries, args.top_k)}")
+        del vectors
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
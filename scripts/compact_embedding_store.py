@@ -0,0 +1,49 @@
+"""
+Compact chunk embedding store (CHUNK_EMBEDDING_STORE_DIR)
+
+Ghi lại file vectors chỉ với các chunk còn được index trỏ tới (bỏ row thừa
+sau crash), tùy chọn xóa chunk không được ingest dùng tới trong N ngày.
+
+Usage:
+    python scripts/compact_embedding_store.py
+    python scripts/compact_embedding_store.py --older-than-days 30
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.cache import ChunkEmbeddingStore
+from app.embeddings import embedding_model_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact chunk embedding store")
+    parser.add_argument("--older-than-days", type=float, default=None,
+                        help="Xóa chunk không được dùng trong N ngày")
+    args = parser.parse_args()
+
+    if not settings.CHUNK_EMBEDDING_STORE_DIR:
+        print("CHUNK_EMBEDDING_STORE_DIR is not set")
+        return
+
+    store = ChunkEmbeddingStore(
+        settings.CHUNK_EMBEDDING_STORE_DIR,
+        embedding_model_id(),
+        settings.EMBEDDING_DIM
+    )
+    older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+    result = store.compact(older_than_seconds=older_than)
+
+    print("=" * 60)
+    print(f" Store: {store.dir} ({store.model_name})")
+    print(f" Entries kept: {result['entries']}  Expired: {result['expired']}")
+    print(f" Vectors file: {result['bytes_before'] / 1e6:.1f} MB → {result['bytes_after'] / 1e6:.1f} MB")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
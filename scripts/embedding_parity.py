@@ -0,0 +1,120 @@
+"""
+Embedding Parity Check
+
+So sánh embedding của backend đang cấu hình (vd: ONNX int8) với
+SentenceTransformer fp32 trên chunks của corpus thật (DATA_DIR).
+
+Báo cáo:
+    - Cosine agreement (mean / min / p5) giữa 2 backend
+    - Top-k overlap khi dùng chunk làm query
+    - Latency embed 1 query và RSS tăng thêm (MB) của mỗi backend
+
+Usage:
+    python scripts/embedding_parity.py --backend onnx
+    python scripts/embedding_parity.py --backend onnx --limit 500 --queries 50
+"""
+
+import gc
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.ingest import load_documents, chunk_documents
+from app.embeddings import load_embedding_model
+
+
+def rss_mb() -> float:
+    """RSS hiện tại của process (MB, Linux)"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def embed_all(model, texts, batch_size: int) -> np.ndarray:
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def query_latency_ms(model, queries) -> float:
+    """Latency trung bình (ms) khi embed từng query một"""
+    model.encode(queries[0])  # warmup
+    start = time.perf_counter()
+    for q in queries:
+        model.encode(q)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding parity check vs fp32")
+    parser.add_argument("--backend", default="onnx", help="Backend cần kiểm tra")
+    parser.add_argument("--limit", type=int, default=0, help="Số chunks tối đa (0 = tất cả)")
+    parser.add_argument("--queries", type=int, default=20, help="Số query để đo latency")
+    parser.add_argument("--top-k", type=int, default=settings.TOP_K)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    chunks = chunk_documents(load_documents(settings.DATA_DIR))
+    texts = [c.page_content for c in chunks]
+    if args.limit:
+        texts = texts[:args.limit]
+    queries = texts[:args.queries]
+    print(f"\n Chunks: {len(texts)}")
+
+    results = {}
+    for backend in ("sentence_transformers", args.backend):
+        print(f"\n Backend: {backend}")
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        model = load_embedding_model(backend)
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = embed_all(model, texts, args.batch_size)
+        corpus_s = time.perf_counter() - start
+
+        results[backend] = {
+            "vectors": vectors,
+            "load_s": load_s,
+            "corpus_s": corpus_s,
+            "query_ms": query_latency_ms(model, queries),
+            "rss_mb": rss_mb() - rss_before
+        }
+        del model
+        gc.collect()
+
+    ref = results["sentence_transformers"]["vectors"]
+    test = results[args.backend]["vectors"]
+
+    # Cosine giữa vector fp32 và vector backend mới cho cùng 1 chunk
+    cosine = np.sum(ref * test, axis=1)
+
+    # Top-k overlap: dùng mỗi query chunk để search trong corpus của chính backend đó
+    k = min(args.top_k, len(texts))
+    overlaps = []
+    for i in range(len(queries)):
+        ref_top = set(np.argsort(-(ref @ ref[i]))[:k])
+        test_top = set(np.argsort(-(test @ test[i]))[:k])
+        overlaps.append(len(ref_top & test_top) / k)
+
+    print("\n" + "=" * 60)
+    print(" EMBEDDING PARITY REPORT")
+    print("=" * 60)
+    print(f" Cosine vs fp32: mean={cosine.mean():.4f} min={cosine.min():.4f} "
+          f"p5={np.percentile(cosine, 5):.4f}")
+    print(f" Top-{k} overlap: {np.mean(overlaps):.2%}")
+    print()
+    print(f" {'backend':<24}{'load (s)':>10}{'corpus (s)':>12}{'query (ms)':>12}{'RSS (MB)':>10}")
+    for backend, r in results.items():
+        print(f" {backend:<24}{r['load_s']:>10.1f}{r['corpus_s']:>12.1f}"
+              f"{r['query_ms']:>12.1f}{r['rss_mb']:>10.0f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Incremental index update
+
+So sánh hash các file trong DATA_DIR với manifest (INGEST_MANIFEST_PATH),
+chỉ extract / chunk / embed / upsert file mới hoặc đã sửa và xóa points
+của file đã bị xóa. Chưa có manifest → full rebuild.
+
+Usage:
+    python scripts/update_index.py
+    python run.py --mode update
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ingest import update_index
+
+
+def main():
+    start = time.perf_counter()
+    summary = update_index()
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 60)
+    if summary.get("full_rebuild"):
+        print(f" FULL REBUILD ({summary['reason']}) in {elapsed:.1f}s")
+    else:
+        print(f" INDEX UPDATED in {elapsed:.1f}s")
+        print(f" Added: {len(summary['added'])}  Changed: {len(summary['changed'])}  "
+              f"Removed: {len(summary['removed'])}  Unchanged: {summary['unchanged']}")
+        print(f" Points upserted: {summary['points_upserted']}")
+    store = summary.get("embedding_store")
+    if store:
+        print(f" Embedding store: {store['hits']} hits, {store['misses']} misses")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
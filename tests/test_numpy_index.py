@@ -0,0 +1,87 @@
+"""
+Tests cho NumPy exact-search index (replace_source_rows khi upload / xóa 1 file)
+
+Run:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.numpy_index import NumpyIndex, write_numpy_index, replace_source_rows
+
+
+DIM = 4
+
+
+class ReplaceSourceRowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="test_numpy_index_")
+        self.index_dir = os.path.join(self.tmp, "index")
+        rng = np.random.default_rng(0)
+        sources = ["a.pdf", "b.pdf", "b.pdf", "c.pdf"]
+        write_numpy_index(
+            self.index_dir,
+            rng.normal(size=(len(sources), DIM)),
+            [{"source": source, "chunk_id": i} for i, source in enumerate(sources)],
+            dim=DIM
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def sources(self) -> list:
+        index = NumpyIndex(self.index_dir)
+        try:
+            return [index.payload(row)["source"] for row in range(len(index))]
+        finally:
+            index.close()
+
+    def test_remove_middle_source(self):
+        self.assertEqual(replace_source_rows(self.index_dir, "b.pdf", [], []), 2)
+        self.assertEqual(self.sources(), ["a.pdf", "c.pdf"])
+
+    def test_replace_source(self):
+        count = replace_source_rows(
+            self.index_dir, "a.pdf", [[1.0, 0.0, 0.0, 0.0]], [{"source": "a.pdf", "chunk_id": 9}]
+        )
+        self.assertEqual(count, 4)
+        self.assertEqual(self.sources(), ["b.pdf", "b.pdf", "c.pdf", "a.pdf"])
+
+        index = NumpyIndex(self.index_dir)
+        try:
+            row, score = index.search([1.0, 0.0, 0.0, 0.0], k=1)[0]
+            self.assertEqual(index.payload(row)["chunk_id"], 9)
+            self.assertAlmostEqual(score, 1.0, places=2)
+        finally:
+            index.close()
+
+    def test_remove_last_source_then_add(self):
+        replace_source_rows(self.index_dir, "b.pdf", [], [])
+        replace_source_rows(self.index_dir, "a.pdf", [], [])
+        self.assertEqual(replace_source_rows(self.index_dir, "c.pdf", [], []), 0)
+
+        index = NumpyIndex(self.index_dir)
+        try:
+            self.assertEqual(len(index), 0)
+            self.assertEqual(index.vectors.shape, (0, DIM))
+            self.assertEqual(index.search([1.0, 0.0, 0.0, 0.0], k=3), [])
+            self.assertIsNone(index.find("source", "a.pdf"))
+        finally:
+            index.close()
+
+        # Index rỗng vẫn nhận được file mới
+        replace_source_rows(self.index_dir, "d.pdf", [[0.0, 1.0, 0.0, 0.0]], [{"source": "d.pdf"}])
+        self.assertEqual(self.sources(), ["d.pdf"])
+
+
+if __name__ == "__main__":
+    unittest.main()